@@ -8,13 +8,18 @@ from datetime import timedelta, timezone as tzdt
 from django.core.mail import get_connection
 from django.template.loader import render_to_string
 from django.utils import timezone
-from django.db.models import Count, Q
 from django.core.management.base import BaseCommand
+from django.db.models import Q
 
-from apimonitor.models import APIMonitor, APIMonitorResult, AlertsConfiguration
+from alerts.sliding_window import MINUTE, SlidingWindowCounter
+from apimonitor.models import APIMonitor, APIMonitorResultNotification, APIMonitorResultRollup, AlertsConfiguration, floor_time, get_rollup_summary, get_rollup_summaries
 from login.models import TeamMember
 
 from discord_webhook import DiscordWebhook, DiscordEmbed
+
+# Number of result notifications read and deleted at once
+NOTIFICATION_BATCH_SIZE = 500
+
 # Mock this function to interrupt the cron function
 def mock_cron_interrupt():
     pass
@@ -28,39 +33,168 @@ class Command(BaseCommand):
     
     stop_signal = threading.Event()
 
+    # Sliding window counter of monitors notified since last full check, key is monitor id
+    counters = {}
+
+    time_window_in_seconds = {
+        '1H': 3600,
+        '2H': 7200,
+        '3H': 10800,
+        '6H': 21600,
+        '12H': 43200,
+        '24H': 86400,
+    }
+
+    # Success rate of summary in percent, monitor without result is considered healthy
+    def compute_success_rate(self, summary):
+        success_rate = 100
+        if summary['success'] + summary['failed'] != 0:
+            success_rate = summary['success'] / (summary['success'] + summary['failed']) * 100
+        return round(float(success_rate), 2)
+
     def get_success_rate(self, monitor):
-        time_window_in_seconds = {
-            '1H': 3600,
-            '2H': 7200,
-            '3H': 10800,
-            '6H': 21600,
-            '12H': 43200,
-            '24H': 86400,
-        }
-        
         alerts_config, _ = AlertsConfiguration.objects.get_or_create(team=monitor.team)
         end_time = timezone.now()
-        start_time = end_time - timedelta(seconds=time_window_in_seconds[alerts_config.time_window])
+        start_time = end_time - timedelta(seconds=self.time_window_in_seconds[alerts_config.time_window])
 
         # Average success rate
-        success_count = APIMonitorResult.objects \
-            .filter(monitor=monitor, execution_time__gte=start_time) \
-            .aggregate(
-            s=Count('success', filter=Q(success=True)),
-            f=Count('success', filter=Q(success=False)),
-            total=Count('pk'),
-        )
+        summary = get_rollup_summary(monitor.rollups, start_time, end_time)
 
-        success_rate = 100
-        if success_count['total'] != 0:
-            success_rate = success_count['s'] / (success_count['total']) * 100
-
-        formatted_success_rate = round(float(success_rate), 2)
+        formatted_success_rate = self.compute_success_rate(summary)
         formatted_start_time = start_time.astimezone(tzdt(timedelta(hours=+alerts_config.utc))).strftime("%d %b %Y, %H:%M:%S %Z")
         formatted_end_time = end_time.astimezone(tzdt(timedelta(hours=+alerts_config.utc))).strftime("%d %b %Y, %H:%M:%S %Z")
 
         return formatted_success_rate , formatted_start_time, formatted_end_time
     
+    # Load alerts config of every team at once, team without config get the default config
+    def load_alerts_configs(self, team_ids):
+        alerts_configs = {config.team_id: config for config in AlertsConfiguration.objects.filter(team_id__in=team_ids)}
+        missing_team_ids = [team_id for team_id in team_ids if team_id not in alerts_configs]
+        if len(missing_team_ids) > 0:
+            AlertsConfiguration.objects.bulk_create(
+                [AlertsConfiguration(team_id=team_id) for team_id in missing_team_ids],
+                ignore_conflicts=True,
+            )
+            for config in AlertsConfiguration.objects.filter(team_id__in=missing_team_ids):
+                alerts_configs[config.team_id] = config
+        return alerts_configs
+
+    # Return {monitor id: success rate} of monitors, given as [(monitor id, team id)]. Rollups of every
+    # team sharing the same time window are summarized by one grouped query.
+    def get_success_rates(self, monitors, alerts_configs, end_time):
+        team_ids_by_window = {}
+        for _, team_id in monitors:
+            time_window = alerts_configs[team_id].time_window
+            team_ids_by_window.setdefault(time_window, set()).add(team_id)
+
+        summaries = {}
+        for time_window, team_ids in team_ids_by_window.items():
+            start_time = end_time - timedelta(seconds=self.time_window_in_seconds[time_window])
+            rollups = APIMonitorResultRollup.objects.filter(monitor__team_id__in=team_ids)
+            summaries.update(get_rollup_summaries(rollups, start_time, end_time))
+
+        empty_summary = {'success': 0, 'failed': 0, 'avg': None}
+        return {
+            monitor_id: self.compute_success_rate(summaries.get(monitor_id, empty_summary))
+            for monitor_id, _ in monitors
+        }
+
+    # Queue alert of every monitor below its team threshold, monitor notified in the last 5 minutes is skipped
+    def check_monitors(self):
+        now = timezone.now()
+        monitors = list(
+            APIMonitor.objects.filter(Q(last_notified=None) | Q(last_notified__lte=now - timedelta(minutes=5)))
+            .values_list('id', 'team_id')
+        )
+        if len(monitors) == 0:
+            return []
+
+        alerts_configs = self.load_alerts_configs({team_id for _, team_id in monitors})
+        success_rates = self.get_success_rates(monitors, alerts_configs, now)
+
+        return self.notify_monitors(monitors, alerts_configs, success_rates)
+
+    # Queue alert of monitors, given as [(monitor id, team id)], with success rate below team threshold
+    def notify_monitors(self, monitors, alerts_configs, success_rates):
+        alerted_monitor_ids = [
+            monitor_id for monitor_id, team_id in monitors
+            if success_rates[monitor_id] < alerts_configs[team_id].threshold_pct
+        ]
+        if len(alerted_monitor_ids) > 0:
+            APIMonitor.objects.filter(id__in=alerted_monitor_ids).update(last_notified=timezone.now())
+            for monitor_id in alerted_monitor_ids:
+                self.put_monitor_id_into_queue(monitor_id)
+        return alerted_monitor_ids
+
+    # Return {monitor id: [(bucket, success count, failure count)]} of results written since last read,
+    # read notifications are deleted so every result is only counted once
+    def read_result_notifications(self):
+        notified_counts = {}
+        while True:
+            notifications = list(
+                APIMonitorResultNotification.objects.order_by('id')
+                .values_list('id', 'monitor_id', 'bucket', 'success_count', 'failure_count')[:NOTIFICATION_BATCH_SIZE]
+            )
+            if len(notifications) == 0:
+                return notified_counts
+
+            APIMonitorResultNotification.objects.filter(id__in=[notification[0] for notification in notifications]).delete()
+            for _, monitor_id, bucket, success_count, failure_count in notifications:
+                notified_counts.setdefault(monitor_id, []).append((bucket, success_count, failure_count))
+            if len(notifications) < NOTIFICATION_BATCH_SIZE:
+                return notified_counts
+
+    # Fill new counters from minute rollups inside their window, rollups already include notified results
+    def load_counters(self, monitor_ids, end_time):
+        if len(monitor_ids) == 0:
+            return
+        longest_window = max(self.counters[monitor_id].window for monitor_id in monitor_ids)
+        rollups = APIMonitorResultRollup.objects.filter(
+            monitor_id__in=monitor_ids,
+            period='MINUTE',
+            bucket__gt=floor_time(end_time - longest_window, MINUTE),
+        ).values_list('monitor_id', 'bucket', 'success_count', 'failure_count')
+        for monitor_id, bucket, success_count, failure_count in rollups:
+            self.counters[monitor_id].add(bucket, success_count, failure_count)
+
+    # Evaluate only monitors with new results using their sliding window counters
+    def check_notified_monitors(self, notified_counts):
+        if len(notified_counts) == 0:
+            return []
+
+        now = timezone.now()
+        monitors = list(APIMonitor.objects.filter(id__in=notified_counts.keys()).values_list('id', 'team_id', 'last_notified'))
+        alerts_configs = self.load_alerts_configs({team_id for _, team_id, _ in monitors})
+
+        new_monitor_ids = []
+        for monitor_id, team_id, _ in monitors:
+            window = timedelta(seconds=self.time_window_in_seconds[alerts_configs[team_id].time_window])
+            counter = self.counters.get(monitor_id)
+            if counter == None or counter.window != window:
+                self.counters[monitor_id] = SlidingWindowCounter(window)
+                new_monitor_ids.append(monitor_id)
+                continue
+            for bucket, success_count, failure_count in notified_counts[monitor_id]:
+                counter.add(bucket, success_count, failure_count)
+        self.load_counters(new_monitor_ids, now)
+
+        due_monitors = [
+            (monitor_id, team_id) for monitor_id, team_id, last_notified in monitors
+            if last_notified == None or last_notified <= now - timedelta(minutes=5)
+        ]
+        success_rates = {
+            monitor_id: self.compute_success_rate(self.counters[monitor_id].get_summary(now))
+            for monitor_id, _ in due_monitors
+        }
+        return self.notify_monitors(due_monitors, alerts_configs, success_rates)
+
+    # Full check evaluate every monitor from rollups, so monitor staying below threshold is alerted
+    # again without new results. Counters are loaded again afterwards to drop any drift.
+    def check_all_monitors(self):
+        self.read_result_notifications()
+        self.counters = {}
+        return self.check_monitors()
+
     def get_monitor_id_from_queue(self, type):
         while True:
             try:
@@ -217,7 +351,9 @@ class Command(BaseCommand):
         except ValueError:
             pass
         
-        cron_interval = int(os.environ.get('CRON_INTERVAL_IN_SECONDS', 60))
+        poll_interval = float(os.environ.get('CRON_ALERTS_POLL_INTERVAL_IN_SECONDS', 1))
+        full_check_interval = int(os.environ.get('CRON_ALERTS_FULL_CHECK_INTERVAL_IN_SECONDS', 300))
+        self.counters = {}
         
         for channel in self.channels:
             self.queue[channel] = queue.Queue()
@@ -227,26 +363,19 @@ class Command(BaseCommand):
                 thread_pool.append(consumer)
         
         try:
-            # Cron loop function
+            # Cron loop function, monitors with new results are evaluated on every poll
+            last_full_check = None
             while True:
                 last_run = timezone.now()
-                api_monitors = APIMonitor.objects.all()
-                
-                for monitor in api_monitors:
-                    if monitor.last_notified != None and monitor.last_notified > timezone.now() - timedelta(minutes=5):
-                        continue
-
-                    alerts_config, _ = AlertsConfiguration.objects.get_or_create(team=monitor.team)
-                    success_rate,_,_ = self.get_success_rate(monitor)
-
-                    if success_rate < alerts_config.threshold_pct:
-                        self.put_monitor_id_into_queue(monitor.id)
-                        monitor.last_notified = timezone.now()
-                        monitor.save()
+                if last_full_check == None or last_run >= last_full_check + timedelta(seconds=full_check_interval):
+                    self.check_all_monitors()
+                    last_full_check = last_run
+                else:
+                    self.check_notified_monitors(self.read_result_notifications())
                     
                 # Add delay before next check
                 mock_cron_interrupt()
-                next_run = last_run + timedelta(seconds=cron_interval) 
+                next_run = last_run + timedelta(seconds=poll_interval) 
                 sleep_duration = (next_run - timezone.now()).total_seconds()
                 time.sleep(max(sleep_duration, 0))  
         except BaseException as e:
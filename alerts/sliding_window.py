@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from apimonitor.models import floor_time
+
+MINUTE = timedelta(minutes=1)
+
+
+# Success and failure counts of a monitor per minute bucket inside alerts time window. Window ending
+# at end time count the same buckets as rollup summary, after minute of start time until minute of end time.
+class SlidingWindowCounter:
+    def __init__(self, window):
+        self.window = window
+        self.buckets = {}
+        self.success_count = 0
+        self.failure_count = 0
+
+    def add(self, bucket, success_count, failure_count):
+        count = self.buckets.setdefault(bucket, [0, 0])
+        count[0] += success_count
+        count[1] += failure_count
+        self.success_count += success_count
+        self.failure_count += failure_count
+
+    # Drop buckets which already left the window ending at end time
+    def evict(self, end_time):
+        first_bucket = floor_time(end_time - self.window, MINUTE) + MINUTE
+        for bucket in [bucket for bucket in self.buckets if bucket < first_bucket]:
+            success_count, failure_count = self.buckets.pop(bucket)
+            self.success_count -= success_count
+            self.failure_count -= failure_count
+
+    def get_summary(self, end_time):
+        self.evict(end_time)
+        success_count = self.success_count
+        failure_count = self.failure_count
+
+        # Results written ahead of end time are kept for later window
+        last_bucket = floor_time(end_time, MINUTE)
+        for bucket, count in self.buckets.items():
+            if bucket > last_bucket:
+                success_count -= count[0]
+                failure_count -= count[1]
+        return {'success': success_count, 'failed': failure_count}
@@ -6,16 +6,19 @@ from django.contrib.auth.models import User
 from django.core.management import call_command
 from django.utils import timezone
 from unittest.mock import patch
-from django.test import TransactionTestCase
+from django.test import TestCase, TransactionTestCase
 from io import StringIO
 
 from rest_framework import status
 from rest_framework.test import APITestCase
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
 import os
+import queue
 
-from apimonitor.models import APIMonitor, APIMonitorResult, AlertsConfiguration
+from apimonitor.models import APIMonitor, APIMonitorResult, APIMonitorResultNotification, AlertsConfiguration
+from alerts.management.commands.run_cron_alerts import Command as CronAlertsCommand
+from alerts.sliding_window import SlidingWindowCounter
 from login.models import Team, TeamMember, MonAPIToken
 
 
@@ -770,4 +773,201 @@ class CronAlertsManagementCommand(TransactionTestCase):
         args = mock_request.call_args.args
         self.assertEqual(args[0], 'https://slack.com/api/chat.postMessage')
         
-    
\ No newline at end of file
+    
+
+
+
+class CronAlertsSuccessRate(TransactionTestCase):
+    local_timezone = pytz.timezone(settings.TIME_ZONE)
+    mock_current_time = local_timezone.localize(datetime(2022,9,20,10))
+
+    def setUp(self):
+        timezone.now = lambda: self.mock_current_time
+        timezone.localtime = lambda: self.mock_current_time
+
+        self.command = CronAlertsCommand()
+        self.command.queue = {channel: queue.Queue() for channel in self.command.channels}
+        self.command.counters = {}
+
+    # Results are given as [(success, hours before current time)]
+    def create_monitor(self, team, results):
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='60MIN',
+            body_type='EMPTY',
+        )
+        for success, hours_ago in results:
+            APIMonitorResult.objects.create(
+                monitor=monitor,
+                execution_time=self.mock_current_time - timedelta(hours=hours_ago),
+                response_time=10,
+                success=success,
+                status_code=200 if success else 500,
+                log_response='resp',
+                log_error='',
+            )
+        return monitor
+
+    def get_queued_monitor_ids(self, channel):
+        monitor_ids = []
+        while not self.command.queue[channel].empty():
+            monitor_ids.append(self.command.queue[channel].get())
+        return monitor_ids
+
+    def test_success_rates_use_time_window_of_each_team(self):
+        team_short = Team.objects.create(name='short team')
+        AlertsConfiguration.objects.create(team=team_short, time_window='1H')
+        team_long = Team.objects.create(name='long team')
+        AlertsConfiguration.objects.create(team=team_long, time_window='24H')
+
+        # Failure 3 hours ago is only inside 24 hours window
+        short_monitor = self.create_monitor(team_short, [(True, 0), (False, 3)])
+        long_monitor = self.create_monitor(team_long, [(True, 0), (False, 3)])
+        empty_monitor = self.create_monitor(team_long, [])
+
+        monitors = list(APIMonitor.objects.values_list('id', 'team_id'))
+        alerts_configs = self.command.load_alerts_configs({team_short.id, team_long.id})
+        success_rates = self.command.get_success_rates(monitors, alerts_configs, self.mock_current_time)
+
+        self.assertEqual(success_rates, {short_monitor.id: 100, long_monitor.id: 50, empty_monitor.id: 100})
+        for monitor in [short_monitor, long_monitor, empty_monitor]:
+            self.assertEqual(success_rates[monitor.id], self.command.get_success_rate(monitor)[0])
+
+    def test_load_alerts_configs_create_default_config_of_missing_team(self):
+        team = Team.objects.create(name='test team')
+        configured_team = Team.objects.create(name='configured team')
+        AlertsConfiguration.objects.create(team=configured_team, threshold_pct=80)
+
+        alerts_configs = self.command.load_alerts_configs({team.id, configured_team.id})
+
+        self.assertEqual(alerts_configs[configured_team.id].threshold_pct, 80)
+        self.assertEqual(alerts_configs[team.id].id, AlertsConfiguration.objects.get(team=team).id)
+
+    def test_check_monitors_queue_monitor_below_threshold(self):
+        team = Team.objects.create(name='test team')
+        AlertsConfiguration.objects.create(team=team, threshold_pct=60)
+        failed_monitor = self.create_monitor(team, [(True, 0), (False, 0), (False, 0)])
+        success_monitor = self.create_monitor(team, [(True, 0), (True, 0), (False, 0)])
+        notified_monitor = self.create_monitor(team, [(False, 0)])
+        notified_monitor.last_notified = self.mock_current_time - timedelta(minutes=1)
+        notified_monitor.save()
+
+        self.assertEqual(self.command.check_monitors(), [failed_monitor.id])
+
+        for channel in self.command.channels:
+            self.assertEqual(self.get_queued_monitor_ids(channel), [failed_monitor.id])
+        failed_monitor.refresh_from_db()
+        success_monitor.refresh_from_db()
+        self.assertEqual(failed_monitor.last_notified, self.mock_current_time)
+        self.assertEqual(success_monitor.last_notified, None)
+
+    def test_check_monitors_query_count_not_depend_on_monitor_count(self):
+        team_short = Team.objects.create(name='short team')
+        AlertsConfiguration.objects.create(team=team_short, time_window='1H')
+        team_long = Team.objects.create(name='long team')
+        AlertsConfiguration.objects.create(team=team_long, time_window='24H')
+        self.create_monitor(team_short, [(False, 0)])
+        self.create_monitor(team_long, [(False, 0)])
+
+        # Monitors, alerts configs, one rollup query per time window and last notified update
+        with self.assertNumQueries(5):
+            self.command.check_monitors()
+
+        APIMonitor.objects.update(last_notified=None)
+        for _ in range(10):
+            self.create_monitor(team_short, [(False, 0)])
+            self.create_monitor(team_long, [(True, 0)])
+        with self.assertNumQueries(5):
+            self.command.check_monitors()
+
+    def test_read_result_notifications_group_by_monitor_and_delete_them(self):
+        team = Team.objects.create(name='test team')
+        monitor = self.create_monitor(team, [(True, 0), (False, 0)])
+        other_monitor = self.create_monitor(team, [(False, 1)])
+
+        notified_counts = self.command.read_result_notifications()
+
+        self.assertEqual(sorted(notified_counts[monitor.id]), [
+            (self.mock_current_time, 0, 1),
+            (self.mock_current_time, 1, 0),
+        ])
+        self.assertEqual(notified_counts[other_monitor.id], [(self.mock_current_time - timedelta(hours=1), 0, 1)])
+        self.assertEqual(APIMonitorResultNotification.objects.count(), 0)
+        self.assertEqual(self.command.read_result_notifications(), {})
+
+    def test_check_notified_monitors_only_evaluate_notified_monitor(self):
+        team = Team.objects.create(name='test team')
+        AlertsConfiguration.objects.create(team=team, threshold_pct=60, time_window='1H')
+        failed_monitor = self.create_monitor(team, [(False, 0)])
+        self.command.read_result_notifications()
+
+        monitor = self.create_monitor(team, [(True, 0), (True, 2)])
+        self.assertEqual(self.command.check_notified_monitors(self.command.read_result_notifications()), [])
+        self.assertEqual(list(self.command.counters.keys()), [monitor.id])
+        self.assertEqual(self.get_queued_monitor_ids('slack'), [])
+        failed_monitor.refresh_from_db()
+        self.assertEqual(failed_monitor.last_notified, None)
+
+        # New results are added to the counter without reading rollups again
+        for _ in range(3):
+            APIMonitorResult.objects.create(
+                monitor=monitor,
+                execution_time=self.mock_current_time,
+                response_time=10,
+                success=False,
+                status_code=500,
+                log_response='resp',
+                log_error='',
+            )
+        notified_counts = self.command.read_result_notifications()
+        # Monitors, alerts configs and last notified update
+        with self.assertNumQueries(3):
+            self.assertEqual(self.command.check_notified_monitors(notified_counts), [monitor.id])
+        self.assertEqual(self.command.counters[monitor.id].get_summary(self.mock_current_time), {'success': 1, 'failed': 3})
+        self.assertEqual(self.command.get_success_rate(monitor)[0], 25)
+        self.assertEqual(self.get_queued_monitor_ids('slack'), [monitor.id])
+
+    def test_check_notified_monitors_reload_counter_when_time_window_changed(self):
+        team = Team.objects.create(name='test team')
+        config = AlertsConfiguration.objects.create(team=team, threshold_pct=60, time_window='1H')
+        monitor = self.create_monitor(team, [(True, 0), (False, 2), (False, 3)])
+        self.command.check_notified_monitors(self.command.read_result_notifications())
+        self.assertEqual(self.command.counters[monitor.id].get_summary(self.mock_current_time), {'success': 1, 'failed': 0})
+
+        config.time_window = '6H'
+        config.save()
+        self.assertEqual(self.command.check_notified_monitors({monitor.id: []}), [monitor.id])
+        self.assertEqual(self.command.counters[monitor.id].get_summary(self.mock_current_time), {'success': 1, 'failed': 2})
+
+    def test_check_all_monitors_drop_counters_and_pending_notifications(self):
+        team = Team.objects.create(name='test team')
+        monitor = self.create_monitor(team, [(False, 0)])
+        self.command.counters = {monitor.id: SlidingWindowCounter(timedelta(hours=1))}
+
+        self.assertEqual(self.command.check_all_monitors(), [monitor.id])
+        self.assertEqual(self.command.counters, {})
+        self.assertEqual(APIMonitorResultNotification.objects.count(), 0)
+
+
+class SlidingWindowCounterTest(TestCase):
+    local_timezone = pytz.timezone(settings.TIME_ZONE)
+    current_time = local_timezone.localize(datetime(2022,9,20,10,30,15))
+
+    def test_buckets_outside_window_are_not_counted(self):
+        counter = SlidingWindowCounter(timedelta(hours=1))
+        minute_time = self.current_time.replace(second=0)
+        counter.add(minute_time - timedelta(hours=1), 5, 5) # minute of start time
+        counter.add(minute_time - timedelta(minutes=59), 1, 0)
+        counter.add(minute_time, 2, 1)
+        counter.add(minute_time + timedelta(minutes=1), 0, 4) # written ahead of current time
+
+        self.assertEqual(counter.get_summary(self.current_time), {'success': 3, 'failed': 1})
+        self.assertEqual(len(counter.buckets), 3)
+
+        # Window slide forward without new results
+        self.assertEqual(counter.get_summary(self.current_time + timedelta(minutes=1)), {'success': 2, 'failed': 5})
+        self.assertEqual(counter.get_summary(self.current_time + timedelta(hours=2)), {'success': 0, 'failed': 0})
+        self.assertEqual(counter.buckets, {})
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from apimonitor.models import APIMonitor, APIMonitorBodyForm, APIMonitorRawBody, APIMonitorHeader, APIMonitorQueryParam, APIMonitorResult, AssertionExcludeKey, AlertsConfiguration
+from apimonitor.models import APIMonitor, APIMonitorBodyForm, APIMonitorRawBody, APIMonitorHeader, APIMonitorQueryParam, APIMonitorResult, APIMonitorResponseBlob, APIMonitorResultRollup, APIMonitorResultNotification, AssertionExcludeKey, AlertsConfiguration
 
 
 admin.site.register(APIMonitor)
@@ -9,5 +9,8 @@ admin.site.register(APIMonitorRawBody)
 admin.site.register(APIMonitorHeader)
 admin.site.register(APIMonitorQueryParam)
 admin.site.register(APIMonitorResult)
+admin.site.register(APIMonitorResponseBlob)
+admin.site.register(APIMonitorResultRollup)
+admin.site.register(APIMonitorResultNotification)
 admin.site.register(AssertionExcludeKey)
 admin.site.register(AlertsConfiguration)
@@ -0,0 +1,65 @@
+from datetime import timezone as tzdt
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+
+from apimonitor.models import APIMonitor, APIMonitorResult, APIMonitorResultRollup, ROLLUP_PERIODS, floor_time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild result rollups of API monitors from existing results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def get_rollups(self, monitor_id):
+        minute_rollups = APIMonitorResult.objects \
+            .filter(monitor_id=monitor_id) \
+            .annotate(bucket=TruncMinute('execution_time', tzinfo=tzdt.utc)) \
+            .values('bucket') \
+            .annotate(
+                success_count=Count('pk', filter=Q(success=True)),
+                failure_count=Count('pk', filter=Q(success=False)),
+                response_time_sum=Sum('response_time'),
+                response_time_min=Min('response_time'),
+                response_time_max=Max('response_time'),
+            ) \
+            .order_by('bucket')
+
+        # Hour and day rollups are derived from minute rollups
+        rollups = {}
+        for minute_rollup in minute_rollups:
+            for period, size in ROLLUP_PERIODS:
+                key = (period, floor_time(minute_rollup['bucket'], size))
+                rollup = rollups.get(key)
+                if rollup == None:
+                    rollups[key] = APIMonitorResultRollup(
+                        monitor_id=monitor_id,
+                        period=period,
+                        bucket=key[1],
+                        success_count=minute_rollup['success_count'],
+                        failure_count=minute_rollup['failure_count'],
+                        response_time_sum=minute_rollup['response_time_sum'],
+                        response_time_min=minute_rollup['response_time_min'],
+                        response_time_max=minute_rollup['response_time_max'],
+                    )
+                    continue
+                rollup.success_count += minute_rollup['success_count']
+                rollup.failure_count += minute_rollup['failure_count']
+                rollup.response_time_sum += minute_rollup['response_time_sum']
+                rollup.response_time_min = min(rollup.response_time_min, minute_rollup['response_time_min'])
+                rollup.response_time_max = max(rollup.response_time_max, minute_rollup['response_time_max'])
+        return list(rollups.values())
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+
+        # Rollups of each monitor are replaced in one transaction so dashboard never read half of them
+        for monitor_id in APIMonitor.objects.order_by('id').values_list('id', flat=True):
+            with transaction.atomic():
+                APIMonitorResultRollup.objects.filter(monitor_id=monitor_id).delete()
+                rollups = APIMonitorResultRollup.objects.bulk_create(self.get_rollups(monitor_id), batch_size=batch_size)
+            print(f"[{timezone.now()}] Rebuilt {len(rollups)} rollups of monitor id:{monitor_id}")
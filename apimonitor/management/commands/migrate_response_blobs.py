@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from apimonitor.models import APIMonitorResult, store_response_blobs
+
+
+class Command(BaseCommand):
+    help = 'Move log response of existing API monitor results to deduplicated response blobs'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+    
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        last_id = 0
+        migrated_count = 0
+        
+        # Walk results by id in batches so the table is never locked for long
+        while True:
+            results = list(APIMonitorResult.objects \
+                .filter(id__gt=last_id, response_blob=None) \
+                .exclude(log_response='') \
+                .order_by('id') \
+                .only('id', 'log_response')[:batch_size])
+            if len(results) == 0:
+                break
+            
+            with transaction.atomic():
+                store_response_blobs(results)
+                APIMonitorResult.objects.bulk_update(results, ['log_response', 'response_blob'])
+            
+            last_id = results[-1].id
+            migrated_count += len(results)
+            print(f"[{timezone.now()}] Moved log response of {migrated_count} results to blobs")
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0018_alter_apimonitor_assertion_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apimonitor',
+            name='next_run_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
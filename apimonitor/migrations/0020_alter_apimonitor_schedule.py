@@ -0,0 +1,18 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0019_apimonitor_next_run_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='apimonitor',
+            name='schedule',
+            field=models.CharField(choices=[('10SEC', '10 Second'), ('30SEC', '30 Second'), ('1MIN', '1 Minute'), ('2MIN', '2 Minute'), ('3MIN', '3 Minute'), ('5MIN', '5 Minute'), ('10MIN', '10 Minute'), ('15MIN', '15 Minute'), ('30MIN', '30 Minute'), ('60MIN', '60 Minute')], max_length=64),
+        ),
+    ]
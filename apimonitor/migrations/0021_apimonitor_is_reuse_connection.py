@@ -0,0 +1,18 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0020_alter_apimonitor_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apimonitor',
+            name='is_reuse_connection',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0021_apimonitor_is_reuse_connection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apimonitorresult',
+            name='assertion_time',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='apimonitorresult',
+            name='connect_time',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='apimonitorresult',
+            name='dns_time',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='apimonitorresult',
+            name='download_time',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='apimonitorresult',
+            name='first_byte_time',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='apimonitorresult',
+            name='prepare_time',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0022_apimonitorresult_phase_timing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apimonitor',
+            name='config_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
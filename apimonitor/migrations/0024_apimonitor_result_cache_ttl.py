@@ -0,0 +1,18 @@
+# Generated by Django 4.1.2 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0023_apimonitor_config_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apimonitor',
+            name='result_cache_ttl',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
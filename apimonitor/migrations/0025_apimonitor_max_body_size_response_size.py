@@ -0,0 +1,28 @@
+# Generated by Django 4.1.2 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0024_apimonitor_result_cache_ttl'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apimonitor',
+            name='max_body_size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='apimonitorresult',
+            name='response_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='apimonitorresult',
+            name='response_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
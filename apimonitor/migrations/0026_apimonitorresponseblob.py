@@ -0,0 +1,26 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0025_apimonitor_max_body_size_response_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIMonitorResponseBlob',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('body', models.BinaryField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='apimonitorresult',
+            name='response_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='results', to='apimonitor.apimonitorresponseblob'),
+        ),
+    ]
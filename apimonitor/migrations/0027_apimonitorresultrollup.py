@@ -0,0 +1,32 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0026_apimonitorresponseblob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIMonitorResultRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('MINUTE', 'MINUTE'), ('HOUR', 'HOUR'), ('DAY', 'DAY')], max_length=16)),
+                ('bucket', models.DateTimeField()),
+                ('success_count', models.PositiveIntegerField(default=0)),
+                ('failure_count', models.PositiveIntegerField(default=0)),
+                ('response_time_sum', models.FloatField(default=0)),
+                ('response_time_min', models.FloatField(blank=True, null=True)),
+                ('response_time_max', models.FloatField(blank=True, null=True)),
+                ('monitor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='apimonitor.apimonitor')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='apimonitorresultrollup',
+            constraint=models.UniqueConstraint(fields=('monitor', 'period', 'bucket'), name='rollup_bucket_unique'),
+        ),
+    ]
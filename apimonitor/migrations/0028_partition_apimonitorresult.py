@@ -0,0 +1,24 @@
+from django.db import migrations
+from django.utils import timezone
+
+from apimonitor.partitions import get_result_partition_config, partition_result_table
+
+
+def forwards_func(apps, schema_editor):
+    size, premake = get_result_partition_config()
+    partition_result_table(timezone.now(), size, premake)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0027_apimonitorresultrollup'),
+    ]
+
+    operations = [
+        # Results table on Postgres is partitioned by execution time, Django model and queries stay the same.
+        # Reverse keep partitioned table because it is identical for the ORM.
+        # Existing results are copied inside migration transaction, cron writing results wait until it finished.
+        # Run purge_results before migrating large results table to reduce the copied rows.
+        migrations.RunPython(forwards_func, migrations.RunPython.noop),
+    ]
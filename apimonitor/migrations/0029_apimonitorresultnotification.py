@@ -0,0 +1,24 @@
+# Generated by Django 4.1.2 on 2026-10-18 10:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0028_partition_apimonitorresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIMonitorResultNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('success_count', models.PositiveIntegerField(default=0)),
+                ('failure_count', models.PositiveIntegerField(default=0)),
+                ('monitor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='result_notifications', to='apimonitor.apimonitor')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.2 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0029_apimonitorresultnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apimonitorresult',
+            name='tls_time',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.2 on 2026-10-18 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apimonitor', '0030_apimonitorresult_tls_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apimonitorresult',
+            name='is_response_partial',
+            field=models.BooleanField(default=False),
+        ),
+    ]
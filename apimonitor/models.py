@@ -1,5 +1,11 @@
 from io import open_code
-from django.db import models
+from datetime import datetime, timedelta, timezone
+import hashlib
+import zlib
+import mmh3
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Greatest, Least
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from login.models import Team
@@ -21,6 +27,8 @@ class APIMonitor(models.Model):
     ]
     
     schedule_choices = [
+        ('10SEC', '10 Second'),
+        ('30SEC', '30 Second'),
         ('1MIN', '1 Minute'),
         ('2MIN', '2 Minute'),
         ('3MIN', '3 Minute'),
@@ -31,6 +39,19 @@ class APIMonitor(models.Model):
         ('60MIN', '60 Minute'),
     ]
     
+    schedule_in_seconds = {
+        '10SEC': 10,
+        '30SEC': 30,
+        '1MIN': 60,
+        '2MIN': 120,
+        '3MIN': 180,
+        '5MIN': 300,
+        '10MIN': 600,
+        '15MIN': 900,
+        '30MIN': 1800,
+        '60MIN': 3600,
+    }
+    
     assertion_type_choices = [
         ('DISABLED', 'Disabled'),
         ('TEXT', 'Text'),
@@ -48,8 +69,43 @@ class APIMonitor(models.Model):
     assertion_type = models.CharField(max_length=16, choices=assertion_type_choices, default='DISABLED')
     assertion_value = models.TextField(blank=True)
     is_assert_json_schema_only = models.BooleanField(default=False)
+    is_reuse_connection = models.BooleanField(default=False)
+    # Seconds result is reused when monitor run as previous step of other monitor, 0 means use cron default
+    result_cache_ttl = models.PositiveIntegerField(default=0)
+    # Maximum bytes of response body stored on result, 0 means use cron default
+    max_body_size = models.PositiveIntegerField(default=0)
     last_notified = models.DateTimeField(null=True, blank=True)
     status_page_category = models.ForeignKey(StatusPageCategory, null=True, blank=True, on_delete=models.SET_NULL)
+    next_run_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    config_version = models.PositiveIntegerField(default=0)
+    
+    # Cron cache monitor configuration until its config version changed, monitors using this monitor
+    # as previous step are changed too since their chain include this monitor
+    def bump_config_version(self):
+        monitor_ids = [self.id]
+        new_monitor_ids = [self.id]
+        while len(new_monitor_ids) > 0:
+            new_monitor_ids = list(APIMonitor.objects \
+                .filter(previous_step_id__in=new_monitor_ids) \
+                .exclude(id__in=monitor_ids) \
+                .values_list('id', flat=True))
+            monitor_ids += new_monitor_ids
+        APIMonitor.objects.filter(id__in=monitor_ids).update(config_version=models.F('config_version') + 1)
+    
+    phase_epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    
+    # Each monitor run on stable offset inside its schedule period so monitors with same schedule
+    # are spread over the period instead of running at the same time
+    def get_next_run_at(self, last_run):
+        period = self.schedule_in_seconds[self.schedule] * 1000000
+        offset = (mmh3.hash(str(self.id), signed=False) % self.schedule_in_seconds[self.schedule]) * 1000000
+        position = ((last_run - self.phase_epoch) // timedelta(microseconds=1)) % period
+        
+        # Skip slot closer than half period to keep the gap between runs close to schedule
+        wait = (offset - position) % period
+        if wait < period // 2:
+            wait += period
+        return last_run + timedelta(microseconds=wait)
     
     
 class APIMonitorQueryParam(models.Model):
@@ -75,6 +131,15 @@ class APIMonitorRawBody(models.Model):
     body = models.TextField()
 
 
+# Response body shared by every result with the same content, stored compressed
+class APIMonitorResponseBlob(models.Model):
+    hash = models.CharField(max_length=64, primary_key=True) # SHA-256 of uncompressed body
+    body = models.BinaryField()
+    
+    def get_body(self):
+        return zlib.decompress(self.body).decode('utf-8')
+
+
 class APIMonitorResult(models.Model):
     monitor = models.ForeignKey(APIMonitor, on_delete=models.CASCADE, related_name='results')
     execution_time = models.DateTimeField()
@@ -84,13 +149,258 @@ class APIMonitorResult(models.Model):
     log_response = models.TextField()
     log_error = models.TextField()
     
+    # Phase timing of the monitor request in miliseconds, empty when not measurable.
+    # Reused connection has no dns, connect and tls time.
+    dns_time = models.IntegerField(null=True, blank=True)
+    connect_time = models.IntegerField(null=True, blank=True) # TCP connection
+    tls_time = models.IntegerField(null=True, blank=True) # TLS handshake
+    first_byte_time = models.IntegerField(null=True, blank=True)
+    download_time = models.IntegerField(null=True, blank=True)
+    prepare_time = models.IntegerField(null=True, blank=True) # request preparation
+    assertion_time = models.IntegerField(null=True, blank=True)
+    
+    # Size and SHA-256 of the whole response body, log response might only store beginning of the body.
+    # Body of monitor without assertion is only read until max body size, then size and hash are partial.
+    response_size = models.BigIntegerField(null=True, blank=True)
+    response_hash = models.CharField(max_length=64, null=True, blank=True)
+    is_response_partial = models.BooleanField(default=False)
+    
+    # Log response is empty when body stored on blob
+    response_blob = models.ForeignKey(APIMonitorResponseBlob, null=True, blank=True, on_delete=models.PROTECT, related_name='results')
+    
     class Meta:
         indexes = [
             models.Index(fields=['monitor', 'execution_time'], name='result_time_index'),
             models.Index(fields=['monitor', 'success'], name='result_success_index'),
         ]
         
+    # Rollups of new result are updated in the same transaction
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                add_results_to_rollups([self])
+                add_result_notifications([self])
+        
+    def get_log_response(self):
+        if self.response_blob_id != None:
+            return self.response_blob.get_body()
+        return self.log_response
+    
+    def store_log_response(self):
+        store_response_blobs([self])
+        
         
+# Move log response of results to blobs, blob is only created when no other result has the same body.
+# Must run in the transaction saving the results: existing blobs are locked until the results are
+# committed, so orphan blob purge cannot delete them in between. Blob purged before the lock is created again.
+def store_response_blobs(results):
+    blobs = {}
+    for result in results:
+        if result.log_response == '':
+            continue
+        data = result.log_response.encode('utf-8')
+        blob_hash = hashlib.sha256(data).hexdigest()
+        blobs[blob_hash] = data
+        result.response_blob_id = blob_hash
+        result.log_response = ''
+    
+    if len(blobs) == 0:
+        return
+    existing_hashes = set(APIMonitorResponseBlob.objects \
+        .select_for_update(no_key=True) \
+        .filter(hash__in=blobs.keys()) \
+        .order_by('hash') \
+        .values_list('hash', flat=True))
+    APIMonitorResponseBlob.objects.bulk_create([
+        APIMonitorResponseBlob(hash=blob_hash, body=zlib.compress(data))
+        for blob_hash, data in blobs.items() if blob_hash not in existing_hashes
+    ], ignore_conflicts=True)
+        
+        
+# Summary of results inside one time bucket of a monitor, dashboard and alerts read rollups instead of results
+class APIMonitorResultRollup(models.Model):
+    period_choices = [
+        ('MINUTE', 'MINUTE'),
+        ('HOUR', 'HOUR'),
+        ('DAY', 'DAY'),
+    ]
+    
+    monitor = models.ForeignKey(APIMonitor, on_delete=models.CASCADE, related_name='rollups')
+    period = models.CharField(max_length=16, choices=period_choices)
+    bucket = models.DateTimeField() # start of the bucket in UTC
+    success_count = models.PositiveIntegerField(default=0)
+    failure_count = models.PositiveIntegerField(default=0)
+    response_time_sum = models.FloatField(default=0) # in miliseconds
+    response_time_min = models.FloatField(null=True, blank=True)
+    response_time_max = models.FloatField(null=True, blank=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['monitor', 'period', 'bucket'], name='rollup_bucket_unique'),
+        ]
+
+
+# Minute counts of newly written results of a monitor. Alerts process read and delete notifications
+# to evaluate only monitors with new results instead of polling every monitor.
+class APIMonitorResultNotification(models.Model):
+    monitor = models.ForeignKey(APIMonitor, on_delete=models.CASCADE, related_name='result_notifications')
+    bucket = models.DateTimeField() # start of the minute in UTC
+    success_count = models.PositiveIntegerField(default=0)
+    failure_count = models.PositiveIntegerField(default=0)
+
+
+# Coarser rollups are derived from the same results as minute rollup
+ROLLUP_PERIODS = [
+    ('DAY', timedelta(days=1)),
+    ('HOUR', timedelta(hours=1)),
+    ('MINUTE', timedelta(minutes=1)),
+]
+ROLLUP_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def floor_time(value, size):
+    return value - (value - ROLLUP_EPOCH) % size
+
+
+def add_rollup(monitor_id, period, bucket, success_count, failure_count, response_time_sum, response_time_min, response_time_max):
+    rollup = APIMonitorResultRollup.objects.filter(monitor_id=monitor_id, period=period, bucket=bucket)
+    updates = {
+        'success_count': F('success_count') + success_count,
+        'failure_count': F('failure_count') + failure_count,
+        'response_time_sum': F('response_time_sum') + response_time_sum,
+        'response_time_min': Least('response_time_min', Value(response_time_min)),
+        'response_time_max': Greatest('response_time_max', Value(response_time_max)),
+    }
+    if rollup.update(**updates) > 0:
+        return
+    
+    try:
+        with transaction.atomic():
+            APIMonitorResultRollup.objects.create(
+                monitor_id=monitor_id,
+                period=period,
+                bucket=bucket,
+                success_count=success_count,
+                failure_count=failure_count,
+                response_time_sum=response_time_sum,
+                response_time_min=response_time_min,
+                response_time_max=response_time_max,
+            )
+    except IntegrityError:
+        # Bucket created by other cron process at the same time
+        rollup.update(**updates)
+
+
+# Add results to rollup of every period, results on the same bucket are added at once
+def add_results_to_rollups(results):
+    deltas = {}
+    for result in results:
+        for period, size in ROLLUP_PERIODS:
+            key = (result.monitor_id, period, floor_time(result.execution_time, size))
+            delta = deltas.get(key)
+            if delta == None:
+                delta = [0, 0, 0, result.response_time, result.response_time]
+                deltas[key] = delta
+            if result.success:
+                delta[0] += 1
+            else:
+                delta[1] += 1
+            delta[2] += result.response_time
+            delta[3] = min(delta[3], result.response_time)
+            delta[4] = max(delta[4], result.response_time)
+    
+    for (monitor_id, period, bucket), delta in deltas.items():
+        add_rollup(monitor_id, period, bucket, *delta)
+
+
+# Notify alerts process of new results, written in the same transaction as results
+def add_result_notifications(results):
+    counts = {}
+    for result in results:
+        key = (result.monitor_id, floor_time(result.execution_time, timedelta(minutes=1)))
+        count = counts.setdefault(key, [0, 0])
+        if result.success:
+            count[0] += 1
+        else:
+            count[1] += 1
+    
+    APIMonitorResultNotification.objects.bulk_create([
+        APIMonitorResultNotification(monitor_id=monitor_id, bucket=bucket, success_count=count[0], failure_count=count[1])
+        for (monitor_id, bucket), count in counts.items()
+    ])
+
+
+# Split minute buckets of time range into rollup ranges [(period, first bucket, last bucket)] using the
+# coarsest rollup fully inside the range. Minute bucket of start time belongs to the previous range, so
+# consecutive ranges never count the same result twice and minute of end time is always included.
+def split_rollup_range(start_time, end_time):
+    minute = timedelta(minutes=1)
+    return split_rollup_buckets(floor_time(start_time, minute) + minute, floor_time(end_time, minute))
+
+
+def split_rollup_buckets(first_minute, last_minute):
+    if last_minute < first_minute:
+        return []
+    
+    minute = timedelta(minutes=1)
+    for period, size in ROLLUP_PERIODS[:-1]:
+        first_bucket = first_minute + (ROLLUP_EPOCH - first_minute) % size
+        last_bucket = floor_time(last_minute + minute, size) - size
+        if first_bucket <= last_bucket:
+            return split_rollup_buckets(first_minute, first_bucket - minute) \
+                + [(period, first_bucket, last_bucket)] \
+                + split_rollup_buckets(last_bucket + size, last_minute)
+    return [('MINUTE', first_minute, last_minute)]
+
+
+def get_rollup_range_filter(start_time, end_time):
+    range_filter = Q()
+    for period, first_bucket, last_bucket in split_rollup_range(start_time, end_time):
+        range_filter |= Q(period=period, bucket__gte=first_bucket, bucket__lte=last_bucket)
+    return range_filter
+
+
+def create_rollup_summary(success_count, failure_count, response_time_sum):
+    summary = {'success': 0, 'failed': 0, 'avg': None}
+    if success_count != None:
+        summary['success'] = success_count
+        summary['failed'] = failure_count
+        if success_count + failure_count > 0:
+            summary['avg'] = response_time_sum / (success_count + failure_count)
+    return summary
+
+
+# Count of success and failed results and average response time between start and end time
+def get_rollup_summary(rollups, start_time, end_time):
+    if len(split_rollup_range(start_time, end_time)) == 0:
+        return create_rollup_summary(None, None, None)
+    
+    res = rollups.filter(get_rollup_range_filter(start_time, end_time)).aggregate(
+        success=Sum('success_count'),
+        failed=Sum('failure_count'),
+        response_time_sum=Sum('response_time_sum'),
+    )
+    return create_rollup_summary(res['success'], res['failed'], res['response_time_sum'])
+
+
+# Summary of every monitor of rollups using one grouped query, monitor without rollup is not included
+def get_rollup_summaries(rollups, start_time, end_time):
+    if len(split_rollup_range(start_time, end_time)) == 0:
+        return {}
+    
+    rows = rollups.filter(get_rollup_range_filter(start_time, end_time)) \
+        .values('monitor_id') \
+        .annotate(
+            success=Sum('success_count'),
+            failed=Sum('failure_count'),
+            response_time_sum=Sum('response_time_sum'),
+        ) \
+        .order_by()
+    return {row['monitor_id']: create_rollup_summary(row['success'], row['failed'], row['response_time_sum']) for row in rows}
+
+
 class AssertionExcludeKey(models.Model):
     monitor = models.ForeignKey(APIMonitor, on_delete=models.CASCADE, related_name='exclude_keys')
     exclude_key = models.CharField(max_length=1024)
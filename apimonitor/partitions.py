@@ -0,0 +1,175 @@
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+# Results table is range partitioned by execution time on Postgres, other database (SQLite) keep single table.
+# Result outside every range (cron stopped longer than premake, clock skew) go to default partition.
+RESULT_TABLE = 'apimonitor_apimonitorresult'
+DEFAULT_PARTITION = f"{RESULT_TABLE}_default"
+PARTITION_BOUND_PATTERN = re.compile(r"FROM \('(.+?)'\) TO \('(.+?)'\)")
+PARTITION_EPOCH = datetime(1970, 1, 5, tzinfo=timezone.utc) # monday, so weekly partition start on monday
+
+
+# Return (partition size, number of future partitions created ahead)
+def get_result_partition_config():
+    size = timedelta(days=1)
+    if os.environ.get('CRON_RESULT_PARTITION_INTERVAL', 'DAY') == 'WEEK':
+        size = timedelta(weeks=1)
+    return size, int(os.environ.get('CRON_RESULT_PARTITION_PREMAKE', 7))
+
+
+def floor_partition_time(value, size):
+    return value - (value - PARTITION_EPOCH) % size
+
+
+def get_partition_name(start_time):
+    return f"{RESULT_TABLE}_p{start_time.astimezone(timezone.utc):%Y%m%d}"
+
+
+def is_result_table_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [RESULT_TABLE])
+        return cursor.fetchone() != None
+
+
+# Return [(name, start time, end time)] of result partitions ordered by start time
+def list_result_partitions():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+            [RESULT_TABLE],
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = PARTITION_BOUND_PATTERN.search(bound)
+        if match == None:
+            continue
+        partitions.append((name, parse_datetime(match.group(1)), parse_datetime(match.group(2))))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+# Rows of the range already in default partition must be moved, otherwise partition cannot be created
+def create_range_partition(cursor, name, start_time, end_time):
+    with transaction.atomic():
+        cursor.execute(f'CREATE TEMP TABLE "{name}_moved" (LIKE "{RESULT_TABLE}") ON COMMIT DROP')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE execution_time >= %s AND execution_time < %s RETURNING *) '
+            f'INSERT INTO "{name}_moved" SELECT * FROM moved',
+            [start_time, end_time],
+        )
+        cursor.execute(
+            f'CREATE TABLE "{name}" PARTITION OF "{RESULT_TABLE}" FOR VALUES FROM (%s) TO (%s)',
+            [start_time, end_time],
+        )
+        cursor.execute(f'INSERT INTO "{RESULT_TABLE}" SELECT * FROM "{name}_moved"')
+
+
+def create_default_partition(cursor):
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS "{DEFAULT_PARTITION}" PARTITION OF "{RESULT_TABLE}" DEFAULT')
+
+
+# Create missing partitions covering start time until end time, existing partition is kept even
+# when its size differ from current size. Return names of created partitions.
+def create_result_partitions(start_time, end_time, size):
+    partitions = list_result_partitions()
+    created = []
+    current = floor_partition_time(start_time, size)
+    with connection.cursor() as cursor:
+        while current < end_time:
+            covering = [partition for partition in partitions if partition[1] <= current < partition[2]]
+            if len(covering) > 0:
+                current = covering[0][2]
+                continue
+
+            partition_end = floor_partition_time(current, size) + size
+            for _, partition_start, _ in partitions:
+                if current < partition_start < partition_end:
+                    partition_end = partition_start
+
+            name = get_partition_name(current)
+            create_range_partition(cursor, name, current, partition_end)
+            partitions.append((name, current, partition_end))
+            created.append(name)
+            current = partition_end
+    return created
+
+
+# Future partitions must exist before cron write results into them
+def ensure_result_partitions(now, size, premake):
+    if not is_result_table_partitioned():
+        return []
+    with connection.cursor() as cursor:
+        create_default_partition(cursor)
+    return create_result_partitions(now, now + size * premake, size)
+
+
+# Drop partitions which every result is older than cutoff, return names of dropped partitions
+def drop_result_partitions(cutoff):
+    if not is_result_table_partitioned():
+        return []
+
+    dropped = []
+    with connection.cursor() as cursor:
+        for name, _, end_time in list_result_partitions():
+            if end_time <= cutoff:
+                cursor.execute(f'DROP TABLE "{name}"')
+                dropped.append(name)
+    return dropped
+
+
+# Move existing results table into partitioned table with the same columns, constraints and indexes.
+# Primary key of partitioned table must include partition key, so it become (id, execution_time).
+# Every existing result is copied in one transaction which lock results table until done, on large table
+# purge old results first or expect the migration to take as long as copying the whole table.
+def partition_result_table(now, size, premake):
+    if connection.vendor != 'postgresql' or is_result_table_partitioned():
+        return
+
+    old_table = f"{RESULT_TABLE}_unpartitioned"
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(execution_time), MAX(execution_time), MAX(id) FROM "{RESULT_TABLE}"')
+        first_execution_time, last_execution_time, last_id = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE "{RESULT_TABLE}" RENAME TO "{old_table}"')
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [old_table],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT pg_get_indexdef(x.indexrelid) FROM pg_index x WHERE x.indrelid = %s::regclass AND NOT x.indisprimary",
+            [old_table],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(
+            f'CREATE TABLE "{RESULT_TABLE}" (LIKE "{old_table}" INCLUDING CONSTRAINTS) PARTITION BY RANGE (execution_time)'
+        )
+        cursor.execute(f'ALTER TABLE "{RESULT_TABLE}" ADD PRIMARY KEY (id, execution_time)')
+        cursor.execute(f'CREATE SEQUENCE "{RESULT_TABLE}_partitioned_id_seq" OWNED BY "{RESULT_TABLE}".id')
+        cursor.execute(f"SELECT setval('{RESULT_TABLE}_partitioned_id_seq', %s, false)", [(last_id or 0) + 1])
+        cursor.execute(f'ALTER TABLE "{RESULT_TABLE}" ALTER COLUMN id SET DEFAULT nextval(\'{RESULT_TABLE}_partitioned_id_seq\')')
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{RESULT_TABLE}" ADD CONSTRAINT "{name}" {definition}')
+
+        end_time = now + size * premake
+        if first_execution_time == None:
+            first_execution_time = now
+        elif last_execution_time >= end_time:
+            end_time = last_execution_time + size
+        create_default_partition(cursor)
+        create_result_partitions(first_execution_time, end_time, size)
+        cursor.execute(f'INSERT INTO "{RESULT_TABLE}" SELECT * FROM "{old_table}"')
+        cursor.execute(f'DROP TABLE "{old_table}"')
+
+        # Index names are free again after old table dropped
+        for definition in indexes:
+            cursor.execute(re.sub(rf' ON (\S+\.)?"?{old_table}"? ', f' ON "{RESULT_TABLE}" ', definition))
@@ -71,6 +71,16 @@ class APIMonitorDetailResponseTimeSerializer(serializers.Serializer):
     avg = serializers.IntegerField()
 
 
+class APIMonitorDetailResponseTimeBreakdownSerializer(serializers.Serializer):
+    dns_time = serializers.IntegerField(allow_null=True)
+    connect_time = serializers.IntegerField(allow_null=True)
+    tls_time = serializers.IntegerField(allow_null=True)
+    first_byte_time = serializers.IntegerField(allow_null=True)
+    download_time = serializers.IntegerField(allow_null=True)
+    prepare_time = serializers.IntegerField(allow_null=True)
+    assertion_time = serializers.IntegerField(allow_null=True)
+
+
 class APIMonitorSerializer(serializers.ModelSerializer):
     query_params = APIMonitorQueryParamSerializer(many=True, required=False, allow_null=True)
     headers = APIMonitorHeaderSerializer(many=True, required=False, allow_null=True)
@@ -97,12 +107,17 @@ class APIMonitorSerializer(serializers.ModelSerializer):
             'assertion_type',
             'assertion_value',
             'is_assert_json_schema_only',
+            'is_reuse_connection',
+            'result_cache_ttl',
+            'max_body_size',
             'exclude_keys',
             'status_page_category_id',
         ]
 
 
 class APIMonitorResultSerializer(serializers.ModelSerializer):
+    log_response = serializers.CharField(source='get_log_response', read_only=True)
+    
     class Meta:
         model = APIMonitorResult
         fields = [
@@ -114,6 +129,16 @@ class APIMonitorResultSerializer(serializers.ModelSerializer):
             'status_code',
             'log_response',
             'log_error',
+            'dns_time',
+            'connect_time',
+            'tls_time',
+            'first_byte_time',
+            'download_time',
+            'prepare_time',
+            'assertion_time',
+            'response_size',
+            'response_hash',
+            'is_response_partial',
         ]
 
 
@@ -150,6 +175,7 @@ class APIMonitorDashboardSerializer(serializers.Serializer):
 class APIMonitorRetrieveSerializer(APIMonitorSerializer):
     success_rate = APIMonitorDetailSuccessRateSerializer(many=True)
     response_time = APIMonitorDetailResponseTimeSerializer(many=True)
+    response_time_breakdown = APIMonitorDetailResponseTimeBreakdownSerializer()
     status_page_category = StatusPageCategorySerializers()
 
     class Meta:
@@ -168,9 +194,13 @@ class APIMonitorRetrieveSerializer(APIMonitorSerializer):
             'previous_step_id',
             'success_rate',
             'response_time',
+            'response_time_breakdown',
             'assertion_type',
             'assertion_value',
             'is_assert_json_schema_only',
+            'is_reuse_connection',
+            'result_cache_ttl',
+            'max_body_size',
             'exclude_keys',
             'status_page_category_id',
             'status_page_category',
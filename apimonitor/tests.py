@@ -1,10 +1,13 @@
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
 import pytz
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from django.conf import settings
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.core.management import call_command
 from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
@@ -13,7 +16,11 @@ from django_test_migrations.contrib.unittest_case import MigratorTestCase
 
 
 from apimonitor.models import APIMonitor, APIMonitorBodyForm, APIMonitorHeader, APIMonitorQueryParam, APIMonitorRawBody, \
-    APIMonitorResult, AssertionExcludeKey
+    APIMonitorResult, APIMonitorResponseBlob, APIMonitorResultRollup, AssertionExcludeKey, split_rollup_range, \
+    get_rollup_summary
+from apimonitor.serializers import APIMonitorResultSerializer, APIMonitorSerializer
+from apimonitor.partitions import floor_partition_time, get_partition_name, ensure_result_partitions, drop_result_partitions, \
+    partition_result_table, create_range_partition, list_result_partitions, DEFAULT_PARTITION
 from login.models import Team, TeamMember, MonAPIToken
 from statuspage.models import StatusPageCategory
 
@@ -200,7 +207,8 @@ class DetailListAPIMonitor(APITestCase):
                               "avg": 0},
                              {"start_time": "2022-09-20T09:59:00+07:00", "end_time": "2022-09-20T10:00:00+07:00",
                               "avg": 100}],
-                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'exclude_keys': []
+                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'is_reuse_connection': False, 'result_cache_ttl': 0, 'max_body_size': 0, 'exclude_keys': [],
+                          'response_time_breakdown': {'dns_time': None, 'connect_time': None, 'tls_time': None, 'first_byte_time': None, 'download_time': None, 'prepare_time': None, 'assertion_time': None}
                           })
 
     def test_retrieve_30_min_without_result(self):
@@ -330,7 +338,8 @@ class DetailListAPIMonitor(APITestCase):
                               "avg": 0},
                              {"start_time": "2022-09-20T09:59:00+07:00", "end_time": "2022-09-20T10:00:00+07:00",
                               "avg": 0}],
-                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'exclude_keys': []
+                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'is_reuse_connection': False, 'result_cache_ttl': 0, 'max_body_size': 0, 'exclude_keys': [],
+                          'response_time_breakdown': {'dns_time': None, 'connect_time': None, 'tls_time': None, 'first_byte_time': None, 'download_time': None, 'prepare_time': None, 'assertion_time': None}
                           })
 
     def test_retrieve_1_hour_with_result(self):
@@ -462,7 +471,8 @@ class DetailListAPIMonitor(APITestCase):
                               "avg": 0},
                              {"start_time": "2022-09-20T09:58:00+07:00", "end_time": "2022-09-20T10:00:00+07:00",
                               "avg": 100}],
-                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'exclude_keys': []
+                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'is_reuse_connection': False, 'result_cache_ttl': 0, 'max_body_size': 0, 'exclude_keys': [],
+                          'response_time_breakdown': {'dns_time': None, 'connect_time': None, 'tls_time': None, 'first_byte_time': None, 'download_time': None, 'prepare_time': None, 'assertion_time': None}
                           })
 
     def test_retrieve_1_hour_without_result(self):
@@ -595,7 +605,8 @@ class DetailListAPIMonitor(APITestCase):
                               "avg": 0},
                              {"start_time": "2022-09-20T09:58:00+07:00", "end_time": "2022-09-20T10:00:00+07:00",
                               "avg": 0}],
-                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'exclude_keys': []
+                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'is_reuse_connection': False, 'result_cache_ttl': 0, 'max_body_size': 0, 'exclude_keys': [],
+                          'response_time_breakdown': {'dns_time': None, 'connect_time': None, 'tls_time': None, 'first_byte_time': None, 'download_time': None, 'prepare_time': None, 'assertion_time': None}
                           })
 
     def test_retrieve_3_hours_with_result(self):
@@ -751,7 +762,8 @@ class DetailListAPIMonitor(APITestCase):
                               "avg": 0},
                              {"start_time": "2022-09-20T09:55:00+07:00", "end_time": "2022-09-20T10:00:00+07:00",
                               "avg": 100}],
-                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'exclude_keys': []
+                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'is_reuse_connection': False, 'result_cache_ttl': 0, 'max_body_size': 0, 'exclude_keys': [],
+                          'response_time_breakdown': {'dns_time': None, 'connect_time': None, 'tls_time': None, 'first_byte_time': None, 'download_time': None, 'prepare_time': None, 'assertion_time': None}
                           })
 
     def test_retrieve_3_hours_without_result(self):
@@ -905,7 +917,8 @@ class DetailListAPIMonitor(APITestCase):
                               "avg": 0},
                              {"start_time": "2022-09-20T09:55:00+07:00", "end_time": "2022-09-20T10:00:00+07:00",
                               "avg": 0}],
-                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'exclude_keys': []
+                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'is_reuse_connection': False, 'result_cache_ttl': 0, 'max_body_size': 0, 'exclude_keys': [],
+                          'response_time_breakdown': {'dns_time': None, 'connect_time': None, 'tls_time': None, 'first_byte_time': None, 'download_time': None, 'prepare_time': None, 'assertion_time': None}
                           })
 
     def test_retrieve_6_hours_with_result(self):
@@ -1060,7 +1073,8 @@ class DetailListAPIMonitor(APITestCase):
                               "avg": 0},
                              {"start_time": "2022-09-20T09:50:00+07:00", "end_time": "2022-09-20T10:00:00+07:00",
                               "avg": 100}],
-                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'exclude_keys': []
+                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'is_reuse_connection': False, 'result_cache_ttl': 0, 'max_body_size': 0, 'exclude_keys': [],
+                          'response_time_breakdown': {'dns_time': None, 'connect_time': None, 'tls_time': None, 'first_byte_time': None, 'download_time': None, 'prepare_time': None, 'assertion_time': None}
                           })
 
     def test_retrieve_6_hours_without_result(self):
@@ -1214,7 +1228,8 @@ class DetailListAPIMonitor(APITestCase):
                               "avg": 0},
                              {"start_time": "2022-09-20T09:50:00+07:00", "end_time": "2022-09-20T10:00:00+07:00",
                               "avg": 0}],
-                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'exclude_keys': []
+                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'is_reuse_connection': False, 'result_cache_ttl': 0, 'max_body_size': 0, 'exclude_keys': [],
+                          'response_time_breakdown': {'dns_time': None, 'connect_time': None, 'tls_time': None, 'first_byte_time': None, 'download_time': None, 'prepare_time': None, 'assertion_time': None}
                           })
 
     def test_retrieve_12_hours_with_result(self):
@@ -1370,7 +1385,8 @@ class DetailListAPIMonitor(APITestCase):
                               "avg": 0},
                              {"start_time": "2022-09-20T09:40:00+07:00", "end_time": "2022-09-20T10:00:00+07:00",
                               "avg": 100}],
-                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'exclude_keys': []
+                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'is_reuse_connection': False, 'result_cache_ttl': 0, 'max_body_size': 0, 'exclude_keys': [],
+                          'response_time_breakdown': {'dns_time': None, 'connect_time': None, 'tls_time': None, 'first_byte_time': None, 'download_time': None, 'prepare_time': None, 'assertion_time': None}
                           })
 
     def test_retrieve_12_hours_without_result(self):
@@ -1526,7 +1542,8 @@ class DetailListAPIMonitor(APITestCase):
                               "avg": 0},
                              {"start_time": "2022-09-20T09:40:00+07:00", "end_time": "2022-09-20T10:00:00+07:00",
                               "avg": 0}],
-                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'exclude_keys': []
+                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'is_reuse_connection': False, 'result_cache_ttl': 0, 'max_body_size': 0, 'exclude_keys': [],
+                          'response_time_breakdown': {'dns_time': None, 'connect_time': None, 'tls_time': None, 'first_byte_time': None, 'download_time': None, 'prepare_time': None, 'assertion_time': None}
                           })
 
     def test_retrieve_24_hours_with_result(self):
@@ -1779,7 +1796,8 @@ class DetailListAPIMonitor(APITestCase):
                                     "start_time": "2022-09-20T09:30:00+07:00",
                                     "end_time": "2022-09-20T10:00:00+07:00",
                                     "avg": 100}],
-                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'exclude_keys': []
+                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'is_reuse_connection': False, 'result_cache_ttl': 0, 'max_body_size': 0, 'exclude_keys': [],
+                          'response_time_breakdown': {'dns_time': None, 'connect_time': None, 'tls_time': None, 'first_byte_time': None, 'download_time': None, 'prepare_time': None, 'assertion_time': None}
         })
 
     def test_retrieve_24_hours_without_result(self):
@@ -1983,10 +2001,53 @@ class DetailListAPIMonitor(APITestCase):
                               "avg": 0},
                              {"start_time": "2022-09-20T09:30:00+07:00", "end_time": "2022-09-20T10:00:00+07:00",
                               "avg": 0}],
-                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'exclude_keys': []
+                          'assertion_type': 'DISABLED', 'assertion_value': '', 'is_assert_json_schema_only': False, 'is_reuse_connection': False, 'result_cache_ttl': 0, 'max_body_size': 0, 'exclude_keys': [],
+                          'response_time_breakdown': {'dns_time': None, 'connect_time': None, 'tls_time': None, 'first_byte_time': None, 'download_time': None, 'prepare_time': None, 'assertion_time': None}
                           })
 
 
+    def test_retrieve_with_phase_timing_then_return_average_breakdown(self):
+        user = User.objects.create_user(username='test', email='test@test.com', password='test123')
+        team = Team.objects.create(name='test team')
+        team_member = TeamMember.objects.create(team=team, user=user)
+        
+        token = MonAPIToken.objects.create(team_member=team_member)
+        header = {'HTTP_AUTHORIZATION': f"Token {token.key}"}
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='Test Monitor',
+            method='GET',
+            url='Test Path',
+            schedule='1MIN',
+            body_type='EMPTY',
+        )
+
+        for first_byte_time in [100, 200]:
+            APIMonitorResult.objects.create(
+                monitor=monitor,
+                execution_time=self.mock_current_time - timedelta(minutes=1),
+                response_time=300,
+                success=True,
+                status_code=200,
+                log_response='{}',
+                first_byte_time=first_byte_time,
+                download_time=20,
+                prepare_time=10,
+                assertion_time=2,
+            )
+
+        response = self.client.get(self.test_url, {"range": "30MIN"}, format="json", **header)
+        self.assertEqual(response.data['response_time_breakdown'], {
+            'dns_time': None,
+            'connect_time': None,
+            'tls_time': None,
+            'first_byte_time': 150,
+            'download_time': 20,
+            'prepare_time': 10,
+            'assertion_time': 2,
+        })
+
+
 class StatsAPIMonitor(APITestCase):
     test_url = reverse('api-monitor-stats')
     local_timezone = pytz.timezone(settings.TIME_ZONE)
@@ -2317,7 +2378,17 @@ class ListAPIMonitor(APITestCase):
                     "monitor": 1,
                     "response_time": 50,
                     "status_code": 200,
-                    "success": False
+                    "success": False,
+                    "dns_time": None,
+                    "connect_time": None,
+                    "tls_time": None,
+                    "first_byte_time": None,
+                    "download_time": None,
+                    "prepare_time": None,
+                    "assertion_time": None,
+                    "response_size": None,
+                    "response_hash": None,
+                    "is_response_partial": False
                 },
                 "method": "GET",
                 "name": "Test Monitor",
@@ -2963,6 +3034,30 @@ class ListAPIMonitor(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(APIMonitor.objects.all().count(), 1)
 
+    def test_when_create_api_monitor_then_scheduled_to_run_immediately(self):
+        user = User.objects.create_user(username="test@test.com", email="test@test.com", password="Test1234")
+        team = Team.objects.create(name='test team')
+        team_member = TeamMember.objects.create(team=team, user=user)
+        
+        token = MonAPIToken.objects.create(team_member=team_member)
+        header = {'HTTP_AUTHORIZATION': f"Token {token.key}"}
+
+        received_json = {
+            'name': 'Test Monitor',
+            'method': 'GET',
+            'url': 'Test Path',
+            'schedule': '10MIN',
+            'body_type': 'EMPTY',
+        }
+
+        create_new_monitor_test_path = reverse('api-monitor-list')
+        response = self.client.post(create_new_monitor_test_path, data=received_json, format='json', **header)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        
+        monitor = APIMonitor.objects.get(id=response.data['id'])
+        self.assertIsNotNone(monitor.next_run_at)
+        self.assertLessEqual(monitor.next_run_at, timezone.now())
+
     def test_failed_attempt_because_query_params_doesnt_create_object(self):
         # Create a user object
         user = User.objects.create_user(username="test@test.com", email="test@test.com", password="Test1234")
@@ -3321,6 +3416,9 @@ class ListAPIMonitor(APITestCase):
                 "assertion_type": "DISABLED",
                 "assertion_value": "",
                 "is_assert_json_schema_only": False,
+                "is_reuse_connection": False,
+                "result_cache_ttl": 0,
+                "max_body_size": 0,
                 "exclude_keys": [],
                 "status_page_category_id": None,
             }
@@ -3376,6 +3474,9 @@ class ListAPIMonitor(APITestCase):
                 "assertion_type": "DISABLED",
                 "assertion_value": "",
                 "is_assert_json_schema_only": False,
+                "is_reuse_connection": False,
+                "result_cache_ttl": 0,
+                "max_body_size": 0,
                 "exclude_keys": [],
                 "status_page_category_id": None,
             }
@@ -3440,6 +3541,9 @@ class ListAPIMonitor(APITestCase):
                 "assertion_type": "DISABLED",
                 "assertion_value": "",
                 "is_assert_json_schema_only": False,
+                "is_reuse_connection": False,
+                "result_cache_ttl": 0,
+                "max_body_size": 0,
                 "exclude_keys": [],
                 "status_page_category_id": None,
             }
@@ -3585,6 +3689,9 @@ class ListAPIMonitor(APITestCase):
                 "assertion_type": "DISABLED",
                 "assertion_value": "",
                 "is_assert_json_schema_only": False,
+                "is_reuse_connection": False,
+                "result_cache_ttl": 0,
+                "max_body_size": 0,
                 "exclude_keys": [],
                 "status_page_category_id": statuspage_category.id,
             }
@@ -4981,6 +5088,424 @@ class EditAPIMonitor(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+    def test_when_edit_schedule_then_next_run_at_follow_last_result(self):
+        user = User.objects.create_user(username="test@test.com", email="test@test.com", password="Test1234")
+        team = Team.objects.create(name='test team')
+        team_member = TeamMember.objects.create(team=team, user=user)
+        
+        token = MonAPIToken.objects.create(team_member=team_member)
+        header = {'HTTP_AUTHORIZATION': f"Token {token.key}"}
+        
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='Test Monitor',
+            method='GET',
+            url='Test Path',
+            schedule='10MIN',
+            body_type='EMPTY',
+        )
+        
+        last_execution_time = timezone.now() - timedelta(minutes=1)
+        APIMonitorResult.objects.create(
+            monitor=monitor,
+            execution_time=last_execution_time,
+            response_time=10,
+            success=True,
+            status_code=200,
+            log_response='resp',
+            log_error='',
+        )
+
+        received_json = {
+            'name': 'Test Monitor',
+            'method': 'GET',
+            'url': 'Test Path',
+            'schedule': '30MIN',
+            'body_type': 'EMPTY',
+        }
+
+        edit_monitor_path = reverse('api-monitor-detail', kwargs={'pk': monitor.id})
+        response = self.client.put(edit_monitor_path, data=received_json, format='json', **header)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        monitor.refresh_from_db()
+        self.assertEqual(monitor.next_run_at, monitor.get_next_run_at(last_execution_time))
+
+    def test_when_edit_monitor_then_config_version_of_dependents_bumped(self):
+        user = User.objects.create_user(username="test@test.com", email="test@test.com", password="Test1234")
+        team = Team.objects.create(name='test team')
+        team_member = TeamMember.objects.create(team=team, user=user)
+        
+        token = MonAPIToken.objects.create(team_member=team_member)
+        header = {'HTTP_AUTHORIZATION': f"Token {token.key}"}
+        
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='Test Monitor',
+            method='GET',
+            url='Test Path',
+            schedule='10MIN',
+            body_type='EMPTY',
+        )
+        dependent = APIMonitor.objects.create(
+            team=team,
+            name='Dependent Monitor',
+            method='GET',
+            url='Test Path',
+            schedule='10MIN',
+            body_type='EMPTY',
+            previous_step=monitor,
+        )
+        indirect_dependent = APIMonitor.objects.create(
+            team=team,
+            name='Indirect Dependent Monitor',
+            method='GET',
+            url='Test Path',
+            schedule='10MIN',
+            body_type='EMPTY',
+            previous_step=dependent,
+        )
+        other = APIMonitor.objects.create(
+            team=team,
+            name='Other Monitor',
+            method='GET',
+            url='Test Path',
+            schedule='10MIN',
+            body_type='EMPTY',
+        )
+
+        received_json = {
+            'name': 'Test Monitor',
+            'method': 'GET',
+            'url': 'New Path',
+            'schedule': '10MIN',
+            'body_type': 'EMPTY',
+        }
+
+        edit_monitor_path = reverse('api-monitor-detail', kwargs={'pk': monitor.id})
+        response = self.client.put(edit_monitor_path, data=received_json, format='json', **header)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        config_versions = dict(APIMonitor.objects.values_list('id', 'config_version'))
+        self.assertEqual(config_versions, {monitor.id: 1, dependent.id: 1, indirect_dependent.id: 1, other.id: 0})
+        
+        # Deleted previous step change the chain of its dependents
+        response = self.client.delete(edit_monitor_path, **header)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        
+        config_versions = dict(APIMonitor.objects.values_list('id', 'config_version'))
+        self.assertEqual(config_versions, {dependent.id: 2, indirect_dependent.id: 2, other.id: 0})
+
+    def create_step_monitors(self):
+        user = User.objects.create_user(username="test@test.com", email="test@test.com", password="Test1234")
+        team = Team.objects.create(name='test team')
+        team_member = TeamMember.objects.create(team=team, user=user)
+        
+        token = MonAPIToken.objects.create(team_member=team_member)
+        header = {'HTTP_AUTHORIZATION': f"Token {token.key}"}
+        
+        old_step = APIMonitor.objects.create(
+            team=team,
+            name='Old Step Monitor',
+            method='GET',
+            url='Test Path',
+            schedule='10MIN',
+            body_type='EMPTY',
+        )
+        new_step = APIMonitor.objects.create(
+            team=team,
+            name='New Step Monitor',
+            method='GET',
+            url='Test Path',
+            schedule='10MIN',
+            body_type='EMPTY',
+        )
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='Test Monitor',
+            method='GET',
+            url='Test Path',
+            schedule='10MIN',
+            body_type='EMPTY',
+            previous_step=old_step,
+        )
+        return header, old_step, new_step, monitor
+
+    def test_when_edit_monitor_while_config_version_bumped_then_bump_kept(self):
+        header, old_step, _, monitor = self.create_step_monitors()
+        received_json = {
+            'name': 'Test Monitor',
+            'method': 'GET',
+            'url': 'New Path',
+            'schedule': '10MIN',
+            'body_type': 'EMPTY',
+            'previous_step_id': old_step.id,
+        }
+
+        # Bumped by other request after the monitor was loaded by this request
+        is_valid = APIMonitorSerializer.is_valid
+        def bump_then_validate(serializer, *args, **kwargs):
+            APIMonitor.objects.filter(id=monitor.id).update(config_version=F('config_version') + 1)
+            return is_valid(serializer, *args, **kwargs)
+
+        edit_monitor_path = reverse('api-monitor-detail', kwargs={'pk': monitor.id})
+        with patch.object(APIMonitorSerializer, 'is_valid', autospec=True, side_effect=bump_then_validate):
+            response = self.client.put(edit_monitor_path, data=received_json, format='json', **header)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        monitor.refresh_from_db()
+        self.assertEqual(monitor.url, 'New Path')
+        self.assertEqual(monitor.config_version, 3)
+
+    def test_when_previous_step_changed_then_old_previous_step_bumped(self):
+        header, old_step, new_step, monitor = self.create_step_monitors()
+        received_json = {
+            'name': 'Test Monitor',
+            'method': 'GET',
+            'url': 'Test Path',
+            'schedule': '10MIN',
+            'body_type': 'EMPTY',
+            'previous_step_id': new_step.id,
+        }
+
+        edit_monitor_path = reverse('api-monitor-detail', kwargs={'pk': monitor.id})
+        response = self.client.put(edit_monitor_path, data=received_json, format='json', **header)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        old_step.refresh_from_db()
+        new_step.refresh_from_db()
+        self.assertEqual((old_step.config_version, new_step.config_version), (1, 1))
+
+    def test_when_monitor_deleted_then_its_previous_step_bumped(self):
+        header, old_step, new_step, monitor = self.create_step_monitors()
+
+        response = self.client.delete(reverse('api-monitor-detail', kwargs={'pk': monitor.id}), **header)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        
+        config_versions = dict(APIMonitor.objects.values_list('id', 'config_version'))
+        self.assertEqual(config_versions, {old_step.id: 1, new_step.id: 0})
+
+    def test_when_create_monitor_with_previous_step_then_config_version_of_previous_step_bumped(self):
+        user = User.objects.create_user(username="test@test.com", email="test@test.com", password="Test1234")
+        team = Team.objects.create(name='test team')
+        team_member = TeamMember.objects.create(team=team, user=user)
+        
+        token = MonAPIToken.objects.create(team_member=team_member)
+        header = {'HTTP_AUTHORIZATION': f"Token {token.key}"}
+        
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='Test Monitor',
+            method='GET',
+            url='Test Path',
+            schedule='10MIN',
+            body_type='EMPTY',
+        )
+
+        received_json = {
+            'name': 'Dependent Monitor',
+            'method': 'GET',
+            'url': 'Test Path',
+            'schedule': '10MIN',
+            'body_type': 'EMPTY',
+            'previous_step_id': monitor.id,
+            'max_body_size': 1024,
+        }
+
+        response = self.client.post(reverse('api-monitor-list'), data=received_json, format='json', **header)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['max_body_size'], 1024)
+        
+        monitor.refresh_from_db()
+        self.assertEqual(monitor.config_version, 1)
+
+class ResponseBlobAPIMonitor(APITestCase):
+    local_timezone = pytz.timezone(settings.TIME_ZONE)
+    mock_current_time = local_timezone.localize(datetime(2022, 9, 20, 10))
+
+    def setUp(self):
+        team = Team.objects.create(name='test team')
+        self.monitor = APIMonitor.objects.create(
+            team=team,
+            name='Test Monitor',
+            method='GET',
+            url='Test Path',
+            schedule='10MIN',
+            body_type='EMPTY',
+        )
+
+    def create_result(self, log_response):
+        return APIMonitorResult.objects.create(
+            monitor=self.monitor,
+            execution_time=self.mock_current_time,
+            response_time=10,
+            success=True,
+            status_code=200,
+            log_response=log_response,
+            log_error='',
+        )
+
+    def test_when_results_have_same_body_then_share_one_blob(self):
+        for _ in range(2):
+            result = APIMonitorResult(monitor=self.monitor, execution_time=self.mock_current_time, response_time=10,
+                                      success=True, status_code=200, log_response='{"key": "value"}', log_error='')
+            result.store_log_response()
+            result.save()
+
+        self.assertEqual(APIMonitorResponseBlob.objects.count(), 1)
+        for result in APIMonitorResult.objects.all():
+            self.assertEqual(result.log_response, '')
+            self.assertEqual(result.get_log_response(), '{"key": "value"}')
+
+    def test_when_result_body_on_blob_then_serializer_expand_body(self):
+        result = self.create_result('{"key": "value"}')
+        result.store_log_response()
+        result.save()
+
+        result = APIMonitorResult.objects.get(id=result.id)
+        self.assertEqual(APIMonitorResultSerializer(result).data['log_response'], '{"key": "value"}')
+
+    def test_when_migrate_response_blobs_then_existing_results_moved_to_blob(self):
+        results = [self.create_result('resp'), self.create_result('resp'), self.create_result('other'), self.create_result('')]
+        call_command('migrate_response_blobs', batch_size=2)
+
+        self.assertEqual(APIMonitorResponseBlob.objects.count(), 2)
+        self.assertEqual([APIMonitorResult.objects.get(id=result.id).get_log_response() for result in results], ['resp', 'resp', 'other', ''])
+        self.assertEqual(APIMonitorResult.objects.exclude(log_response='').count(), 0)
+
+
+class RollupAPIMonitor(APITestCase):
+    local_timezone = pytz.timezone(settings.TIME_ZONE)
+    mock_current_time = local_timezone.localize(datetime(2022, 9, 20, 10))
+
+    def setUp(self):
+        team = Team.objects.create(name='test team')
+        self.monitor = APIMonitor.objects.create(
+            team=team,
+            name='Test Monitor',
+            method='GET',
+            url='Test Path',
+            schedule='10MIN',
+            body_type='EMPTY',
+        )
+
+    def create_result(self, execution_time, response_time, success):
+        return APIMonitorResult.objects.create(
+            monitor=self.monitor,
+            execution_time=execution_time,
+            response_time=response_time,
+            success=success,
+            status_code=200,
+            log_response='',
+            log_error='',
+        )
+
+    def get_rollups(self):
+        return list(APIMonitorResultRollup.objects.order_by('period', 'bucket').values_list(
+            'period', 'bucket', 'success_count', 'failure_count', 'response_time_sum', 'response_time_min', 'response_time_max'))
+
+    def test_when_result_created_then_rollup_of_every_period_updated(self):
+        self.create_result(self.mock_current_time + timedelta(seconds=10), 100, True)
+        self.create_result(self.mock_current_time + timedelta(seconds=50), 50, False)
+        self.create_result(self.mock_current_time + timedelta(minutes=1), 30, True)
+
+        utc = pytz.utc
+        self.assertEqual(self.get_rollups(), [
+            ('DAY', utc.localize(datetime(2022, 9, 20)), 2, 1, 180, 30, 100),
+            ('HOUR', utc.localize(datetime(2022, 9, 20, 3)), 2, 1, 180, 30, 100),
+            ('MINUTE', utc.localize(datetime(2022, 9, 20, 3)), 1, 1, 150, 50, 100),
+            ('MINUTE', utc.localize(datetime(2022, 9, 20, 3, 1)), 1, 0, 30, 30, 30),
+        ])
+
+    def test_split_rollup_range_use_coarsest_period_inside_range(self):
+        utc = pytz.utc
+        start_time = utc.localize(datetime(2022, 9, 18, 22, 30, 15))
+        end_time = utc.localize(datetime(2022, 9, 20, 1, 10, 45))
+        self.assertEqual(split_rollup_range(start_time, end_time), [
+            ('MINUTE', utc.localize(datetime(2022, 9, 18, 22, 31)), utc.localize(datetime(2022, 9, 18, 22, 59))),
+            ('HOUR', utc.localize(datetime(2022, 9, 18, 23)), utc.localize(datetime(2022, 9, 18, 23))),
+            ('DAY', utc.localize(datetime(2022, 9, 19)), utc.localize(datetime(2022, 9, 19))),
+            ('HOUR', utc.localize(datetime(2022, 9, 20, 0)), utc.localize(datetime(2022, 9, 20, 0))),
+            ('MINUTE', utc.localize(datetime(2022, 9, 20, 1)), utc.localize(datetime(2022, 9, 20, 1, 10))),
+        ])
+        self.assertEqual(split_rollup_range(end_time, end_time), [])
+
+    def test_rollup_summary_match_results_inside_range(self):
+        for minutes, response_time, success in [(-1500, 10, True), (-1380, 20, True), (-90, 30, False), (0, 40, True), (5, 50, True)]:
+            self.create_result(self.mock_current_time + timedelta(minutes=minutes), response_time, success)
+
+        summary = get_rollup_summary(self.monitor.rollups, self.mock_current_time - timedelta(days=1), self.mock_current_time)
+        self.assertEqual(summary, {'success': 2, 'failed': 1, 'avg': 30})
+
+        summary = get_rollup_summary(self.monitor.rollups, self.mock_current_time + timedelta(minutes=10), self.mock_current_time + timedelta(minutes=20))
+        self.assertEqual(summary, {'success': 0, 'failed': 0, 'avg': None})
+
+    def test_when_backfill_rollups_then_rollups_rebuilt_from_results(self):
+        self.create_result(self.mock_current_time + timedelta(seconds=10), 100, True)
+        self.create_result(self.mock_current_time + timedelta(seconds=50), 50, False)
+        self.create_result(self.mock_current_time + timedelta(hours=1), 30, True)
+        expected_rollups = self.get_rollups()
+
+        APIMonitorResultRollup.objects.all().delete()
+        APIMonitorResultRollup.objects.create(monitor=self.monitor, period='MINUTE', bucket=self.mock_current_time, success_count=5)
+        call_command('backfill_rollups', batch_size=2)
+
+        self.assertEqual(self.get_rollups(), expected_rollups)
+
+
+class ResultPartitionTest(APITestCase):
+    mock_current_time = pytz.utc.localize(datetime(2022, 9, 21, 10))
+
+    def test_floor_partition_time_on_day_and_monday(self):
+        self.assertEqual(floor_partition_time(self.mock_current_time, timedelta(days=1)), pytz.utc.localize(datetime(2022, 9, 21)))
+        self.assertEqual(floor_partition_time(self.mock_current_time, timedelta(weeks=1)), pytz.utc.localize(datetime(2022, 9, 19)))
+
+    def test_partition_name_use_utc_date(self):
+        start_time = pytz.timezone(settings.TIME_ZONE).localize(datetime(2022, 9, 21, 2))
+        self.assertEqual(get_partition_name(start_time), 'apimonitor_apimonitorresult_p20220920')
+
+    def test_when_database_not_postgres_then_keep_single_table(self):
+        partition_result_table(self.mock_current_time, timedelta(days=1), 7)
+        self.assertEqual(ensure_result_partitions(self.mock_current_time, timedelta(days=1), 7), [])
+        self.assertEqual(drop_result_partitions(self.mock_current_time), [])
+
+    def mock_partition_bounds(self, mock_connection):
+        cursor = mock_connection.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [
+            ('apimonitor_apimonitorresult_p20220921', "FOR VALUES FROM ('2022-09-21 00:00:00+00') TO ('2022-09-22 00:00:00+00')"),
+            (DEFAULT_PARTITION, 'DEFAULT'),
+            ('apimonitor_apimonitorresult_p20220920', "FOR VALUES FROM ('2022-09-20 07:00:00+07') TO ('2022-09-21 07:00:00+07')"),
+        ]
+        return cursor
+
+    @patch('apimonitor.partitions.connection')
+    def test_when_list_partitions_then_parse_postgres_bounds(self, mock_connection):
+        self.mock_partition_bounds(mock_connection)
+        self.assertEqual(list_result_partitions(), [
+            ('apimonitor_apimonitorresult_p20220920', pytz.utc.localize(datetime(2022, 9, 20)), pytz.utc.localize(datetime(2022, 9, 21))),
+            ('apimonitor_apimonitorresult_p20220921', pytz.utc.localize(datetime(2022, 9, 21)), pytz.utc.localize(datetime(2022, 9, 22))),
+        ])
+
+    @patch('apimonitor.partitions.is_result_table_partitioned', return_value=True)
+    @patch('apimonitor.partitions.connection')
+    def test_when_drop_partitions_then_only_drop_range_before_cutoff(self, mock_connection, _):
+        cursor = self.mock_partition_bounds(mock_connection)
+        self.assertEqual(drop_result_partitions(self.mock_current_time), ['apimonitor_apimonitorresult_p20220920'])
+        cursor.execute.assert_called_with('DROP TABLE "apimonitor_apimonitorresult_p20220920"')
+
+    def test_when_range_partition_created_then_move_rows_from_default_partition_first(self):
+        cursor = MagicMock()
+        start_time = floor_partition_time(self.mock_current_time, timedelta(days=1))
+        create_range_partition(cursor, get_partition_name(start_time), start_time, start_time + timedelta(days=1))
+
+        queries = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertEqual(len(queries), 4)
+        self.assertIn(f'DELETE FROM "{DEFAULT_PARTITION}"', queries[1])
+        self.assertIn('PARTITION OF', queries[2])
+        self.assertIn('INSERT INTO "apimonitor_apimonitorresult" SELECT', queries[3])
+        self.assertEqual(cursor.execute.call_args_list[1].args[1], [start_time, start_time + timedelta(days=1)])
+
+
 class TeamMigrationsTest(MigratorTestCase):
     migrate_from = ('apimonitor', '0013_merge_20221106_1259')
     migrate_to = ('apimonitor', '0014_remove_alertsconfiguration_user_and_more')
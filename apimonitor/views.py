@@ -1,6 +1,7 @@
 from datetime import timedelta
 
-from django.db.models import Avg, Count, Q
+from django.db import transaction
+from django.db.models import Avg
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, mixins, status
@@ -9,7 +10,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from monapi.utils import try_parse_int
 from apimonitor.models import (APIMonitor, APIMonitorResult, APIMonitorQueryParam,
-                               APIMonitorHeader, APIMonitorBodyForm, APIMonitorRawBody, AssertionExcludeKey)
+                               APIMonitorHeader, APIMonitorBodyForm, APIMonitorRawBody, AssertionExcludeKey,
+                               APIMonitorResultRollup, get_rollup_summary)
 from apimonitor.serializers import (APIMonitorSerializer, APIMonitorListSerializer,
                                     APIMonitorQueryParamSerializer, APIMonitorHeaderSerializer,
                                     APIMonitorBodyFormSerializer, APIMonitorRawBodySerializer,
@@ -45,7 +47,10 @@ class APIMonitorViewSet(mixins.ListModelMixin,
             'status_page_category_id': None if request.data.get('status_page_category_id') == '' else request.data.get('status_page_category_id', None),
             'assertion_type': request.data.get('assertion_type', "DISABLED"),
             'assertion_value': request.data.get('assertion_value', ""),
-            'is_assert_json_schema_only': request.data.get('is_assert_json_schema_only', False)
+            'is_assert_json_schema_only': request.data.get('is_assert_json_schema_only', False),
+            'is_reuse_connection': request.data.get('is_reuse_connection', False),
+            'result_cache_ttl': request.data.get('result_cache_ttl', 0),
+            'max_body_size': request.data.get('max_body_size', 0),
         }
         return monitor_data
 
@@ -72,6 +77,7 @@ class APIMonitorViewSet(mixins.ListModelMixin,
                                     status=status.HTTP_400_BAD_REQUEST)
 
             # Saved
+            old_previous_step_id = monitor_obj.previous_step_id
             monitor_obj.name = monitor_data['name']
             monitor_obj.method = monitor_data['method']
             monitor_obj.url = monitor_data['url']
@@ -82,7 +88,22 @@ class APIMonitorViewSet(mixins.ListModelMixin,
             monitor_obj.assertion_type = monitor_data['assertion_type']
             monitor_obj.assertion_value = monitor_data['assertion_value']
             monitor_obj.is_assert_json_schema_only = monitor_data['is_assert_json_schema_only']
-            monitor_obj.save()
+            monitor_obj.is_reuse_connection = monitor_data['is_reuse_connection']
+            monitor_obj.result_cache_ttl = monitor_data['result_cache_ttl']
+            monitor_obj.max_body_size = monitor_data['max_body_size']
+            
+            # Reschedule next run from the last result since schedule might be changed
+            last_result = APIMonitorResult.objects.filter(monitor=monitor_obj).order_by('execution_time').last()
+            if last_result == None:
+                monitor_obj.next_run_at = timezone.now()
+            else:
+                monitor_obj.next_run_at = monitor_obj.get_next_run_at(last_result.execution_time)
+            # Config version is only changed with bump_config_version, saving loaded value would undo concurrent bump
+            monitor_obj.save(update_fields=[
+                'name', 'method', 'url', 'schedule', 'body_type', 'previous_step', 'status_page_category',
+                'assertion_type', 'assertion_value', 'is_assert_json_schema_only', 'is_reuse_connection',
+                'result_cache_ttl', 'max_body_size', 'next_run_at',
+            ])
 
             # Delete old objects
             APIMonitorQueryParam.objects.filter(monitor=kwargs['pk']).delete()
@@ -138,11 +159,31 @@ class APIMonitorViewSet(mixins.ListModelMixin,
                 }
                 AssertionExcludeKey.objects.create(**record)
 
+            # Drop cached configuration of this monitor and its dependents on cron
+            monitor_obj.bump_config_version()
+            
+            # Previous step must keep whole response body for this monitor, old previous step might not anymore
+            if monitor_obj.previous_step_id != None:
+                APIMonitor.objects.get(id=monitor_obj.previous_step_id).bump_config_version()
+            if old_previous_step_id != None and old_previous_step_id != monitor_obj.previous_step_id:
+                old_previous_step = APIMonitor.objects.filter(id=old_previous_step_id).first()
+                if old_previous_step != None:
+                    old_previous_step.bump_config_version()
+
             serializer = APIMonitorSerializer(monitor_obj)
             return Response(serializer.data)
         else:
             return Response(data={"error": "['Please make sure your [name, method, url, schedule, body_type] is valid']"},status=status.HTTP_400_BAD_REQUEST)
 
+    def perform_destroy(self, instance):
+        # Monitors using deleted monitor as previous step lose their previous step,
+        # previous step of deleted monitor might not be used as previous step anymore
+        with transaction.atomic():
+            instance.bump_config_version()
+            instance.delete()
+            if instance.previous_step_id != None:
+                APIMonitor.objects.get(id=instance.previous_step_id).bump_config_version()
+
     def create(self, request, *args, **kwargs):
         monitor_data = self.get_monitor_data_from_request(request)
         api_monitor_serializer = APIMonitorSerializer(data=monitor_data)
@@ -163,7 +204,7 @@ class APIMonitorViewSet(mixins.ListModelMixin,
                         error_log += ["Please make sure your [status page category] is valid and exist!"]
                         return Response(data={"error": f"{error_log[0]}"}, status=status.HTTP_400_BAD_REQUEST)
                     
-                monitor_obj = APIMonitor.objects.create(**monitor_data)
+                monitor_obj = APIMonitor.objects.create(**monitor_data, next_run_at=timezone.now())
                     
                 if request.data.get('query_params'):
                     for key_value_pair in request.data.get('query_params'):
@@ -249,6 +290,11 @@ class APIMonitorViewSet(mixins.ListModelMixin,
                             error_log += ["Please make sure your [exclude key] valid strings!"]
                             break
                 assert len(error_log) == 0, error_log
+                
+                # Previous step must keep whole response body for this monitor
+                if monitor_obj.previous_step_id != None:
+                    APIMonitor.objects.get(id=monitor_obj.previous_step_id).bump_config_version()
+                
                 serialized_obj = APIMonitorSerializer(monitor_obj)
                 return Response(data=serialized_obj.data, status=status.HTTP_201_CREATED)
             except AssertionError as e:
@@ -262,14 +308,12 @@ class APIMonitorViewSet(mixins.ListModelMixin,
         for _ in range(n_bar):
             start_time = last_chosen_period
             end_time = last_chosen_period+timedelta(minutes=increment_in_minutes)
-            avg_response_time = APIMonitorResult.objects \
-                .filter(monitor=monitor, execution_time__gte=start_time, execution_time__lte=end_time) \
-                .aggregate(avg=Avg('response_time'))
+            summary = get_rollup_summary(monitor.rollups, start_time, end_time)
 
             avg = 0
 
-            if  avg_response_time["avg"]!=None:
-                avg = avg_response_time['avg']
+            if  summary["avg"]!=None:
+                avg = summary['avg']
 
             response_time.append({
                 "start_time": start_time,
@@ -278,19 +322,11 @@ class APIMonitorViewSet(mixins.ListModelMixin,
             })
 
             # Average success rate
-            success_count = APIMonitorResult.objects \
-                .filter(monitor=monitor, execution_time__gte=start_time, execution_time__lte=end_time) \
-                .aggregate(
-                    s=Count('success', filter=Q(success=True)), 
-                    f=Count('success', filter=Q(success=False)),
-                    total=Count('pk'),
-                )
-
             success_rate.append({
                 "start_time": start_time,
                 "end_time" : end_time,
-                "success": success_count['s'],
-                "failed" : success_count['f']
+                "success": summary['success'],
+                "failed" : summary['failed']
             })
             last_chosen_period = last_chosen_period+timedelta(minutes=increment_in_minutes)
 
@@ -300,22 +336,42 @@ class APIMonitorViewSet(mixins.ListModelMixin,
 
         response_time = []
         success_rate = []
+        last_chosen_period_in_hours = 0
         
         if(self.request.query_params.get("range")=="30MIN"):
+            last_chosen_period_in_hours = 0.5
             APIMonitorViewSet.retrieve_with_param(0.5, 30, 1, monitor, success_rate, response_time)
         elif(self.request.query_params.get("range")=="60MIN"):
+            last_chosen_period_in_hours = 1
             APIMonitorViewSet.retrieve_with_param(1, 30, 2, monitor, success_rate, response_time)
         elif(self.request.query_params.get("range")=="180MIN"):
+            last_chosen_period_in_hours = 3
             APIMonitorViewSet.retrieve_with_param(3, 36, 5, monitor, success_rate, response_time)
         elif(self.request.query_params.get("range")=="360MIN"):
+            last_chosen_period_in_hours = 6
             APIMonitorViewSet.retrieve_with_param(6, 36, 10, monitor, success_rate, response_time)
         elif(self.request.query_params.get("range")=="720MIN"):
+            last_chosen_period_in_hours = 12
             APIMonitorViewSet.retrieve_with_param(12, 36, 20, monitor, success_rate, response_time)
         elif(self.request.query_params.get("range")=="1440MIN"):
+            last_chosen_period_in_hours = 24
             APIMonitorViewSet.retrieve_with_param(24, 48, 30, monitor, success_rate, response_time)
 
         monitor.success_rate=success_rate
         monitor.response_time=response_time
+        
+        # Average time of each request phase, separate network latency from MonAPI overhead
+        monitor.response_time_breakdown = APIMonitorResult.objects \
+            .filter(monitor=monitor, execution_time__gte=timezone.now() - timedelta(hours=last_chosen_period_in_hours)) \
+            .aggregate(
+                dns_time=Avg('dns_time'),
+                connect_time=Avg('connect_time'),
+                tls_time=Avg('tls_time'),
+                first_byte_time=Avg('first_byte_time'),
+                download_time=Avg('download_time'),
+                prepare_time=Avg('prepare_time'),
+                assertion_time=Avg('assertion_time'),
+            )
 
         serializer = APIMonitorRetrieveSerializer(monitor)
 
@@ -323,32 +379,24 @@ class APIMonitorViewSet(mixins.ListModelMixin,
     
     def list(self, request):
         queryset = self.filter_queryset(self.get_queryset())
-        last_24_hour = timezone.now() - timedelta(days=1)
+        current_time = timezone.now()
+        last_24_hour = current_time - timedelta(days=1)
         
         # Append summary to each monitor
         for monitor in queryset:
+            summary = get_rollup_summary(monitor.rollups, last_24_hour, current_time)
+            
             # Average response time
-            avg_response_time = APIMonitorResult.objects \
-                .filter(monitor=monitor, execution_time__gte=last_24_hour) \
-                .aggregate(avg=Avg('response_time'))
-            monitor.avg_response_time = avg_response_time['avg']
+            monitor.avg_response_time = summary['avg']
             
             if monitor.avg_response_time == None:
                 monitor.avg_response_time = 0
             
             # Average success rate
-            success_count = APIMonitorResult.objects \
-                .filter(monitor=monitor, execution_time__gte=last_24_hour) \
-                .aggregate(
-                    s=Count('success', filter=Q(success=True)), 
-                    f=Count('success', filter=Q(success=False)),
-                    total=Count('pk'),
-                )
-            
-            if success_count['total'] == 0:
+            if summary['success'] + summary['failed'] == 0:
                 monitor.success_rate = 100
             else:
-                monitor.success_rate = success_count['s'] / (success_count['s'] + success_count['f']) * 100
+                monitor.success_rate = summary['success'] / (summary['success'] + summary['failed']) * 100
             
             # Success rate history
             success_rate_history = []
@@ -357,26 +405,20 @@ class APIMonitorViewSet(mixins.ListModelMixin,
                 start_time = last_24_hour_per_monitor
                 end_time = last_24_hour_per_monitor + timedelta(hours=1)
                 
-                success_count = APIMonitorResult.objects \
-                    .filter(monitor=monitor, execution_time__gte=start_time, execution_time__lte=end_time) \
-                    .aggregate(
-                        s=Count('success', filter=Q(success=True)), 
-                        f=Count('success', filter=Q(success=False)),
-                        total=Count('pk'),
-                    )
+                summary = get_rollup_summary(monitor.rollups, start_time, end_time)
             
                 success_rate_history.append({
                     'start_time': start_time,
                     'end_time': end_time,
-                    'success': success_count['s'],
-                    'failed': success_count['f'],
+                    'success': summary['success'],
+                    'failed': summary['failed'],
                 })
                 last_24_hour_per_monitor += timedelta(hours=1)
            
             monitor.success_rate_history = success_rate_history
             
             # Last result 
-            last_result = APIMonitorResult.objects.filter(monitor=monitor).last()
+            last_result = APIMonitorResult.objects.select_related('response_blob').filter(monitor=monitor).last()
             monitor.last_result = last_result
        
         serializer = APIMonitorListSerializer(queryset, many=True)
@@ -394,14 +436,13 @@ class APIMonitorViewSet(mixins.ListModelMixin,
         for _ in range(24):
             start_time = last_chosen_period
             end_time = last_chosen_period+timedelta(hours=1)
-            avg_response_time = APIMonitorResult.objects \
-                .filter(monitor__team=request.auth.team, execution_time__gte=start_time, execution_time__lte=end_time) \
-                .aggregate(avg=Avg('response_time'))
+            summary = get_rollup_summary(
+                APIMonitorResultRollup.objects.filter(monitor__team=request.auth.team), start_time, end_time)
 
             avg = 0
 
-            if  avg_response_time["avg"]!=None:
-                avg = avg_response_time['avg']
+            if  summary["avg"]!=None:
+                avg = summary['avg']
 
             response_time.append({
                 "start_time": start_time,
@@ -410,19 +451,11 @@ class APIMonitorViewSet(mixins.ListModelMixin,
             })
 
             # Average success rate
-            success_count = APIMonitorResult.objects \
-                .filter(monitor__team=request.auth.team, execution_time__gte=start_time, execution_time__lte=end_time) \
-                .aggregate(
-                    s=Count('success', filter=Q(success=True)), 
-                    f=Count('success', filter=Q(success=False)),
-                    total=Count('pk'),
-                )
-
             success_rate.append({
                 "start_time": start_time,
                 "end_time" : end_time,
-                "success": success_count['s'],
-                "failed" : success_count['f']
+                "success": summary['success'],
+                "failed" : summary['failed']
             })
             last_chosen_period = last_chosen_period+timedelta(hours=1)
 
@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
 from rest_framework import status
 from django.urls import reverse
+from unittest.mock import patch
 
 from login.models import MonAPIToken, Team, TeamMember
 
@@ -52,6 +53,28 @@ class APITest(APITestCase):
         response = self.client.post(api_test_path, data=received_json, format='json', **header)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    @patch("monapi.session_pool.session_pool.request")
+    def test_api_test_reuse_connection_then_use_session_pool(self, mock_request):
+        mock_request.return_value.content = b'{"key": "value"}'
+        user = User.objects.create_user(username="test@test.com", email="test@test.com", password="Test1234")
+        team = Team.objects.create(name='test team')
+        team_member = TeamMember.objects.create(team=team, user=user)
+        
+        token = MonAPIToken.objects.create(team_member=team_member)
+        header = {'HTTP_AUTHORIZATION': f"Token {token.key}"}
+
+        received_json = {
+            'method': 'GET',
+            'url': 'https://google.com',
+            'is_reuse_connection': True,
+        }
+
+        api_test_path = reverse('api-test')
+        response = self.client.post(api_test_path, data=received_json, format='json', **header)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'response': '{"key": "value"}'})
+        self.assertEqual(mock_request.call_args.args, ('GET', 'https://google.com'))
+
     def test_api_test_get_wrong_url(self):
         # Create a user object
         user = User.objects.create_user(username="test@test.com", email="test@test.com", password="Test1234")
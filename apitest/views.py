@@ -3,6 +3,7 @@ from rest_framework import status, views
 from rest_framework.response import Response
 
 from apitest.serializers import (APITestQueryParamSerializer, APITestHeaderSerializer, APITestBodyFormSerializer)
+from monapi.session_pool import session_pool
 
 class APITestView(views.APIView):
     def post(self, request, format=None):
@@ -72,7 +73,9 @@ class APITestView(views.APIView):
             assert len(error_log) == 0, error_log
         
             try:
-                resp = requests.request(monitor_data['method'], monitor_data['url'], params=monitor_data['query_params'], data=monitor_data['body'], headers=monitor_data['headers'], timeout=30)
+                # Reuse connection from shared pool, otherwise open a new connection like cold monitor
+                send_request = session_pool.request if request.data.get('is_reuse_connection', False) else requests.request
+                resp = send_request(monitor_data['method'], monitor_data['url'], params=monitor_data['query_params'], data=monitor_data['body'], headers=monitor_data['headers'], timeout=30)
                 
             except Exception as e:
                 error_log += [str(e)]
@@ -1,3 +1,8 @@
 from django.contrib import admin
 
-# Register your models here.
+from cron.models import CronWorkItem, CronCheckpoint, CronConfiguration
+
+
+admin.site.register(CronWorkItem)
+admin.site.register(CronCheckpoint)
+admin.site.register(CronConfiguration)
@@ -0,0 +1,228 @@
+import json
+import threading
+from collections import OrderedDict
+
+from deepdiff import DeepDiff
+
+# Schema only JSON assertion compare keys, container types and array lengths of the response with
+# the expected JSON. Expected JSON is compiled once with the monitor so each run only walk the
+# response once, instead of running DeepDiff and throwing away its value differences.
+# Array of scalar values is aligned by DeepDiff (insert and remove like difflib), so shifted items
+# give the same outcome, other arrays are compared by position like DeepDiff does.
+
+# Scalar JSON values, DeepDiff align array only when every item is one of them
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def is_scalar_list(value):
+    return all(isinstance(item, SCALAR_TYPES) for item in value)
+
+
+# Printed like key set of DeepDiff, [root['a'], root['b']]
+class KeyPaths(list):
+    def __repr__(self):
+        return f"[{', '.join(self)}]"
+
+
+class SchemaNode:
+    def __init__(self, value, path, exclude_paths):
+        self.path = path
+        self.container_type = None
+        self.children = {}
+        self.excluded_keys = set()
+        self.items = []
+        self.expected = []
+        self.is_scalar_list = False
+        self.item_exclude_paths = []
+
+        # Excluded path and scalar value has nothing to validate inside
+        if path not in exclude_paths and type(value) in [dict, list]:
+            self.container_type = type(value)
+
+        if self.container_type == dict:
+            for key, child in value.items():
+                child_path = f"{path}['{key}']"
+                if child_path in exclude_paths:
+                    self.excluded_keys.add(key)
+                else:
+                    self.children[key] = SchemaNode(child, child_path, exclude_paths)
+        elif self.container_type == list:
+            self.items = [SchemaNode(child, f"{path}[{idx}]", exclude_paths) for idx, child in enumerate(value)]
+            self.expected = value
+            self.is_scalar_list = is_scalar_list(value)
+            # Excluded item path relative to this array, DeepDiff of the array start from root
+            self.item_exclude_paths = ['root' + exclude_path[len(path):] for exclude_path in exclude_paths
+                                       if exclude_path.startswith(f"{path}[")]
+
+    def validate(self, value, diff, exclude_paths):
+        # Different type is a value difference, nothing inside is compared like DeepDiff
+        if self.container_type == None or type(value) != self.container_type:
+            return
+
+        if self.container_type == dict:
+            for key in value:
+                if key in self.children or key in self.excluded_keys:
+                    continue
+                key_path = f"{self.path}['{key}']"
+                if key_path not in exclude_paths:
+                    diff['dictionary_item_added'].append(key_path)
+            for key, child in self.children.items():
+                if key not in value:
+                    diff['dictionary_item_removed'].append(child.path)
+            for key, child in self.children.items():
+                if key in value:
+                    child.validate(value[key], diff, exclude_paths)
+            return
+
+        if self.is_scalar_list and is_scalar_list(value):
+            ddiff = DeepDiff(self.expected, value, exclude_paths=self.item_exclude_paths)
+            for key, item in ddiff.get('iterable_item_added', {}).items():
+                diff['iterable_item_added'][self.path + key[len('root'):]] = item
+            for key, item in ddiff.get('iterable_item_removed', {}).items():
+                diff['iterable_item_removed'][self.path + key[len('root'):]] = item
+            return
+
+        # Array items are compared by position, extra or missing items are reported after the common items
+        for idx in range(min(len(self.items), len(value))):
+            self.items[idx].validate(value[idx], diff, exclude_paths)
+        for idx in range(len(self.items), len(value)):
+            item_path = f"{self.path}[{idx}]"
+            if item_path not in exclude_paths:
+                diff['iterable_item_added'][item_path] = value[idx]
+        for idx in range(len(value), len(self.items)):
+            if self.items[idx].path not in exclude_paths:
+                diff['iterable_item_removed'][self.items[idx].path] = self.expected[idx]
+
+
+class JSONSchemaAssertion:
+    def __init__(self, expected, exclude_paths):
+        self.exclude_paths = frozenset(exclude_paths)
+        self.root = SchemaNode(expected, 'root', self.exclude_paths)
+
+    # Return structural differences using the same keys as DeepDiff result, empty keys are removed
+    def diff(self, response):
+        diff = {
+            'dictionary_item_added': KeyPaths(),
+            'dictionary_item_removed': KeyPaths(),
+            'iterable_item_added': {},
+            'iterable_item_removed': {},
+        }
+        self.root.validate(response, diff, self.exclude_paths)
+        return {key: value for key, value in diff.items() if len(value) > 0}
+
+
+# Assertion of a monitor on the same response body always has the same outcome, so outcome is kept
+# by (monitor id, config version, body hash). Least recently used outcome is evicted when full.
+class AssertionCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.mutex = threading.Lock()
+
+    # Return error message, empty when assertion passed, or None when not cached
+    def get(self, key):
+        with self.mutex:
+            error = self.entries.get(key)
+            if error != None:
+                self.entries.move_to_end(key)
+            return error
+
+    def set(self, key, error):
+        if self.max_size <= 0:
+            return
+        with self.mutex:
+            self.entries[key] = error
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+# Assertion config of a monitor compiled once, expected JSON is parsed when assertion built
+class AssertionSpec:
+    def __init__(self, assertion_type, assertion_value, is_assert_json_schema_only, exclude_paths):
+        self.assertion_type = assertion_type
+        self.assertion_value = assertion_value
+        self.is_assert_json_schema_only = is_assert_json_schema_only
+        self.exclude_paths = exclude_paths
+
+        # Invalid JSON assertion value is reported when assertion run
+        self.assertion_json = None
+        self.is_assertion_json_valid = False
+        if self.assertion_type == 'JSON':
+            try:
+                self.assertion_json = json.loads(self.assertion_value)
+                self.is_assertion_json_valid = True
+            except json.decoder.JSONDecodeError:
+                pass
+
+        # Schema only assertion is validated with compiled schema of the expected JSON
+        self.assertion_schema = None
+        if self.is_assertion_json_valid and self.is_assert_json_schema_only:
+            self.assertion_schema = JSONSchemaAssertion(self.assertion_json, self.exclude_paths)
+
+    # Assertion sent to other process as its source text, compiled again there only once
+    def get_assertion_args(self):
+        return (self.assertion_type, self.assertion_value, self.is_assert_json_schema_only, self.exclude_paths)
+
+
+# Raise AssertionError with message of every failed assertion
+def run_assertions(spec, response):
+    if spec.assertion_type == 'TEXT' and response != spec.assertion_value:
+        raise AssertionError(f'Assertion text failed.\nExpected: "{spec.assertion_value}"\nGot: "{response}"')
+    elif spec.assertion_type == 'PARTIAL' and spec.assertion_value not in response:
+        raise AssertionError(f'Partial Assertion text failed.\nExpected: "{spec.assertion_value}"\nGot: "{response}"')
+    elif spec.assertion_type == 'JSON':
+        try:
+            api_response = json.loads(response) 
+        except json.decoder.JSONDecodeError:
+            raise AssertionError('Failed to decode JSON api response')
+
+        if not spec.is_assertion_json_valid:
+            raise AssertionError('Failed to decode JSON monitor assertions value')
+
+        if spec.is_assert_json_schema_only:
+            ddiff = spec.assertion_schema.diff(api_response)
+        else:
+            ddiff = DeepDiff(spec.assertion_json, api_response, exclude_paths=list(spec.exclude_paths))
+
+        diff_result = ""
+        if not spec.is_assert_json_schema_only:
+            if 'type_changes' in ddiff:
+                for k,v in ddiff['type_changes'].items():
+                    diff_result += f"Different type detected on {k}, expected \"{v['old_value']}\" ({v['old_type']}) but found \"{v['new_value']}\" ({v['new_type']})\n"
+            if 'values_changed' in ddiff:
+                for k,v in ddiff['values_changed'].items():
+                    diff_result += f"Different value detected on {k}, expected \"{v['old_value']}\" but found \"{v['new_value']}\"\n"
+        if 'dictionary_item_added' in ddiff:
+            diff_result += f"New key detected with keys {ddiff['dictionary_item_added']}\n"
+        if 'dictionary_item_removed' in ddiff:
+            diff_result += f"Missing key detected with keys {ddiff['dictionary_item_removed']}\n"
+        if 'iterable_item_added' in ddiff:
+            diff_result += f"Found iterable item added with keys {ddiff['iterable_item_added'].keys()}\n"
+        if 'iterable_item_removed' in ddiff:
+            diff_result += f"Found iterable item removed with keys {ddiff['iterable_item_removed'].keys()}\n"
+
+        if diff_result != "":
+            raise AssertionError(diff_result.strip('\n'))
+
+
+# Assertion specs compiled by assertion process, key is (monitor id, config version)
+PROCESS_SPEC_CACHE_SIZE = 1000
+process_specs = OrderedDict()
+
+
+# Run on assertion process, return error message or empty string like assertion run on cron thread
+def run_assertions_in_process(key, assertion_args, response):
+    spec = process_specs.get(key)
+    if spec == None:
+        spec = AssertionSpec(*assertion_args)
+        process_specs[key] = spec
+        while len(process_specs) > PROCESS_SPEC_CACHE_SIZE:
+            process_specs.popitem(last=False)
+    process_specs.move_to_end(key)
+
+    try:
+        run_assertions(spec, response)
+    except AssertionError as e:
+        return str(e)
+    return ''
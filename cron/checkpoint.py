@@ -0,0 +1,50 @@
+from datetime import datetime, timezone as tzdt
+
+from django.utils import timezone
+
+from apimonitor.models import APIMonitor
+from cron.models import CronCheckpoint
+from cron.work_queue import BATCH_SIZE
+
+CHECKPOINT_NAME = 'run_cron'
+
+
+# Snapshot is stored as {"monitors": {id: [last run, next run]}, "pending": [id, ...]} with epoch timestamp
+def save_checkpoint(schedule_state, pending_monitor_ids):
+    monitors = {}
+    for monitor_id, (last_run, next_run) in schedule_state.items():
+        monitors[str(monitor_id)] = [last_run.timestamp(), next_run.timestamp()]
+
+    CronCheckpoint.objects.update_or_create(name=CHECKPOINT_NAME, defaults={
+        'data': {
+            'monitors': monitors,
+            'pending': list(pending_monitor_ids),
+        },
+        'saved_at': timezone.now(),
+    })
+
+
+# Return schedule state and pending monitor ids, or None when cron never saved any checkpoint
+def load_checkpoint():
+    checkpoint = CronCheckpoint.objects.filter(name=CHECKPOINT_NAME).first()
+    if checkpoint == None:
+        return None
+
+    schedule_state = {}
+    for monitor_id, (last_run, next_run) in checkpoint.data.get('monitors', {}).items():
+        schedule_state[int(monitor_id)] = (
+            datetime.fromtimestamp(last_run, tz=tzdt.utc),
+            datetime.fromtimestamp(next_run, tz=tzdt.utc),
+        )
+    return schedule_state, checkpoint.data.get('pending', [])
+
+
+# Only monitors without next run time take their next run from checkpoint,
+# next run time on database is always newer than checkpoint
+def restore_next_run_at(schedule_state):
+    monitors = []
+    for monitor_id in APIMonitor.objects.filter(next_run_at=None).values_list('id', flat=True):
+        if monitor_id in schedule_state:
+            monitors.append(APIMonitor(id=monitor_id, next_run_at=schedule_state[monitor_id][1]))
+
+    APIMonitor.objects.bulk_update(monitors, ['next_run_at'], batch_size=BATCH_SIZE)
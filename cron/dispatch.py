@@ -0,0 +1,113 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+# Blocking queue of monitor ids ordered by due time, most overdue monitor is taken first.
+# Monitor which still waiting on queue is not queued twice, closed queue wake up all waiting worker.
+class DispatchQueue:
+    def __init__(self):
+        self.mutex = threading.Lock()
+        self.not_empty = threading.Condition(self.mutex)
+        self.all_tasks_done = threading.Condition(self.mutex)
+        self.heap = []
+        self.deferred = []
+        self.queued = set()
+        self.counter = itertools.count()
+        self.unfinished_tasks = 0
+        self.closed = False
+
+    # Return False when monitor is already queued
+    def put(self, monitor_id, due_at=None):
+        # Monitor without due time (resumed or claimed from database) is taken before scheduled one
+        priority = due_at.timestamp() if due_at != None else 0
+        with self.mutex:
+            if monitor_id in self.queued:
+                return False
+            self.queued.add(monitor_id)
+            heapq.heappush(self.heap, (priority, next(self.counter), monitor_id))
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+            return True
+
+    # Put monitor taken by worker back to queue after delay, monitor is still counted as unfinished
+    def defer(self, monitor_id, delay, due_at=None):
+        priority = due_at.timestamp() if due_at != None else 0
+        with self.mutex:
+            if monitor_id in self.queued:
+                self.task_done_locked()
+                return False
+            self.queued.add(monitor_id)
+            heapq.heappush(self.deferred, (time.monotonic() + delay, priority, next(self.counter), monitor_id))
+            self.not_empty.notify()
+            return True
+
+    def release_deferred_locked(self):
+        now = time.monotonic()
+        while len(self.deferred) > 0 and self.deferred[0][0] <= now:
+            _, priority, count, monitor_id = heapq.heappop(self.deferred)
+            heapq.heappush(self.heap, (priority, count, monitor_id))
+
+    # Block until monitor available, return None when queue closed and empty
+    def get(self):
+        with self.not_empty:
+            while True:
+                self.release_deferred_locked()
+                if len(self.heap) > 0:
+                    break
+                if self.closed and len(self.deferred) == 0:
+                    return None
+
+                timeout = None
+                if len(self.deferred) > 0:
+                    timeout = self.deferred[0][0] - time.monotonic()
+                self.not_empty.wait(timeout)
+            _, _, monitor_id = heapq.heappop(self.heap)
+            self.queued.discard(monitor_id)
+            return monitor_id
+
+    def task_done(self):
+        with self.all_tasks_done:
+            self.task_done_locked()
+
+    def task_done_locked(self):
+        if self.unfinished_tasks <= 0:
+            raise ValueError('task_done() called too many times')
+        self.unfinished_tasks -= 1
+        if self.unfinished_tasks == 0:
+            self.all_tasks_done.notify_all()
+
+    # Wait until all monitors done, return False when timeout reached first
+    def join(self, timeout=None):
+        with self.all_tasks_done:
+            return self.all_tasks_done.wait_for(lambda: self.unfinished_tasks == 0, timeout)
+
+    # Remove and return all monitors which are not taken by worker yet
+    def drain(self):
+        with self.mutex:
+            monitor_ids = self.pending_locked()
+            self.heap = []
+            self.deferred = []
+            self.queued.clear()
+            self.unfinished_tasks -= len(monitor_ids)
+            if self.unfinished_tasks == 0:
+                self.all_tasks_done.notify_all()
+            return monitor_ids
+
+    def pending(self):
+        with self.mutex:
+            return self.pending_locked()
+
+    def pending_locked(self):
+        deferred = [(priority, count, monitor_id) for _, priority, count, monitor_id in self.deferred]
+        return [monitor_id for _, _, monitor_id in sorted(self.heap + deferred)]
+
+    def qsize(self):
+        with self.mutex:
+            return len(self.heap)
+
+    def close(self):
+        with self.not_empty:
+            self.closed = True
+            self.not_empty.notify_all()
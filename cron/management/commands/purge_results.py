@@ -0,0 +1,77 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apimonitor.models import APIMonitor
+from apimonitor.partitions import drop_result_partitions
+from cron.retention import get_longest_retention_days, load_team_retention, purge_monitor_results, purge_monitor_rollups, purge_orphan_blobs, \
+    purge_stale_notifications
+from login.models import Team
+
+# Longest alert time window (24H), older result notification cannot change any alert
+NOTIFICATION_RETENTION = timedelta(days=1)
+
+
+class Command(BaseCommand):
+    help = 'Purge API monitor results older than retention of each team'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to wait between deleted chunks')
+    
+    def get_cutoff(self, now, days):
+        if days == 0:
+            return None
+        return now - timedelta(days=days)
+    
+    def handle(self, *args, **kwargs):
+        chunk_size = kwargs['chunk_size']
+        sleep = kwargs['sleep']
+        
+        # Retention in days, 0 means kept forever
+        default_retention = (
+            int(os.environ.get('CRON_SUCCESS_RETENTION_DAYS', 30)),
+            int(os.environ.get('CRON_FAILURE_RETENTION_DAYS', 90)),
+            int(os.environ.get('CRON_ROLLUP_RETENTION_DAYS', 365)),
+        )
+        team_retention = load_team_retention(default_retention)
+        
+        now = timezone.now()
+        
+        # Partition older than every retention is dropped at once instead of deleting its rows
+        longest_retention_days = get_longest_retention_days(default_retention, team_retention)
+        if longest_retention_days != None:
+            for name in drop_result_partitions(now - timedelta(days=longest_retention_days)):
+                print(f"[{timezone.now()}] Dropped result partition {name}")
+        
+        total_count = 0
+        total_bytes = 0
+        total_rollup_count = 0
+        for team_id in Team.objects.values_list('id', flat=True):
+            success_days, failure_days, rollup_days = team_retention.get(team_id, default_retention)
+            success_cutoff = self.get_cutoff(now, success_days)
+            failure_cutoff = self.get_cutoff(now, failure_days)
+            rollup_cutoff = self.get_cutoff(now, rollup_days)
+            
+            team_count = 0
+            team_bytes = 0
+            for monitor_id in APIMonitor.objects.filter(team_id=team_id).values_list('id', flat=True):
+                for success, cutoff in [(True, success_cutoff), (False, failure_cutoff)]:
+                    if cutoff == None:
+                        continue
+                    deleted_count, deleted_bytes = purge_monitor_results(monitor_id, success, cutoff, chunk_size, sleep)
+                    team_count += deleted_count
+                    team_bytes += deleted_bytes
+                if rollup_cutoff != None:
+                    total_rollup_count += purge_monitor_rollups(monitor_id, rollup_cutoff, chunk_size, sleep)
+            
+            if team_count > 0:
+                print(f"[{timezone.now()}] Purged {team_count} results ({team_bytes} bytes) of team id:{team_id}")
+            total_count += team_count
+            total_bytes += team_bytes
+        
+        blob_count, blob_bytes = purge_orphan_blobs(chunk_size, sleep)
+        notification_count = purge_stale_notifications(now - NOTIFICATION_RETENTION, chunk_size, sleep)
+        print(f"[{timezone.now()}] Purged {total_count} results, {total_rollup_count} rollups, {blob_count} response blobs and {notification_count} result notifications, reclaimed {total_bytes + blob_bytes} bytes")
@@ -2,16 +2,38 @@ import os
 import requests
 import time
 import threading
-import queue
-import re
 import json
+import asyncio
+import aiohttp
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import timedelta
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from django.core.management.base import BaseCommand
-from deepdiff import DeepDiff
 
-from apimonitor.models import APIMonitor, APIMonitorBodyForm, APIMonitorHeader, APIMonitorQueryParam, APIMonitorRawBody, APIMonitorResult, AssertionExcludeKey
+from apimonitor.models import APIMonitorResult
+from apimonitor.partitions import get_result_partition_config, ensure_result_partitions
+from cron.work_queue import (get_worker_id, schedule_due_monitors, enqueue_due_monitors, claim_work_items,
+                             complete_work_item, release_work_items, fill_next_run_at_from_last_result,
+                             get_next_due_at, get_config_versions)
+from cron.checkpoint import save_checkpoint, load_checkpoint, restore_next_run_at
+from cron.dispatch import DispatchQueue
+from cron.ratelimit import HostLimiter, load_team_limits
+from cron.probe_spec import ProbeSpecCache
+from cron.template import CompiledTemplate, compile_key, resolve_key, MISSING
+from cron.response_body import ResponseBody, read_response_body, async_read_response_body
+from cron.result_writer import ResultWriter
+from cron.pipeline import PipelineStage
+from cron.step_cache import StepResultCache
+from cron.timing_connector import TimingTCPConnector, tls_time_var
+from cron.timing_connection import install_timing_connections, start_request_timing, stop_request_timing
+from cron.assertions import AssertionCache, run_assertions, run_assertions_in_process
+from monapi.session_pool import session_pool
 
 # Mock this function to interrupt the cron function
 def mock_cron_interrupt():
@@ -20,277 +42,632 @@ def mock_cron_interrupt():
 class Command(BaseCommand):
     help = 'Run API Monitor Cron'
     
-    q = queue.Queue()
-    stop_signal = threading.Event()
-    
-    def get_monitor_id_from_queue(self):
-        while True:
-            try:
-                monitor_id = self.q.get(block=False)
-                return monitor_id
-            except queue.Empty:
-                if self.stop_signal.is_set():
-                    return None
-            time.sleep(0.2)
+    q = DispatchQueue()
+    host_limiter = HostLimiter()
+    probe_specs = ProbeSpecCache()
+    step_results = StepResultCache(0)
+    assertion_results = AssertionCache(0)
+    max_body_size = 1048576
+    result_writer = None
+    assertion_stage = None
+    assertion_pool = None
+    assertion_pool_mutex = threading.Lock()
+    assertion_process_count = 0
+    claim_stop_signal = threading.Event()
+    work_queue_worker_id = None
     
     # Access dictionary with key a.b.c or a.b.c[0] or a.b[0].c
     def access_dict_with_key(self, key, source):
-        key_part = key.split('.', 1)
-        current_key = key_part[0]
-        res = None
-        
-        if not isinstance(source, dict):
+        value = resolve_key(compile_key(key), source)
+        if value is MISSING:
             return False
-        
-        array_idx = re.findall("\[\d\]$", current_key)
-        if len(array_idx) == 1:
-            current_key = current_key.replace(array_idx[0], '')
-            if current_key not in source:
-                return False
-            
-            if not isinstance(source[current_key], list):
-                return False
-            
-            array_idx_num = int(array_idx[0].strip('[]'))
-            if len(source[current_key]) < array_idx_num + 1:
-                return False
-            
-            res = source[current_key][array_idx_num]
-        else:
-            if current_key not in source:
-                return False
-            
-            res = source[current_key]
-            
-        if len(key_part) > 1:
-            return self.access_dict_with_key(key_part[1], res)
-        return str(res)
+        return value
 
     def replace_string_with_json_result(self, text, dict):
-        if dict is None:
-            return text
-
-        result = re.findall("{{.+?}}", text)
-        for match in result:
-            key = match.strip("{}")
-            value = self.access_dict_with_key(key, dict)
-            if value == False:
-                raise KeyError(f"Value not found while accessing with key \"{key}\"")
-            text = text.replace(match, value)
-        return text
-
-    def run_api_monitor_assertions(self, monitor_id, response):
-        monitor = APIMonitor.objects.get(id=monitor_id)
-        if monitor.assertion_type == 'TEXT' and response != monitor.assertion_value:
-            raise AssertionError(f'Assertion text failed.\nExpected: "{monitor.assertion_value}"\nGot: "{response}"')
-        elif monitor.assertion_type == 'PARTIAL' and monitor.assertion_value not in response:
-            raise AssertionError(f'Partial Assertion text failed.\nExpected: "{monitor.assertion_value}"\nGot: "{response}"')
-        elif monitor.assertion_type == 'JSON':
-            try:
-                api_response = json.loads(response) 
-            except json.decoder.JSONDecodeError:
-                raise AssertionError('Failed to decode JSON api response')
-            
-            try:
-                assertion_value = json.loads(monitor.assertion_value)
-            except json.decoder.JSONDecodeError:
-                raise AssertionError('Failed to decode JSON monitor assertions value')
-            
-            # Assertion exclude keys
-            ddiff_exclude_path = []
-            exclude_keys = AssertionExcludeKey.objects.filter(monitor=monitor)
-            for key in exclude_keys:
-                key = key.exclude_key.split('.')
-                res_key = 'root'
-                for key_part in key:
-                    array_idx = re.findall("\[[\d]\]$", key_part)
-                    if len(array_idx) == 1:
-                        key_part = key_part.replace(array_idx[0], '')
-                        res_key += f"['{key_part}']{array_idx[0]}"
-                    else:
-                        res_key += f"['{key_part}']"
-                ddiff_exclude_path.append(res_key)
-            
-            ddiff = DeepDiff(assertion_value, api_response, exclude_paths=ddiff_exclude_path)
-            
-            diff_result = ""
-            if not monitor.is_assert_json_schema_only:
-                if 'type_changes' in ddiff:
-                    for k,v in ddiff['type_changes'].items():
-                        diff_result += f"Different type detected on {k}, expected \"{v['old_value']}\" ({v['old_type']}) but found \"{v['new_value']}\" ({v['new_type']})\n"
-                if 'values_changed' in ddiff:
-                    for k,v in ddiff['values_changed'].items():
-                        diff_result += f"Different value detected on {k}, expected \"{v['old_value']}\" but found \"{v['new_value']}\"\n"
-            if 'dictionary_item_added' in ddiff:
-                diff_result += f"New key detected with keys {ddiff['dictionary_item_added']}\n"
-            if 'dictionary_item_removed' in ddiff:
-                diff_result += f"Missing key detected with keys {ddiff['dictionary_item_removed']}\n"
-            if 'iterable_item_added' in ddiff:
-                diff_result += f"Found iterable item added with keys {ddiff['iterable_item_added'].keys()}\n"
-            if 'iterable_item_removed' in ddiff:
-                diff_result += f"Found iterable item removed with keys {ddiff['iterable_item_removed'].keys()}\n"
-
-            if diff_result != "":
-                raise AssertionError(diff_result.strip('\n'))
+        return CompiledTemplate(text).render(dict)
+
+    def run_api_monitor_assertions(self, monitor, response):
+        run_assertions(monitor, response)
             
-    def run_api_monitor_request(self, monitor_id, monitor_history):
-        monitor_history.append(monitor_id)
-        
-        monitor = APIMonitor.objects.get(id=monitor_id)
-        previous_json = None
+    # Load monitor with all of its previous steps, the last step on the list is executed first.
+    # Steps are cached across runs so they can run without ORM access.
+    def load_api_monitor_steps(self, monitor_id):
+        return self.probe_specs.get(monitor_id)
+
+    def create_failed_result(self, monitor, log_error):
         result = APIMonitorResult(
-            monitor=monitor,
+            monitor_id=monitor.id,
             success=False,
             status_code=-1,
             log_response="",
-            log_error="",
+            log_error=log_error,
         )
+        # (monitor, response, body hash) of assertion evaluated by assertion stage before result saved
+        result.pending_assertion = None
+        return result
         
-        # Run previous step of api monitor
-        if monitor.previous_step != None:
-            # Limit 10 monitor
-            if len(monitor_history) >= 10:
-                return APIMonitorResult(
-                    monitor=monitor,
-                    success=False,
-                    status_code=-1,
-                    log_response="",
-                    log_error=f"Depth limit of previous step API monitor reached (maximum: 10)"
-                )
+    # Propagate failure of step on given depth up to the root monitor
+    def create_previous_step_failed_result(self, steps, depth, result):
+        for idx in range(depth - 1, -1, -1):
+            result = self.create_failed_result(steps[idx], f"Error on previous step: {steps[idx + 1].name}\n" + result.log_error)
+        return result
                 
-            # Check if infinite recursion on api monitor detected
-            if monitor.previous_step.id in monitor_history:
-                return APIMonitorResult(
-                    monitor=monitor,
-                    success=False,
-                    status_code=-1,
-                    log_response="",
-                    log_error=f"Request aborted due to recursion of API monitor steps"
-                )
+    def prepare_api_monitor_request(self, monitor, previous_json):
+        # Prepare headers
+        request_headers = {}
+        for key, value in monitor.headers:
+            request_headers[key.render(previous_json)] = value.render(previous_json)
                 
-            prev_result = self.run_api_monitor_request(monitor.previous_step.id, monitor_history)
-            if not prev_result.success:
-                return APIMonitorResult(
-                    monitor=monitor,
-                    success=False,
-                    status_code=result.status_code,
-                    log_response=result.log_response,
-                    log_error=f"Error on previous step: {prev_result.monitor.name}\n" + prev_result.log_error,
-                )
+        # Prepare request body
+        request_body = {}
+        if monitor.body_type == 'FORM':
+            for key, value in monitor.body_form:
+                request_body[key.render(previous_json)] = value.render(previous_json)
+        elif monitor.body_type == 'RAW' and monitor.raw_body != None:
+            request_body = monitor.raw_body.render(previous_json)
+        elif monitor.body_type == 'EMPTY':
+            request_body = None
                 
-            # Extract json from log response if possible
-            try:
-                previous_json = json.loads(prev_result.log_response)
-            except json.decoder.JSONDecodeError:
-                pass
+        # Prepare query params
+        request_params = {}
+        for key, value in monitor.query_params:
+            request_params[key.render(previous_json)] = value.render(previous_json)
         
-        try:
-            # Prepare headers
-            request_headers = {}
-            headers = APIMonitorHeader.objects.filter(monitor=monitor)
-            for header in headers:
-                header_key = self.replace_string_with_json_result(header.key, previous_json)
-                header_value = self.replace_string_with_json_result(header.value, previous_json)
-                request_headers[header_key] = header_value
-                
-            # Prepare request body
-            request_body = {}
-            if monitor.body_type == 'FORM':
-                forms = APIMonitorBodyForm.objects.filter(monitor=monitor)
-                for form in forms:
-                    form_key = self.replace_string_with_json_result(form.key, previous_json)
-                    form_value = self.replace_string_with_json_result(form.value, previous_json)
-                    request_body[form_key] = form_value
-            elif monitor.body_type == 'RAW':
-                try:
-                    raw_body = APIMonitorRawBody.objects.get(monitor=monitor)
-                    request_body = self.replace_string_with_json_result(raw_body.body, previous_json)
-                except APIMonitorRawBody.DoesNotExist:
-                    pass
-            elif monitor.body_type == 'EMPTY':
-                request_body = None
+        return {
+            'headers': request_headers,
+            'body': request_body,
+            'params': request_params,
+        }
                 
-            # Prepare query params
-            request_params = {}
-            query_params = APIMonitorQueryParam.objects.filter(monitor=monitor)
-            for param in query_params:
-                params_key = self.replace_string_with_json_result(param.key, previous_json)
-                params_value =  self.replace_string_with_json_result(param.value, previous_json)
-                request_params[params_key] = params_value
-        except KeyError as e:
-            return APIMonitorResult(
-                monitor=monitor,
-                success=False,
-                status_code=result.status_code,
-                log_response=result.log_response,
-                log_error=f"Error while preparing API monitor params: {str(e)}\n" + result.log_error,
-            )
+    def send_api_monitor_request(self, monitor, request):
+        # Reuse keep alive connection from shared pool, otherwise measure cold connection on every run
+        if monitor.is_reuse_connection:
+            data = request['body'] if monitor.method != 'GET' else None
+            return session_pool.request(monitor.method, monitor.url, params=request['params'], data=data, headers=request['headers'], timeout=30, stream=True)
+        
+        # Body is streamed so large response is not fully kept in memory
+        if monitor.method == 'GET':
+            return requests.get(monitor.url, params=request['params'], headers=request['headers'], timeout=30, stream=True)
+        elif monitor.method == 'POST':
+            return requests.post(monitor.url, params=request['params'], data=request['body'], headers=request['headers'], timeout=30, stream=True)
+        elif monitor.method == 'PATCH':
+            return requests.patch(monitor.url, params=request['params'], data=request['body'], headers=request['headers'], timeout=30, stream=True)
+        elif monitor.method == 'PUT':
+            return requests.put(monitor.url, params=request['params'], data=request['body'], headers=request['headers'], timeout=30, stream=True)
+        elif monitor.method == 'DELETE':
+            return requests.delete(monitor.url, params=request['params'], data=request['body'], headers=request['headers'], timeout=30, stream=True)
+        return None
                 
-        resp = None
+    async def async_send_api_monitor_request(self, sessions, monitor, request, keep_size):
+        data = None
+        if monitor.method != 'GET':
+            data = request['body']
+        
+        # Send the same request as requests on thread mode, it send no body for empty form and only
+        # add content type to form body, aiohttp add text/plain to raw body and octet-stream to no body
+        if data == {}:
+            data = None
+        skip_auto_headers = None
+        if type(data) != dict and 'content-type' not in [key.lower() for key in request['headers']]:
+            skip_auto_headers = ('Content-Type',)
+        
+        session = sessions['reuse'] if monitor.is_reuse_connection else sessions['cold']
+        trace_events = {}
+        async with session.request(monitor.method, monitor.url, params=request['params'], data=data,
+                                   headers=request['headers'], skip_auto_headers=skip_auto_headers,
+                                   timeout=aiohttp.ClientTimeout(total=30), trace_request_ctx=trace_events) as resp:
+            body = await async_read_response_body(resp, keep_size)
+            return resp.status, body, self.get_trace_timing(trace_events, time.perf_counter())
+    
+    # Record time of aiohttp request events to trace request context
+    def create_trace_config(self):
+        def record(event_name):
+            async def on_event(session, context, params):
+                context.trace_request_ctx[event_name] = time.perf_counter()
+            return on_event
+        
+        # TLS handshake time is set by timing connector while creating connection
+        async def on_connection_create_start(session, context, params):
+            tls_time_var.set(None)
+            context.trace_request_ctx['connect_start'] = time.perf_counter()
+        
+        async def on_connection_create_end(session, context, params):
+            context.trace_request_ctx['connect_end'] = time.perf_counter()
+            if tls_time_var.get() != None:
+                context.trace_request_ctx['tls_time'] = tls_time_var.get()
+        
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_dns_resolvehost_start.append(record('dns_start'))
+        trace_config.on_dns_resolvehost_end.append(record('dns_end'))
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_request_headers_sent.append(record('headers_sent'))
+        trace_config.on_request_end.append(record('headers_received'))
+        return trace_config
+    
+    # Convert trace events to phase timing in miliseconds, reused connection have no dns, connect and tls time
+    def get_trace_timing(self, events, read_end):
+        timing = {}
+        dns_time = 0
+        if 'dns_start' in events and 'dns_end' in events:
+            dns_time = (events['dns_end'] - events['dns_start']) * 1000
+            timing['dns_time'] = dns_time
+        if 'connect_start' in events and 'connect_end' in events:
+            # DNS is resolved and TLS handshake done while creating connection
+            timing['connect_time'] = (events['connect_end'] - events['connect_start']) * 1000 - dns_time
+            if 'tls_time' in events:
+                timing['tls_time'] = events['tls_time']
+                timing['connect_time'] -= events['tls_time']
+        if 'headers_sent' in events and 'headers_received' in events:
+            timing['first_byte_time'] = (events['headers_received'] - events['headers_sent']) * 1000
+        if 'headers_received' in events:
+            timing['download_time'] = (read_end - events['headers_received']) * 1000
+        return timing
+    
+    # Connection phases are recorded by timing connection, reused connection have no dns, connect and tls time.
+    # requests measure time until response headers received, body is downloaded after that.
+    def get_response_timing(self, resp, request_time, events):
+        timing = dict(events)
+        elapsed = getattr(resp, 'elapsed', None)
+        if elapsed != None:
+            timing['download_time'] = max(request_time - elapsed.total_seconds() * 1000, 0)
+        return timing
+    
+    def set_result_timing(self, result, prepare_time, timing):
+        result.prepare_time = prepare_time
+        for field, value in timing.items():
+            setattr(result, field, value)
+        
+    def get_max_body_size(self, monitor):
+        if monitor.max_body_size > 0:
+            return monitor.max_body_size
+        return self.max_body_size
+    
+    # Whole body is needed for assertions and by monitors using this monitor as previous step,
+    # otherwise only stored part of the body is read
+    def get_keep_size(self, monitor):
+        if monitor.assertion_type != 'DISABLED' or monitor.is_previous_step:
+            return None
+        return self.get_max_body_size(monitor)
+    
+    def set_result_body(self, result, monitor, body):
+        result.response_size = body.size
+        result.response_hash = body.get_hash()
+        result.is_response_partial = body.is_partial
+        max_body_size = self.get_max_body_size(monitor)
+        if body.kept_size > max_body_size:
+            result.log_response = body.get_content()[:max_body_size].decode('utf-8', errors='ignore')
+        
+    # Return error message, empty when assertion passed. Assertion process return the same message.
+    def create_assertion_pool(self, process_count):
+        self.assertion_process_count = process_count
+        self.assertion_pool = ProcessPoolExecutor(process_count, mp_context=multiprocessing.get_context('spawn'))
+    
+    # Pool is unusable once any of its process died, replace it so next assertions run on process again
+    def replace_broken_assertion_pool(self, pool):
+        with self.assertion_pool_mutex:
+            if self.assertion_pool is not pool:
+                return
+            print(f"[{timezone.now()}] Assertion process pool broken, creating new pool")
+            pool.shutdown(wait=False)
+            self.create_assertion_pool(self.assertion_process_count)
+    
+    def evaluate_api_monitor_assertions(self, monitor, response):
+        pool = self.assertion_pool
+        if pool != None and monitor.assertion_type != 'DISABLED':
+            key = (monitor.id, monitor.config_version)
+            try:
+                return pool.submit(run_assertions_in_process, key, monitor.get_assertion_args(), response).result()
+            except BrokenProcessPool:
+                # Assertion of this result run on current thread instead
+                self.replace_broken_assertion_pool(pool)
         
         try:
-            if monitor.method == 'GET':
-                resp = requests.get(monitor.url, params=request_params, headers=request_headers, timeout=30)
-            elif monitor.method == 'POST':
-                resp = requests.post(monitor.url, params=request_params, data=request_body, headers=request_headers, timeout=30)
-            elif monitor.method == 'PATCH':
-                resp = requests.patch(monitor.url, params=request_params, data=request_body, headers=request_headers, timeout=30)
-            elif monitor.method == 'PUT':
-                resp = requests.put(monitor.url, params=request_params, data=request_body, headers=request_params, timeout=30)
-            elif monitor.method == 'DELETE':
-                resp = requests.delete(monitor.url, params=request_params, data=request_body, headers=request_headers, timeout=30)
-        except Exception as e:
-            result.log_error = str(e)
+            self.run_api_monitor_assertions(monitor, response)
+        except AssertionError as e:
+            return str(e)
+        return ''
+    
+    # Assertion outcome is reused while monitor config and response body stay the same
+    def check_api_monitor_assertions(self, monitor, response, body_hash):
+        key = (monitor.id, monitor.config_version, body_hash)
+        error = None
+        if body_hash != None:
+            error = self.assertion_results.get(key)
+        if error == None:
+            error = self.evaluate_api_monitor_assertions(monitor, response)
+            if body_hash != None:
+                self.assertion_results.set(key, error)
+        return error
         
-        if resp is not None:
-            if resp.status_code >= 200 and resp.status_code <= 299:
+    def create_api_monitor_result(self, monitor, status_code, content, log_error, is_root, body_hash=None):
+        result = self.create_failed_result(monitor, log_error)
+        if status_code != None:
+            if status_code >= 200 and status_code <= 299:
                 result.success = True
             else:
                 result.log_error += 'Error code not in acceptable range 2xx'
-            result.log_response = resp.content.decode('utf-8', errors='ignore')
-            result.status_code = resp.status_code
+            result.log_response = content.decode('utf-8', errors='ignore')
+            result.status_code = status_code
             
         # Run assertions only when successful and only on root monitor
-        if result.success and len(monitor_history) == 1:
-            try:
-                self.run_api_monitor_assertions(monitor.id, result.log_response)
-            except AssertionError as e:
-                result.success = False
-                result.log_error = str(e)
-                
+        if result.success and is_root:
+            if self.assertion_stage != None and monitor.assertion_type != 'DISABLED':
+                result.pending_assertion = (monitor, result.log_response, body_hash)
+            else:
+                self.run_result_assertions(result, monitor, result.log_response, body_hash)
         return result
     
+    def run_result_assertions(self, result, monitor, response, body_hash):
+        start = time.perf_counter()
+        error = self.check_api_monitor_assertions(monitor, response, body_hash)
+        if error != '':
+            result.success = False
+            result.log_error = error
+        result.assertion_time = (time.perf_counter() - start) * 1000
+    
+    # Handler of assertion stage, asserted result continue to persistence stage
+    def assert_result(self, result):
+        monitor, response, body_hash = result.pending_assertion
+        result.pending_assertion = None
+        # Result is still written when assertion crash, otherwise the probe is lost silently
+        try:
+            self.run_result_assertions(result, monitor, response, body_hash)
+        except Exception as e:
+            result.success = False
+            result.log_error = str(e)
+        self.write_result(result)
+    
+    def get_previous_json(self, result):
+        # Extract json from log response if possible
+        try:
+            return json.loads(result.log_response)
+        except json.decoder.JSONDecodeError:
+            return None
+
+    # Result waiting for assertion go to assertion stage first, network worker does not wait for it
+    def save_result(self, result):
+        if result.pending_assertion != None:
+            self.assertion_stage.put(result)
+            return
+        self.write_result(result)
+    
+    # Results are written in batches by result writer when cron is running
+    def write_result(self, result):
+        if self.result_writer != None:
+            self.result_writer.put(result)
+            return
+        
+        # Identical response bodies of results are stored once
+        with transaction.atomic():
+            result.store_log_response()
+            result.save()
+
+    def get_step_key(self, monitor):
+        return (monitor.id, monitor.config_version)
+
+    # Monitor result cache ttl override default freshness window of cron
+    def get_step_ttl(self, monitor):
+        if monitor.result_cache_ttl > 0:
+            return monitor.result_cache_ttl
+        return None
+
+    # Cached previous step might hold expired credential (e.g. login token), run it again once
+    def is_previous_step_expired(self, status_code, is_previous_cached, is_retry):
+        return status_code in (401, 403) and is_previous_cached and not is_retry
+
+    # Run monitor on given depth of steps after its previous step, return (chain result, own result).
+    # Chain result only check status code and used by next step, own result is recorded for the monitor.
+    def run_api_monitor_step(self, steps, depth, is_retry=False):
+        previous_json = None
+        is_previous_cached = False
+        if depth < len(steps) - 1:
+            (previous_result, _, _), is_previous_new = self.get_step_result(steps, depth + 1, False)
+            is_previous_cached = not is_previous_new
+            if not previous_result.success:
+                result = self.create_previous_step_failed_result(steps[depth:], 1, previous_result)
+                return result, result
+            previous_json = self.get_previous_json(previous_result)
+
+        start = time.perf_counter()
+        monitor = steps[depth]
+        try:
+            request = self.prepare_api_monitor_request(monitor, previous_json)
+        except KeyError as e:
+            result = self.create_failed_result(monitor, f"Error while preparing API monitor params: {str(e)}\n")
+            return result, result
+
+        status_code, body, log_error, timing = None, ResponseBody(), "", {}
+        prepare_time = (time.perf_counter() - start) * 1000
+        try:
+            request_start = time.perf_counter()
+            timing_events = start_request_timing()
+            resp = self.send_api_monitor_request(monitor, request)
+            if resp is not None:
+                status_code = resp.status_code
+                body = read_response_body(resp, self.get_keep_size(monitor))
+                timing = self.get_response_timing(resp, (time.perf_counter() - request_start) * 1000, timing_events)
+        except Exception as e:
+            log_error = str(e)
+        finally:
+            stop_request_timing()
+
+        if self.is_previous_step_expired(status_code, is_previous_cached, is_retry):
+            self.step_results.invalidate(self.get_step_key(steps[depth + 1]))
+            return self.run_api_monitor_step(steps, depth, True)
+
+        content = body.get_content()
+        chain_result = self.create_api_monitor_result(monitor, status_code, content, log_error, False)
+        result = self.create_api_monitor_result(monitor, status_code, content, log_error, True, body.get_hash())
+        self.set_result_timing(result, prepare_time, timing)
+        if status_code != None:
+            self.set_result_body(result, monitor, body)
+        return chain_result, result
+
+    # Step shared by many monitors run once per freshness window, result of previous step is recorded
+    # for its own monitor too. Return ((chain result, own result, is_root), is_new).
+    def get_step_result(self, steps, depth, is_root):
+        def run():
+            execution_time = timezone.localtime()
+            start = time.perf_counter()
+            chain_result, result = self.run_api_monitor_step(steps, depth)
+            
+            # Root result is saved by worker
+            if not is_root:
+                result.execution_time = execution_time
+                result.response_time = (time.perf_counter() - start) * 1000
+                self.save_result(result)
+            return chain_result, result, is_root
+        
+        # Only step used by other monitor is shared, result of other monitor is not kept in memory
+        monitor = steps[depth]
+        if not monitor.is_previous_step:
+            return run(), True
+        return self.step_results.get_or_run(self.get_step_key(monitor), run, is_root, self.get_step_ttl(monitor))
+
+    # Return None when monitor already run and recorded as previous step of other monitor
+    def run_api_monitor_request(self, monitor_id):
+        steps, error = self.load_api_monitor_steps(monitor_id)
+        if error != None:
+            return self.create_previous_step_failed_result(steps, len(steps) - 1, self.create_failed_result(steps[-1], error))
+
+        (_, result, _), is_new = self.get_step_result(steps, 0, True)
+        if not is_new:
+            return None
+        return result
+
+    async def async_run_api_monitor_step(self, sessions, steps, depth, is_retry=False):
+        previous_json = None
+        is_previous_cached = False
+        if depth < len(steps) - 1:
+            (previous_result, _, _), is_previous_new = await self.async_get_step_result(sessions, steps, depth + 1, False)
+            is_previous_cached = not is_previous_new
+            if not previous_result.success:
+                result = self.create_previous_step_failed_result(steps[depth:], 1, previous_result)
+                return result, result
+            previous_json = self.get_previous_json(previous_result)
+
+        start = time.perf_counter()
+        monitor = steps[depth]
+        try:
+            request = self.prepare_api_monitor_request(monitor, previous_json)
+        except KeyError as e:
+            result = self.create_failed_result(monitor, f"Error while preparing API monitor params: {str(e)}\n")
+            return result, result
+
+        status_code, body, log_error, timing = None, ResponseBody(), "", {}
+        prepare_time = (time.perf_counter() - start) * 1000
+        try:
+            status_code, body, timing = await self.async_send_api_monitor_request(sessions, monitor, request, self.get_keep_size(monitor))
+        except asyncio.TimeoutError:
+            log_error = "Request timed out."
+        except Exception as e:
+            log_error = str(e)
+
+        if self.is_previous_step_expired(status_code, is_previous_cached, is_retry):
+            self.step_results.invalidate(self.get_step_key(steps[depth + 1]))
+            return await self.async_run_api_monitor_step(sessions, steps, depth, True)
+
+        content = body.get_content()
+        chain_result = self.create_api_monitor_result(monitor, status_code, content, log_error, False)
+        result = self.create_api_monitor_result(monitor, status_code, content, log_error, True, body.get_hash())
+        self.set_result_timing(result, prepare_time, timing)
+        if status_code != None:
+            self.set_result_body(result, monitor, body)
+        return chain_result, result
+
+    async def async_get_step_result(self, sessions, steps, depth, is_root):
+        async def run():
+            execution_time = timezone.localtime()
+            start = time.perf_counter()
+            chain_result, result = await self.async_run_api_monitor_step(sessions, steps, depth)
+            
+            # Root result is saved by worker
+            if not is_root:
+                result.execution_time = execution_time
+                result.response_time = (time.perf_counter() - start) * 1000
+                await sync_to_async(self.save_result, thread_sensitive=False)(result)
+            return chain_result, result, is_root
+        
+        # Only step used by other monitor is shared, result of other monitor is not kept in memory
+        monitor = steps[depth]
+        if not monitor.is_previous_step:
+            return await run(), True
+        return await self.step_results.async_get_or_run(self.get_step_key(monitor), run, is_root, self.get_step_ttl(monitor))
+
+    async def async_run_api_monitor_request(self, sessions, monitor_id):
+        steps, error = await sync_to_async(self.load_api_monitor_steps, thread_sensitive=False)(monitor_id)
+        if error != None:
+            return self.create_previous_step_failed_result(steps, len(steps) - 1, self.create_failed_result(steps[-1], error))
+
+        (_, result, _), is_new = await self.async_get_step_result(sessions, steps, 0, True)
+        if not is_new:
+            return None
+        return result
     
+    def complete_monitor(self, monitor_id):
+        try:
+            if self.work_queue_worker_id != None:
+                complete_work_item(self.work_queue_worker_id, monitor_id)
+        except Exception as e:
+            print(e)
+        self.q.task_done()
+
+    # Host of monitor is read from its cached spec, so deferred monitor retry without database access
+    def acquire_host(self, monitor_id):
+        if not self.host_limiter.is_enabled():
+            return None, 0
+        steps, _ = self.probe_specs.get(monitor_id)
+        return self.host_limiter.try_acquire(steps[0].url, steps[0].team_id)
+
     def worker(self):
         while True:
+            monitor_id = None
+            host_key = None
+
             # Prevent halt worker
             try:
-                monitor_id = self.get_monitor_id_from_queue()
+                monitor_id = self.q.get()
                 if monitor_id == None:
                     return
                 
+                # Monitor waiting for its host budget go back to queue so worker can serve other hosts
+                host_key, wait = self.acquire_host(monitor_id)
+                if wait > 0:
+                    self.q.defer(monitor_id, wait)
+                    continue
+                
                 print(f"[{timezone.now()}] Running cron for monitor id:{monitor_id}")
                 
                 execution_time = timezone.localtime()
                 start = time.perf_counter()
                 
-                api_monitor_result = self.run_api_monitor_request(monitor_id, [])
-                
-                process_time = (time.perf_counter() - start) * 1000 # Convert from s to ms
-                api_monitor_result.execution_time = execution_time
-                api_monitor_result.response_time = process_time
-                api_monitor_result.save()
-                
-                print(f"[{timezone.now()}] Done run cron for monitor id:{monitor_id}")
-                self.q.task_done()
+                api_monitor_result = self.run_api_monitor_request(monitor_id)
+                if api_monitor_result != None:
+                    process_time = (time.perf_counter() - start) * 1000 # Convert from s to ms
+                    api_monitor_result.execution_time = execution_time
+                    api_monitor_result.response_time = process_time
+                    self.save_result(api_monitor_result)
+                    
+                    print(f"[{timezone.now()}] Done run cron for monitor id:{monitor_id}")
+                else:
+                    print(f"[{timezone.now()}] Skip monitor id:{monitor_id}, already run as previous step")
+            except Exception as e:
+                print(e)
+
+            if host_key != None:
+                self.host_limiter.release(host_key)
+            if monitor_id != None:
+                self.complete_monitor(monitor_id)
+
+    async def async_worker_task(self, sessions, semaphore, monitor_id):
+        host_key = None
+        is_deferred = False
+        try:
+            host_key, wait = await sync_to_async(self.acquire_host, thread_sensitive=False)(monitor_id)
+            if wait > 0:
+                is_deferred = True
+                self.q.defer(monitor_id, wait)
+                return
+
+            print(f"[{timezone.now()}] Running cron for monitor id:{monitor_id}")
+
+            execution_time = timezone.localtime()
+            start = time.perf_counter()
+
+            api_monitor_result = await self.async_run_api_monitor_request(sessions, monitor_id)
+            if api_monitor_result == None:
+                print(f"[{timezone.now()}] Skip monitor id:{monitor_id}, already run as previous step")
+                return
+
+            process_time = (time.perf_counter() - start) * 1000 # Convert from s to ms
+            api_monitor_result.execution_time = execution_time
+            api_monitor_result.response_time = process_time
+            await sync_to_async(self.save_result, thread_sensitive=False)(api_monitor_result)
+
+            print(f"[{timezone.now()}] Done run cron for monitor id:{monitor_id}")
+        except Exception as e:
+            print(e)
+        finally:
+            semaphore.release()
+            if host_key != None:
+                self.host_limiter.release(host_key)
+            if not is_deferred:
+                await sync_to_async(self.complete_monitor, thread_sensitive=False)(monitor_id)
+
+    # Cookie from one monitor must not be sent by other monitor on the same host, like session pool
+    def create_async_session(self, connector, trace_configs):
+        return aiohttp.ClientSession(connector=connector, trace_configs=trace_configs, cookie_jar=aiohttp.DummyCookieJar())
+
+    async def async_worker(self, concurrency):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = set()
+
+        # Cold session close connection after each request so connect time is measured on every run,
+        # reused connections of each host are limited by the same pool size as sync session pool
+        cold_connector = TimingTCPConnector(limit=concurrency, force_close=True)
+        reuse_connector = TimingTCPConnector(limit=concurrency, limit_per_host=settings.HTTP_POOL_MAXSIZE,
+                                             keepalive_timeout=settings.HTTP_POOL_IDLE_TIMEOUT_IN_SECONDS)
+        trace_configs = [self.create_trace_config()]
+        async with self.create_async_session(cold_connector, trace_configs) as cold_session, \
+                self.create_async_session(reuse_connector, trace_configs) as reuse_session:
+            sessions = {'cold': cold_session, 'reuse': reuse_session}
+            while True:
+                monitor_id = await loop.run_in_executor(None, self.q.get)
+                if monitor_id == None:
+                    break
+
+                # Wait for free slot before taking the next monitor from queue
+                await semaphore.acquire()
+                task = asyncio.create_task(self.async_worker_task(sessions, semaphore, monitor_id))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            await asyncio.gather(*tasks)
+
+    def run_async_worker(self, concurrency):
+        asyncio.run(self.async_worker(concurrency))
+
+    # Keep claiming work items from database queue while local queue is running low
+    def claim_worker(self, claim_size, lease_in_seconds, poll_interval):
+        while not self.claim_stop_signal.is_set():
+            claimed = []
+            try:
+                if self.q.qsize() < claim_size:
+                    claimed = claim_work_items(self.work_queue_worker_id, claim_size, lease_in_seconds)
+                if len(claimed) > 0:
+                    self.probe_specs.invalidate_stale(get_config_versions(claimed))
+                for monitor_id in claimed:
+                    self.q.put(monitor_id)
             except Exception as e:
                 print(e)
 
+            if len(claimed) == 0:
+                self.claim_stop_signal.wait(poll_interval)
+
+    # Queue depth, processed items and busy time of each stage, fetch stage queue is the dispatch queue
+    def print_pipeline_metrics(self):
+        metrics = [f"fetch queue:{self.q.qsize()}"]
+        for name, stage in [('assertion', self.assertion_stage), ('persistence', self.result_writer)]:
+            if stage != None:
+                depth, processed_count, busy_time = stage.get_metrics()
+                metrics.append(f"{name} queue:{depth} processed:{processed_count} busy:{busy_time:.1f}s")
+        print(f"[{timezone.now()}] Pipeline {', '.join(metrics)}")
+
+    # Wait until queue empty or timeout reached, monitors left on queue are removed and returned
+    def drain_queue(self, timeout):
+        self.q.join(timeout)
+        return self.q.drain()
+
     def handle(self, *args, **kwargs):
+        install_timing_connections()
+        
         # Run consumer worker
-        self.stop_signal.clear()
+        self.q = DispatchQueue()
+        self.probe_specs = ProbeSpecCache()
         thread_pool = []
-        last_triggered = {}
+        self.schedule_state = {}
         
         consumer_count = 3
         try:
@@ -298,54 +675,158 @@ class Command(BaseCommand):
         except ValueError:
             pass
         
+        async_concurrency = 1000
+        try:
+            async_concurrency = int(os.getenv('CRON_ASYNC_CONCURRENCY', 1000))
+        except ValueError:
+            pass
+
         cron_interval = int(os.environ.get('CRON_INTERVAL_IN_SECONDS', 60))
+        lease_in_seconds = int(os.environ.get('CRON_LEASE_IN_SECONDS', 600))
+        queue_poll_interval = float(os.environ.get('CRON_QUEUE_POLL_IN_SECONDS', 1))
+        checkpoint_interval = int(os.environ.get('CRON_CHECKPOINT_INTERVAL_IN_SECONDS', 300))
+        shutdown_timeout = int(os.environ.get('CRON_SHUTDOWN_TIMEOUT_IN_SECONDS', 30))
+        
+        # Previous step shared by many monitors run once within this window
+        self.step_results = StepResultCache(int(os.environ.get('CRON_STEP_RESULT_TTL_IN_SECONDS', 60)))
+        
+        # Assertion outcomes kept for unchanged response bodies, 0 disable the cache
+        self.assertion_results = AssertionCache(int(os.environ.get('CRON_ASSERTION_CACHE_SIZE', 10000)))
+        
+        # Default maximum bytes of response body stored on each result
+        self.max_body_size = int(os.environ.get('CRON_MAX_BODY_SIZE', 1048576))
+        
+        # Results are written in batches, worker wait when result queue is full
+        self.result_writer = ResultWriter(
+            int(os.environ.get('CRON_RESULT_BATCH_SIZE', 100)),
+            float(os.environ.get('CRON_RESULT_FLUSH_INTERVAL_IN_SECONDS', 1)),
+            int(os.environ.get('CRON_RESULT_QUEUE_SIZE', 1000)),
+        )
+        self.result_writer.start()
+        
+        # Assertions run on their own threads between network workers and result writer, 0 run them on network worker
+        assertion_thread_count = int(os.environ.get('CRON_ASSERTION_THREAD_COUNT', 2))
+        
+        # Process pool evaluate assertions outside of GIL, assertion thread wait for its assertion process
+        self.assertion_pool = None
+        if os.getenv('CRON_ASSERTION_PROCESS_POOL', 'False') == 'True':
+            # 0 means one process for each CPU
+            assertion_process_count = int(os.environ.get('CRON_ASSERTION_PROCESS_COUNT', 0))
+            if assertion_process_count <= 0:
+                assertion_process_count = os.cpu_count() or 1
+            self.create_assertion_pool(assertion_process_count)
+            if assertion_thread_count > 0:
+                assertion_thread_count = max(assertion_thread_count, assertion_process_count)
+        self.assertion_stage = None
+        if assertion_thread_count > 0:
+            self.assertion_stage = PipelineStage(
+                'assertion',
+                self.assert_result,
+                assertion_thread_count,
+                int(os.environ.get('CRON_ASSERTION_QUEUE_SIZE', 1000)),
+            )
+            self.assertion_stage.start()
+        metrics_interval = int(os.environ.get('CRON_METRICS_INTERVAL_IN_SECONDS', 60))
+        
+        # Future partitions of results table are created ahead, no-op when results table not partitioned
+        result_partition_size, result_partition_premake = get_result_partition_config()
         
-        for _ in range(consumer_count):
-            consumer = threading.Thread(target=self.worker)
+        # Limit of each target host, 0 means unlimited
+        host_limits = (
+            int(os.environ.get('CRON_HOST_MAX_CONCURRENCY', 0)),
+            float(os.environ.get('CRON_HOST_RATE_PER_SECOND', 0)),
+            int(os.environ.get('CRON_HOST_BURST', 1)),
+        )
+        self.host_limiter = HostLimiter(*host_limits)
+        
+        # Async mode run all requests on single event loop, limited by async concurrency
+        if os.getenv('CRON_ASYNC_MODE', 'False') == 'True':
+            claim_size = async_concurrency
+            consumer = threading.Thread(target=self.run_async_worker, args=[async_concurrency])
             consumer.start()
             thread_pool.append(consumer)
+        else:
+            claim_size = consumer_count
+            for _ in range(consumer_count):
+                consumer = threading.Thread(target=self.worker)
+                consumer.start()
+                thread_pool.append(consumer)
+                
+        # Database queue let multiple cron process share scheduled monitors using leased work items
+        claimer = None
+        if os.getenv('CRON_QUEUE_BACKEND', 'LOCAL') == 'DATABASE':
+            self.work_queue_worker_id = get_worker_id()
+            self.claim_stop_signal.clear()
+            claimer = threading.Thread(target=self.claim_worker, args=[claim_size, lease_in_seconds, queue_poll_interval])
+            claimer.start()
 
-        schedule_in_seconds = {
-            '1MIN': 60,
-            '2MIN': 120,
-            '3MIN': 180,
-            '5MIN': 300,
-            '10MIN': 600,
-            '15MIN': 900,
-            '30MIN': 1800,
-            '60MIN': 3600,
-        }
-        
         try:
-            # Fill last_triggered
-            api_monitors = APIMonitor.objects.all()
-            for monitor in api_monitors:
-                exists = APIMonitorResult.objects.filter(monitor=monitor).exists()
-                if exists:
-                    last_result = APIMonitorResult.objects.filter(monitor=monitor).last()
-                    last_triggered[monitor.id] = last_result.execution_time
+            # Resume scheduler state and unfinished monitors of last local cron run
+            if self.work_queue_worker_id == None:
+                checkpoint = load_checkpoint()
+                if checkpoint != None:
+                    self.schedule_state, pending_monitor_ids = checkpoint
+                    restore_next_run_at(self.schedule_state)
+                    for monitor_id in pending_monitor_ids:
+                        self.q.put(monitor_id)
                 
+            # Fill next run time of monitors which never been scheduled by cron
+            fill_next_run_at_from_last_result()
+            
             # Cron loop function
+            next_checkpoint = timezone.now() + timedelta(seconds=checkpoint_interval)
+            next_partition_check = timezone.now()
+            next_metrics = timezone.now() + timedelta(seconds=metrics_interval)
             while True:
                 last_run = timezone.now()
-                api_monitors = APIMonitor.objects.all()
-                for monitor in api_monitors:
-                    result_filter_time = last_run - timedelta(seconds=schedule_in_seconds[monitor.schedule])
-                    if monitor.id in last_triggered and result_filter_time < last_triggered[monitor.id]:
-                        continue
+                if last_run >= next_partition_check:
+                    for name in ensure_result_partitions(last_run, result_partition_size, result_partition_premake):
+                        print(f"[{timezone.now()}] Created result partition {name}")
+                    next_partition_check = last_run + timedelta(hours=1)
+                if metrics_interval > 0 and last_run >= next_metrics:
+                    self.print_pipeline_metrics()
+                    next_metrics = last_run + timedelta(seconds=metrics_interval)
+                self.host_limiter.set_team_limits(load_team_limits(host_limits))
+                self.step_results.evict_expired()
+                if self.work_queue_worker_id == None:
+                    due_monitors = schedule_due_monitors(last_run)
+                    self.probe_specs.invalidate_stale({monitor_id: config_version for monitor_id, _, _, config_version in due_monitors})
+                    for monitor_id, due_at, next_run_at, _ in due_monitors:
+                        self.schedule_state[monitor_id] = (last_run, next_run_at)
+                        self.q.put(monitor_id, due_at)
                     
-                    last_triggered[monitor.id] = last_run
-                    self.q.put(monitor.id)
+                    if last_run >= next_checkpoint:
+                        save_checkpoint(self.schedule_state, self.q.pending())
+                        next_checkpoint = last_run + timedelta(seconds=checkpoint_interval)
+                else:
+                    enqueue_due_monitors(last_run)
                     
-                # Add delay before next check
+                # Add delay before next check, wake up earlier when next monitor phase come first
                 mock_cron_interrupt()
                 next_run = last_run + timedelta(seconds=cron_interval) 
+                next_due_at = get_next_due_at()
+                if next_due_at != None and next_due_at < next_run:
+                    next_run = next_due_at
                 sleep_duration = (next_run - timezone.now()).total_seconds()
                 time.sleep(max(sleep_duration, 0))  
         except BaseException as e:
             # Gracefully shutdown thread worker
-            self.q.join()
-            self.stop_signal.set()
+            if claimer != None:
+                self.claim_stop_signal.set()
+                claimer.join()
+                
+            # Monitors not started before shutdown timeout are saved on checkpoint and resumed on next run
+            pending_monitor_ids = self.drain_queue(shutdown_timeout)
+            self.q.close()
             for thread in thread_pool:
                 thread.join()            
+            if self.assertion_stage != None:
+                self.assertion_stage.close()
+            if self.assertion_pool != None:
+                self.assertion_pool.shutdown()
+            self.result_writer.close()
+            if self.work_queue_worker_id != None:
+                release_work_items(self.work_queue_worker_id)
+            else:
+                save_checkpoint(self.schedule_state, pending_monitor_ids)
             raise e
@@ -0,0 +1,30 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('apimonitor', '0019_apimonitor_next_run_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronWorkItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scheduled_at', models.DateTimeField()),
+                ('leased_by', models.CharField(blank=True, default='', max_length=256)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('monitor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cron_work_item', to='apimonitor.apimonitor')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='cronworkitem',
+            index=models.Index(fields=['lease_expires_at', 'scheduled_at'], name='work_item_lease_index'),
+        ),
+    ]
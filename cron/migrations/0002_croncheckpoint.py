@@ -0,0 +1,22 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cron', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('data', models.JSONField(default=dict)),
+                ('saved_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('login', '0003_teammember_verified'),
+        ('cron', '0002_croncheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronConfiguration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('host_max_concurrency', models.PositiveIntegerField(blank=True, null=True)),
+                ('host_rate_per_second', models.FloatField(blank=True, null=True)),
+                ('host_burst', models.PositiveIntegerField(blank=True, null=True)),
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='login.team')),
+            ],
+        ),
+    ]
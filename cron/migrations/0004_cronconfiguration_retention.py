@@ -0,0 +1,28 @@
+# Generated by Django 4.1.2 on 2026-10-18 09:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cron', '0003_cronconfiguration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cronconfiguration',
+            name='failure_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cronconfiguration',
+            name='rollup_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cronconfiguration',
+            name='success_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,37 @@
 from django.db import models
 
-# Create your models here.
+from apimonitor.models import APIMonitor
+from login.models import Team
+
+
+# Pending execution of api monitor shared by every cron process using database queue
+class CronWorkItem(models.Model):
+    monitor = models.OneToOneField(APIMonitor, on_delete=models.CASCADE, related_name='cron_work_item')
+    scheduled_at = models.DateTimeField()
+    leased_by = models.CharField(max_length=256, blank=True, default="")
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['lease_expires_at', 'scheduled_at'], name='work_item_lease_index'),
+        ]
+
+
+# Snapshot of local scheduler state, restored when cron started again
+class CronCheckpoint(models.Model):
+    name = models.CharField(max_length=64, unique=True)
+    data = models.JSONField(default=dict)
+    saved_at = models.DateTimeField()
+
+
+# Per team override of cron limit for each target host and result retention, empty value use global config
+class CronConfiguration(models.Model):
+    team = models.OneToOneField(Team, on_delete=models.CASCADE)
+    host_max_concurrency = models.PositiveIntegerField(null=True, blank=True)
+    host_rate_per_second = models.FloatField(null=True, blank=True)
+    host_burst = models.PositiveIntegerField(null=True, blank=True)
+    
+    # Days results are kept before purged, 0 means kept forever
+    success_retention_days = models.PositiveIntegerField(null=True, blank=True)
+    failure_retention_days = models.PositiveIntegerField(null=True, blank=True)
+    rollup_retention_days = models.PositiveIntegerField(null=True, blank=True)
@@ -0,0 +1,57 @@
+import queue
+import threading
+import time
+
+from django.utils import timezone
+
+
+# Stage of cron pipeline running handler on its own threads. Stages are connected by bounded queue,
+# producer wait when queue is full so slow stage slow down previous stage instead of using memory.
+class PipelineStage:
+    def __init__(self, name, handler, thread_count=1, max_queue_size=1000):
+        self.name = name
+        self.handler = handler
+        self.thread_count = thread_count
+        self.q = queue.Queue(maxsize=max_queue_size)
+        self.threads = []
+        self.mutex = threading.Lock()
+        self.processed_count = 0
+        self.busy_time = 0
+
+    def start(self):
+        for _ in range(self.thread_count):
+            thread = threading.Thread(target=self.run)
+            thread.start()
+            self.threads.append(thread)
+
+    # Block while queue is full
+    def put(self, item):
+        self.q.put(item)
+
+    # Process remaining items and stop stage threads
+    def close(self):
+        for _ in self.threads:
+            self.q.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def run(self):
+        while True:
+            item = self.q.get()
+            if item == None:
+                return
+
+            start = time.perf_counter()
+            try:
+                self.handler(item)
+            except Exception as e:
+                print(f"[{timezone.now()}] Failed to run {self.name} stage: {e}")
+            with self.mutex:
+                self.processed_count += 1
+                self.busy_time += time.perf_counter() - start
+
+    # Return (queue depth, processed items, busy seconds)
+    def get_metrics(self):
+        with self.mutex:
+            return self.q.qsize(), self.processed_count, self.busy_time
@@ -0,0 +1,108 @@
+import re
+import threading
+
+from django.db.models import Exists, OuterRef
+
+from apimonitor.models import APIMonitor, APIMonitorRawBody
+from cron.assertions import AssertionSpec
+from cron.template import CompiledTemplate
+
+# Limit 10 monitor on one chain
+MAX_CHAIN_DEPTH = 10
+
+
+# Translate exclude key a.b[0].c to DeepDiff path root['a']['b'][0]['c']
+def get_exclude_path(exclude_key):
+    res_key = 'root'
+    for key_part in exclude_key.split('.'):
+        array_idx = re.findall("\[[\d]\]$", key_part)
+        if len(array_idx) == 1:
+            key_part = key_part.replace(array_idx[0], '')
+            res_key += f"['{key_part}']{array_idx[0]}"
+        else:
+            res_key += f"['{key_part}']"
+    return res_key
+
+
+# Everything needed to send request and run assertion of one monitor, never modified after built
+# so it can be shared by every worker without accessing database
+class ProbeSpec(AssertionSpec):
+    def __init__(self, monitor):
+        self.id = monitor.id
+        self.team_id = monitor.team_id
+        self.name = monitor.name
+        self.method = monitor.method
+        self.url = monitor.url
+        self.body_type = monitor.body_type
+        self.is_reuse_connection = monitor.is_reuse_connection
+        self.result_cache_ttl = monitor.result_cache_ttl
+        self.max_body_size = monitor.max_body_size
+        self.is_previous_step = monitor.is_previous_step
+        self.previous_step_id = monitor.previous_step_id
+        self.config_version = monitor.config_version
+        # Header, body and query param are compiled templates rendered with previous step result
+        self.headers = tuple((CompiledTemplate(header.key), CompiledTemplate(header.value)) for header in monitor.headers.all())
+        self.body_form = tuple((CompiledTemplate(form.key), CompiledTemplate(form.value)) for form in monitor.body_form.all())
+        self.query_params = tuple((CompiledTemplate(param.key), CompiledTemplate(param.value)) for param in monitor.query_params.all())
+
+        try:
+            self.raw_body = CompiledTemplate(monitor.raw_body.body)
+        except APIMonitorRawBody.DoesNotExist:
+            self.raw_body = None
+
+        exclude_paths = tuple(get_exclude_path(key.exclude_key) for key in monitor.exclude_keys.all())
+        super().__init__(monitor.assertion_type, monitor.assertion_value, monitor.is_assert_json_schema_only, exclude_paths)
+
+
+def get_probe_spec_queryset():
+    return APIMonitor.objects \
+        .select_related('raw_body') \
+        .prefetch_related('headers', 'body_form', 'query_params', 'exclude_keys') \
+        .annotate(is_previous_step=Exists(APIMonitor.objects.filter(previous_step=OuterRef('pk'))))
+
+
+# Build spec of monitor with all of its previous steps, the last step on the list is executed first.
+# Return (steps, error) where error is set when chain is invalid.
+def build_probe_steps(monitor_id):
+    steps = [ProbeSpec(get_probe_spec_queryset().get(id=monitor_id))]
+    while steps[-1].previous_step_id != None:
+        if len(steps) >= MAX_CHAIN_DEPTH:
+            return tuple(steps), f"Depth limit of previous step API monitor reached (maximum: {MAX_CHAIN_DEPTH})"
+
+        # Check if infinite recursion on api monitor detected
+        if steps[-1].previous_step_id in [step.id for step in steps]:
+            return tuple(steps), "Request aborted due to recursion of API monitor steps"
+
+        steps.append(ProbeSpec(get_probe_spec_queryset().get(id=steps[-1].previous_step_id)))
+    return tuple(steps), None
+
+
+# Built steps of each monitor kept across runs, dropped when config version of the monitor changed.
+# Config version of a monitor is also changed when any of its previous step changed.
+class ProbeSpecCache:
+    def __init__(self):
+        self.chains = {}
+        self.mutex = threading.Lock()
+
+    def get(self, monitor_id):
+        with self.mutex:
+            chain = self.chains.get(monitor_id)
+        if chain != None:
+            return chain
+
+        chain = build_probe_steps(monitor_id)
+        with self.mutex:
+            self.chains[monitor_id] = chain
+        return chain
+
+    # Remove chain built from older configuration, config_versions is dict of monitor id to version
+    def invalidate_stale(self, config_versions):
+        with self.mutex:
+            for monitor_id, config_version in config_versions.items():
+                chain = self.chains.get(monitor_id)
+                if chain != None and chain[0][0].config_version != config_version:
+                    del self.chains[monitor_id]
+
+    def clear(self):
+        with self.mutex:
+            self.chains = {}
@@ -0,0 +1,96 @@
+import threading
+import time
+
+from django.db.models import Q
+
+from cron.models import CronConfiguration
+from monapi.utils import get_origin
+
+# Delay before monitor retry when all concurrency slot of its host still used
+HOST_RETRY_DELAY = 0.1
+
+
+# Team limit fallback to global limit for every empty field, configuration without any host limit
+# (e.g. only retention) keep the team on global budget
+def load_team_limits(default_limits):
+    team_limits = {}
+    configs = CronConfiguration.objects.filter(
+        Q(host_max_concurrency__isnull=False) | Q(host_rate_per_second__isnull=False) | Q(host_burst__isnull=False)
+    )
+    for config in configs:
+        max_concurrency, rate, burst = default_limits
+        team_limits[config.team_id] = (
+            config.host_max_concurrency if config.host_max_concurrency != None else max_concurrency,
+            config.host_rate_per_second if config.host_rate_per_second != None else rate,
+            config.host_burst if config.host_burst != None else burst,
+        )
+    return team_limits
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+
+    # Return 0 when token taken, otherwise seconds until next token available
+    def try_acquire(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+# Concurrency and rate limit for each target host (scheme and host of url), never block the caller.
+# Team with own configuration have separate budget for each host.
+class HostLimiter:
+    def __init__(self, max_concurrency=0, rate=0, burst=1):
+        self.default_limits = (max_concurrency, rate, burst)
+        self.team_limits = {}
+        self.running = {}
+        self.buckets = {}
+        self.mutex = threading.Lock()
+
+    def set_team_limits(self, team_limits):
+        with self.mutex:
+            self.team_limits = team_limits
+
+    def is_enabled(self):
+        for max_concurrency, rate, _ in [self.default_limits, *self.team_limits.values()]:
+            if max_concurrency > 0 or rate > 0:
+                return True
+        return False
+
+    # Return (host key, 0) when host budget acquired, otherwise (None, seconds to wait before retry)
+    def try_acquire(self, url, team_id):
+        with self.mutex:
+            if team_id in self.team_limits:
+                key = (team_id, get_origin(url))
+                max_concurrency, rate, burst = self.team_limits[team_id]
+            else:
+                key = (None, get_origin(url))
+                max_concurrency, rate, burst = self.default_limits
+
+            if max_concurrency > 0 and self.running.get(key, 0) >= max_concurrency:
+                return None, HOST_RETRY_DELAY
+
+            if rate > 0:
+                bucket = self.buckets.get(key)
+                if bucket == None or bucket.rate != rate or bucket.burst != max(burst, 1):
+                    bucket = TokenBucket(rate, burst)
+                    self.buckets[key] = bucket
+                wait = bucket.try_acquire(time.monotonic())
+                if wait > 0:
+                    return None, wait
+
+            self.running[key] = self.running.get(key, 0) + 1
+            return key, 0
+
+    def release(self, key):
+        with self.mutex:
+            self.running[key] -= 1
+            if self.running[key] == 0:
+                del self.running[key]
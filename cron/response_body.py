@@ -0,0 +1,58 @@
+import hashlib
+
+CHUNK_SIZE = 64 * 1024
+
+
+# Response body read in chunks, read bytes are hashed and counted but only first keep_size bytes
+# are kept in memory. Keep size None keep the whole body.
+class ResponseBody:
+    def __init__(self, keep_size=None):
+        self.keep_size = keep_size
+        self.chunks = []
+        self.kept_size = 0
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        # Reading stopped before end of body, size and hash only cover the bytes read
+        self.is_partial = False
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        self.hasher.update(chunk)
+        if self.keep_size != None:
+            chunk = chunk[:self.keep_size - self.kept_size]
+        if len(chunk) > 0:
+            self.chunks.append(chunk)
+            self.kept_size += len(chunk)
+
+    def get_content(self):
+        return b"".join(self.chunks)
+
+    def get_hash(self):
+        return self.hasher.hexdigest()
+
+    # Body with keep size is only needed up to keep size, so reading stop once more than that is read
+    def is_cut_off(self):
+        return self.keep_size != None and self.size > self.keep_size
+
+
+def read_response_body(resp, keep_size=None):
+    body = ResponseBody(keep_size)
+    try:
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            body.feed(chunk)
+            if body.is_cut_off():
+                body.is_partial = True
+                break
+    finally:
+        resp.close()
+    return body
+
+
+async def async_read_response_body(resp, keep_size=None):
+    body = ResponseBody(keep_size)
+    async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+        body.feed(chunk)
+        if body.is_cut_off():
+            body.is_partial = True
+            break
+    return body
@@ -0,0 +1,92 @@
+import queue
+import threading
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from apimonitor.models import APIMonitorResult, store_response_blobs, add_results_to_rollups, add_result_notifications
+
+
+# Persist finished results in batches on dedicated thread. Queue is bounded so worker putting
+# result wait when database falls behind instead of keeping unlimited results in memory.
+class ResultWriter:
+    def __init__(self, batch_size=100, flush_interval=1, max_queue_size=1000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.q = queue.Queue(maxsize=max_queue_size)
+        self.thread = None
+        self.written_count = 0
+        self.busy_time = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+
+    # Block while queue is full
+    def put(self, result):
+        self.q.put(result)
+
+    # Write remaining results and stop writer thread
+    def close(self):
+        self.q.put(None)
+        self.thread.join()
+
+    def write(self, results):
+        # Log response moved to blob is restored when batch rolled back
+        log_responses = [result.log_response for result in results]
+        try:
+            with transaction.atomic():
+                store_response_blobs(results)
+                APIMonitorResult.objects.bulk_create(results)
+                # bulk_create skip save, so rollups are updated for the whole batch here
+                add_results_to_rollups(results)
+                add_result_notifications(results)
+            return
+        except Exception as e:
+            print(f"[{timezone.now()}] Failed to write batch of {len(results)} results, writing them one by one: {e}")
+        
+        # Only result failing on its own is dropped, e.g. result of monitor deleted while queued
+        for result, log_response in zip(results, log_responses):
+            result.pk = None
+            result._state.adding = True
+            result.log_response = log_response
+            result.response_blob_id = None
+            try:
+                with transaction.atomic():
+                    result.store_log_response()
+                    result.save()
+            except Exception as e:
+                print(f"[{timezone.now()}] Failed to write result of monitor id:{result.monitor_id}: {e}")
+
+    def run(self):
+        is_closed = False
+        while not is_closed:
+            result = self.q.get()
+            if result == None:
+                break
+
+            # Collect batch until it is full or flush interval passed since first result
+            batch = [result]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    result = self.q.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if result == None:
+                    is_closed = True
+                    break
+                batch.append(result)
+            
+            start = time.perf_counter()
+            self.write(batch)
+            self.written_count += len(batch)
+            self.busy_time += time.perf_counter() - start
+
+    # Return (queue depth, processed results, busy seconds) like pipeline stage
+    def get_metrics(self):
+        return self.q.qsize(), self.written_count, self.busy_time
@@ -0,0 +1,98 @@
+import time
+
+from django.db import IntegrityError
+from django.db.models import Func, IntegerField, Sum
+from django.db.models.functions import Length
+
+from apimonitor.models import APIMonitorResult, APIMonitorResponseBlob, APIMonitorResultRollup, APIMonitorResultNotification
+from cron.models import CronConfiguration
+
+
+# Size of text column in bytes, Length count characters
+class OctetLength(Func):
+    function = 'OCTET_LENGTH'
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='LENGTH(CAST(%(expressions)s AS BLOB))', **extra_context)
+
+
+# Team retention fallback to global retention for every empty field
+def load_team_retention(default_retention):
+    team_retention = {}
+    for config in CronConfiguration.objects.all():
+        success_days, failure_days, rollup_days = default_retention
+        team_retention[config.team_id] = (
+            config.success_retention_days if config.success_retention_days != None else success_days,
+            config.failure_retention_days if config.failure_retention_days != None else failure_days,
+            config.rollup_retention_days if config.rollup_retention_days != None else rollup_days,
+        )
+    return team_retention
+
+
+# Results older than the longest retention of every team can be dropped with whole partition,
+# return None when any retention keep results forever
+def get_longest_retention_days(default_retention, team_retention):
+    retention_days = list(default_retention[:2])
+    for success_days, failure_days, _ in team_retention.values():
+        retention_days += [success_days, failure_days]
+    if 0 in retention_days:
+        return None
+    return max(retention_days)
+
+
+# Delete rows of queryset in chunks of primary key so each transaction stay small,
+# return (deleted rows, reclaimed bytes) where bytes is measured with size_expression when given
+def purge_in_chunks(queryset, pk_field, size_expression, chunk_size, sleep):
+    deleted_count = 0
+    deleted_bytes = 0
+    while True:
+        chunk = list(queryset.values_list(pk_field, flat=True)[:chunk_size])
+        if len(chunk) == 0:
+            break
+        
+        chunk_queryset = queryset.model.objects.filter(**{f"{pk_field}__in": chunk})
+        chunk_bytes = 0
+        if size_expression != None:
+            chunk_bytes = chunk_queryset.aggregate(size=Sum(size_expression))['size'] or 0
+        try:
+            deleted, _ = chunk_queryset.delete()
+        except IntegrityError:
+            # Row referenced again while purging, it is purged on next run when unused
+            break
+        deleted_count += deleted
+        deleted_bytes += chunk_bytes
+        if sleep > 0:
+            time.sleep(sleep)
+    return deleted_count, deleted_bytes
+
+
+# Results older than cutoff of one monitor, ordered by result time index
+def purge_monitor_results(monitor_id, success, cutoff, chunk_size, sleep):
+    queryset = APIMonitorResult.objects \
+        .filter(monitor_id=monitor_id, execution_time__lt=cutoff, success=success) \
+        .order_by('execution_time')
+    return purge_in_chunks(queryset, 'id', OctetLength('log_response') + OctetLength('log_error'), chunk_size, sleep)
+
+
+# Rollups of every period which bucket started before cutoff
+def purge_monitor_rollups(monitor_id, cutoff, chunk_size, sleep):
+    queryset = APIMonitorResultRollup.objects \
+        .filter(monitor_id=monitor_id, bucket__lt=cutoff) \
+        .order_by('bucket')
+    deleted_count, _ = purge_in_chunks(queryset, 'id', None, chunk_size, sleep)
+    return deleted_count
+
+
+# Notifications are deleted when read by alerts cron, when it is not running they are only purged here.
+# Bucket older than cutoff is outside every alert time window so it cannot change any alert.
+def purge_stale_notifications(cutoff, chunk_size, sleep):
+    queryset = APIMonitorResultNotification.objects.filter(bucket__lt=cutoff).order_by('id')
+    deleted_count, _ = purge_in_chunks(queryset, 'id', None, chunk_size, sleep)
+    return deleted_count
+
+
+# Blob is kept while any result still use it
+def purge_orphan_blobs(chunk_size, sleep):
+    queryset = APIMonitorResponseBlob.objects.filter(results=None)
+    return purge_in_chunks(queryset, 'hash', Length('body'), chunk_size, sleep)
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+
+# Result of monitor step kept for freshness window and shared by every monitor using the step
+# as previous step. Concurrent callers of the same step wait for the first caller instead of
+# sending the same request again.
+#
+# Scheduled run of the monitor itself read the cache exclusively: it take result shared by
+# other monitor at most once, so its own schedule is never skipped by its previous run.
+class StepResultCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+        self.in_flight = {}
+        self.mutex = threading.Lock()
+
+    # Return cached value or None, entry is [expires_at, value, is_taken]
+    def take_locked(self, key, is_exclusive):
+        entry = self.entries.get(key)
+        if entry == None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.entries[key]
+            return None
+        if is_exclusive:
+            if entry[2]:
+                return None
+            entry[2] = True
+        return entry
+
+    def set_locked(self, key, value, is_exclusive, ttl):
+        if ttl == None:
+            ttl = self.ttl
+        self.entries[key] = [time.monotonic() + ttl, value, is_exclusive]
+
+    # Return (value, is_new), is_new is False when value come from other caller.
+    # Value is kept for ttl seconds, default ttl of the cache is used when not given.
+    def get_or_run(self, key, run, is_exclusive=False, ttl=None):
+        while True:
+            with self.mutex:
+                entry = self.take_locked(key, is_exclusive)
+                if entry != None:
+                    return entry[1], False
+                event = self.in_flight.get(key)
+                if event == None:
+                    event = threading.Event()
+                    self.in_flight[key] = event
+                    break
+            event.wait()
+
+        try:
+            value = run()
+            with self.mutex:
+                self.set_locked(key, value, is_exclusive, ttl)
+            return value, True
+        finally:
+            with self.mutex:
+                del self.in_flight[key]
+            event.set()
+
+    async def async_get_or_run(self, key, run, is_exclusive=False, ttl=None):
+        while True:
+            with self.mutex:
+                entry = self.take_locked(key, is_exclusive)
+                if entry != None:
+                    return entry[1], False
+                future = self.in_flight.get(key)
+                if future == None:
+                    future = asyncio.get_running_loop().create_future()
+                    self.in_flight[key] = future
+                    break
+            await future
+
+        try:
+            value = await run()
+            with self.mutex:
+                self.set_locked(key, value, is_exclusive, ttl)
+            return value, True
+        finally:
+            with self.mutex:
+                del self.in_flight[key]
+            future.set_result(None)
+
+    def invalidate(self, key):
+        with self.mutex:
+            self.entries.pop(key, None)
+
+    # Called on every tick so result of removed or changed monitor is not kept forever
+    def evict_expired(self):
+        now = time.monotonic()
+        with self.mutex:
+            for key in [key for key, entry in self.entries.items() if entry[0] < now]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.mutex:
+            self.entries = {}
@@ -0,0 +1,66 @@
+import re
+
+# Placeholder {{a.b[0].c}} of previous step result inside header, query param and body
+PLACEHOLDER_PATTERN = re.compile("({{.+?}})")
+# Key part with array index such as items[0] or items[10][2]
+KEY_PART_PATTERN = re.compile("^(.*?)((?:\[\d+\])+)$")
+ARRAY_INDEX_PATTERN = re.compile("\[(\d+)\]")
+
+# Returned when key not found, value on previous step result might be None
+MISSING = object()
+
+
+# Parse key a.b[0].c into accessors (('a', ()), ('b', (0,)), ('c', ()))
+def compile_key(key):
+    accessors = []
+    for key_part in key.split('.'):
+        match = KEY_PART_PATTERN.match(key_part)
+        if match != None:
+            indexes = tuple(int(idx) for idx in ARRAY_INDEX_PATTERN.findall(match.group(2)))
+            accessors.append((match.group(1), indexes))
+        else:
+            accessors.append((key_part, ()))
+    return tuple(accessors)
+
+
+def resolve_key(accessors, source):
+    res = source
+    for name, indexes in accessors:
+        if not isinstance(res, dict) or name not in res:
+            return MISSING
+        res = res[name]
+
+        for idx in indexes:
+            if not isinstance(res, list) or len(res) < idx + 1:
+                return MISSING
+            res = res[idx]
+    return str(res)
+
+
+# Text parsed once into literal segments and placeholders, rendered in single pass on every run
+class CompiledTemplate:
+    def __init__(self, text):
+        self.text = text
+        self.literals = []
+        self.placeholders = []
+
+        parts = PLACEHOLDER_PATTERN.split(text)
+        for idx, part in enumerate(parts):
+            if idx % 2 == 0:
+                self.literals.append(part)
+            else:
+                key = part.strip("{}")
+                self.placeholders.append((key, compile_key(key)))
+
+    def render(self, source):
+        if source is None or len(self.placeholders) == 0:
+            return self.text
+
+        res = [self.literals[0]]
+        for (key, accessors), literal in zip(self.placeholders, self.literals[1:]):
+            value = resolve_key(accessors, source)
+            if value is MISSING:
+                raise KeyError(f"Value not found while accessing with key \"{key}\"")
+            res.append(value)
+            res.append(literal)
+        return ''.join(res)
@@ -1,19 +1,52 @@
 import os
-from django.test import TestCase, TransactionTestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.conf import settings
 from django.utils import timezone
 from django.core.management import call_command
 from django.contrib.auth.models import User
-from unittest.mock import patch
+from unittest import skipUnless
+from unittest.mock import patch, MagicMock
 from io import StringIO
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 import requests
 import time
+import asyncio
+import aiohttp
+import shutil
+import ssl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import subprocess
+import tempfile
+import urllib3
+from aiohttp import web
+import threading
+import mmh3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from deepdiff import DeepDiff
 
-from apimonitor.models import APIMonitor, APIMonitorBodyForm, APIMonitorHeader, APIMonitorQueryParam, APIMonitorRawBody, APIMonitorResult, AssertionExcludeKey
+from apimonitor.models import APIMonitor, APIMonitorBodyForm, APIMonitorHeader, APIMonitorQueryParam, APIMonitorRawBody, APIMonitorResult, APIMonitorResponseBlob, APIMonitorResultNotification, APIMonitorResultRollup, AssertionExcludeKey
 from login.models import Team
 from cron.management.commands.run_cron import Command
+from cron.models import CronWorkItem, CronCheckpoint, CronConfiguration
+from cron.work_queue import enqueue_due_monitors, claim_work_items, complete_work_item, release_work_items
+from cron.checkpoint import save_checkpoint, load_checkpoint
+from cron.dispatch import DispatchQueue
+from cron.ratelimit import HostLimiter, TokenBucket, load_team_limits
+from monapi.session_pool import SessionPool
+from cron.probe_spec import ProbeSpecCache, get_exclude_path
+from cron.step_cache import StepResultCache
+from cron.timing_connector import TimingTCPConnector
+from cron.timing_connection import install_timing_connections, start_request_timing, stop_request_timing
+from cron.template import CompiledTemplate, compile_key
+from cron.assertions import JSONSchemaAssertion, AssertionCache, AssertionSpec, run_assertions_in_process, process_specs
+from cron.response_body import ResponseBody, read_response_body
+from cron.result_writer import ResultWriter
+from cron.pipeline import PipelineStage
+from cron.retention import get_longest_retention_days, load_team_retention, purge_monitor_results
+import hashlib
 
 
 class MockResponse:
@@ -21,6 +54,13 @@ class MockResponse:
         self.status_code = status_code
         self.content = response.encode('utf-8')
 
+    def iter_content(self, chunk_size=1):
+        for idx in range(0, len(self.content), chunk_size):
+            yield self.content[idx:idx + chunk_size]
+
+    def close(self):
+        pass
+
 
 def mocked_request_get(*args, **kwargs):
     if args[0] == 'https://monapitestprev.xyz':
@@ -33,6 +73,14 @@ def mocked_request_get(*args, **kwargs):
         return MockResponse('{"key": [{"key":"value"}], "key2":[]}', 200)
     return MockResponse("{\"key\": \"value\"}", 200)
 
+def mocked_request_get_with_elapsed(*args, **kwargs):
+    response = MockResponse("{\"key\": \"value\"}", 200)
+    response.elapsed = timedelta(0)
+    return response
+
+def mocked_session_request(self, method, url, **kwargs):
+    return MockResponse(f'{{"method": "{method}", "url": "{url}"}}', 200)
+
 def mocked_request_get_sleep(*args, **kwargs):
     time.sleep(3)
     return MockResponse("{\"key\": \"value\"}", 200)
@@ -41,6 +89,38 @@ def mocked_request_get_sleep(*args, **kwargs):
 def mocked_request_get_exception(*args, **kwargs):
     raise requests.exceptions.Timeout("Request timed out.")
 
+
+class MockAsyncStreamReader:
+    def __init__(self, data):
+        self.data = data
+
+    async def iter_chunked(self, n):
+        for idx in range(0, len(self.data), n):
+            yield self.data[idx:idx + n]
+
+
+class MockAsyncResponse:
+    def __init__(self, response, status_code):
+        self.status = status_code
+        self.content = MockAsyncStreamReader(response.encode('utf-8'))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+def mocked_async_request(session, method, url, **kwargs):
+    response = mocked_request_get(url)
+    if url == 'https://monapi.xyz' and kwargs.get('params', {}).get('query key') == 'testing value':
+        response = MockResponse('{"chain": "ok"}', 201)
+    return MockAsyncResponse(response.content.decode('utf-8'), response.status_code)
+
+
+def mocked_async_request_exception(session, method, url, **kwargs):
+    raise asyncio.TimeoutError()
+
 class CronAccessDictWithKey(TestCase):
     def test_when_key_exists_then_replace_string(self):
         command = Command()
@@ -88,6 +168,160 @@ class CronAccessDictWithKey(TestCase):
         self.assertTrue('Value not found while accessing with key "testarray.testarray2[0].testarray3"' in str(context.exception))
 
 
+class CronTemplate(TestCase):
+    def test_when_compile_key_then_parse_array_indexes(self):
+        self.assertEqual(compile_key('a.b[12].c'), (('a', ()), ('b', (12,)), ('c', ())))
+        self.assertEqual(compile_key('a[0][3]'), (('a', (0, 3)),))
+
+    def test_when_render_then_replace_all_placeholders(self):
+        template = CompiledTemplate('{"token": "{{data.token}}", "id": {{data.items[10].id}}}')
+        source = {"data": {"token": "abc", "items": [{"id": idx} for idx in range(11)]}}
+        self.assertEqual(template.render(source), '{"token": "abc", "id": 10}')
+
+    def test_when_nested_array_then_access_each_index(self):
+        template = CompiledTemplate('{{matrix[1][0]}}')
+        self.assertEqual(template.render({"matrix": [[1], [2]]}), '2')
+
+    def test_when_no_previous_result_then_return_text(self):
+        template = CompiledTemplate('Token {{token}}')
+        self.assertEqual(template.render(None), 'Token {{token}}')
+
+    def test_when_value_contain_placeholder_then_not_replaced_again(self):
+        template = CompiledTemplate('{{a}} {{b}}')
+        self.assertEqual(template.render({"a": "{{b}}", "b": "value"}), '{{b}} value')
+
+
+class CronJSONSchemaAssertion(TestCase):
+    structural_keys = ['dictionary_item_added', 'dictionary_item_removed', 'iterable_item_added', 'iterable_item_removed']
+
+    def assert_same_as_deepdiff(self, expected, response, exclude_paths=[]):
+        ddiff = DeepDiff(expected, response, exclude_paths=exclude_paths)
+        diff = JSONSchemaAssertion(expected, exclude_paths).diff(response)
+        self.assertEqual(
+            {key: str(value) for key, value in diff.items()},
+            {key: str(ddiff[key]) for key in self.structural_keys if key in ddiff},
+        )
+        self.assertEqual({key: list(value.keys()) for key, value in diff.items() if type(value) == dict},
+                         {key: list(ddiff[key].keys()) for key in self.structural_keys[2:] if key in ddiff})
+
+    def test_when_values_differ_then_no_difference(self):
+        self.assert_same_as_deepdiff({"a": 1, "b": {"c": "x"}, "d": [1, 2]}, {"a": 2, "b": {"c": "y"}, "d": [3, 4]})
+
+    def test_when_keys_differ_then_report_added_and_removed_keys(self):
+        self.assert_same_as_deepdiff({"a": 1, "b": {"c": 1}}, {"a": 2, "b": {"d": 1}, "e": 3})
+
+    def test_when_array_length_differ_then_report_items(self):
+        self.assert_same_as_deepdiff({"a": [], "b": [{"c": 1}, {"c": 2}]}, {"a": [{"c": 1}], "b": [{"d": 1}]})
+
+    def test_when_container_type_differ_then_not_compared_inside(self):
+        self.assert_same_as_deepdiff({"a": {"b": 1}, "c": [1]}, {"a": [1], "c": {"d": 1}})
+        self.assert_same_as_deepdiff({"a": 1}, [1])
+
+    def test_when_path_excluded_then_ignored(self):
+        self.assert_same_as_deepdiff({"a": {"b": 1}, "c": [1]}, {"a": {"d": 1}, "c": [1, 2], "e": 1},
+                                     ["root['a']", "root['c'][1]", "root['e']"])
+
+    def test_when_scalar_array_shifted_with_same_length_then_aligned_like_deepdiff(self):
+        self.assert_same_as_deepdiff([1, 2, 3], [2, 3, 4])
+        self.assert_same_as_deepdiff({"ids": [1, 2, 3, 4, 5]}, {"ids": [2, 3, 4, 5, 6]})
+        self.assertEqual(JSONSchemaAssertion([1, 2, 3], []).diff([2, 3, 4]),
+                         {'iterable_item_added': {'root[2]': 4}, 'iterable_item_removed': {'root[0]': 1}})
+
+    def test_when_scalar_array_shifted_with_different_length_then_aligned_like_deepdiff(self):
+        self.assert_same_as_deepdiff([1, 2, 3], [0, 1, 2, 3])
+        self.assert_same_as_deepdiff({"a": ["x", "y", "z"]}, {"a": ["y", "z"]})
+        self.assert_same_as_deepdiff({"a": [1, 2]}, {"a": [0, 1, 2, 3]}, ["root['a'][0]"])
+
+
+class CronAssertionCache(TestCase):
+    def test_when_cache_full_then_least_recently_used_evicted(self):
+        cache = AssertionCache(2)
+        cache.set('a', '')
+        cache.set('b', 'error')
+        self.assertEqual(cache.get('a'), '')
+        cache.set('c', '')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(list(cache.entries.keys()), ['a', 'c'])
+
+    def test_when_size_zero_then_nothing_cached(self):
+        cache = AssertionCache(0)
+        cache.set('a', '')
+        self.assertEqual(cache.get('a'), None)
+
+    def test_when_body_unchanged_then_assertion_not_run_again(self):
+        command = Command()
+        command.assertion_results = AssertionCache(10)
+        command.run_api_monitor_assertions = MagicMock(side_effect=AssertionError('Assertion text failed.'))
+        monitor = MagicMock(id=1, config_version=0)
+
+        self.assertEqual(command.check_api_monitor_assertions(monitor, 'body', 'hash'), 'Assertion text failed.')
+        self.assertEqual(command.check_api_monitor_assertions(monitor, 'body', 'hash'), 'Assertion text failed.')
+        self.assertEqual(command.run_api_monitor_assertions.call_count, 1)
+
+        monitor.config_version = 1
+        command.check_api_monitor_assertions(monitor, 'body', 'hash')
+        command.check_api_monitor_assertions(monitor, 'other body', 'other hash')
+        self.assertEqual(command.run_api_monitor_assertions.call_count, 3)
+
+
+class CronAssertionProcessPool(TestCase):
+    def test_when_assertion_run_on_process_then_same_outcome_as_thread(self):
+        specs = [
+            AssertionSpec('TEXT', 'expected', False, ()),
+            AssertionSpec('PARTIAL', 'key', False, ()),
+            AssertionSpec('JSON', '{"key": "value2", "list": [1]}', False, ()),
+            AssertionSpec('JSON', '{"key": "value2", "other": 1}', True, ("root['other']",)),
+            AssertionSpec('JSON', '{invalid', False, ()),
+        ]
+        responses = ['{"key": "value", "list": [1, 2]}', 'not json']
+
+        thread_command = Command()
+        process_command = Command()
+        process_command.assertion_pool = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            for idx, spec in enumerate(specs):
+                spec.id = idx
+                spec.config_version = 0
+                for response in responses:
+                    self.assertEqual(
+                        process_command.evaluate_api_monitor_assertions(spec, response),
+                        thread_command.evaluate_api_monitor_assertions(spec, response),
+                    )
+        finally:
+            process_command.assertion_pool.shutdown()
+
+    def test_when_assertion_pool_broken_then_run_on_thread_and_pool_replaced(self):
+        command = Command()
+        broken_pool = MagicMock()
+        broken_pool.submit.side_effect = BrokenProcessPool('process terminated')
+        command.assertion_pool = broken_pool
+        command.assertion_process_count = 2
+        spec = AssertionSpec('TEXT', 'expected', False, ())
+        spec.id = 1
+        spec.config_version = 0
+
+        with patch('cron.management.commands.run_cron.ProcessPoolExecutor') as mock_pool:
+            mock_pool.return_value.submit.return_value.result.return_value = ''
+            self.assertEqual(command.evaluate_api_monitor_assertions(spec, 'got'),
+                             'Assertion text failed.\nExpected: "expected"\nGot: "got"')
+            self.assertEqual(command.evaluate_api_monitor_assertions(spec, 'expected'), '')
+
+        broken_pool.shutdown.assert_called_once_with(wait=False)
+        self.assertEqual(mock_pool.call_count, 1)
+        self.assertEqual(mock_pool.call_args.args[0], 2)
+        self.assertIs(command.assertion_pool, mock_pool.return_value)
+        self.assertEqual(broken_pool.submit.call_count, 1)
+        self.assertEqual(mock_pool.return_value.submit.call_count, 1)
+
+    def test_when_spec_compiled_on_process_then_reused_by_key(self):
+        assertion_args = ('JSON', '{"key": "value"}', False, ())
+        self.assertEqual(run_assertions_in_process(('test', 0), assertion_args, '{"key": "value"}'), '')
+        spec = process_specs[('test', 0)]
+        self.assertEqual(run_assertions_in_process(('test', 0), assertion_args, '{"key": 1}'),
+                         'Different type detected on root[\'key\'], expected "value" (<class \'str\'>) but found "1" (<class \'int\'>)')
+        self.assertIs(process_specs[('test', 0)], spec)
+
+
 class CronManagementCommand(TransactionTestCase):
     local_timezone = pytz.timezone(settings.TIME_ZONE)
     mock_current_time = local_timezone.localize(datetime(2022,9,20,10))
@@ -204,7 +438,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, '')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt")
@@ -244,7 +478,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, '')
         
         
@@ -288,7 +522,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, '')
         
         
@@ -331,7 +565,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, '')
         
         
@@ -369,7 +603,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, '')
         
         
@@ -407,7 +641,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, False)
-        self.assertEqual(result[0].log_response, "")
+        self.assertEqual(result[0].get_log_response(), "")
         self.assertEqual(result[0].log_error, 'Request timed out.')
         
            
@@ -445,7 +679,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, '')
         
         
@@ -483,7 +717,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, '')
         
         
@@ -521,7 +755,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, '')
         
         
@@ -559,7 +793,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, '')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -596,7 +830,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, False)
-        self.assertEqual(result[0].log_response, "{\"testing\": \"testing value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"testing\": \"testing value\"}")
         self.assertEqual(result[0].log_error, 'Error code not in acceptable range 2xx')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -650,11 +884,14 @@ class CronManagementCommand(TransactionTestCase):
             pass
         time.sleep(0.1)
 
-        result = APIMonitorResult.objects.all()
-        self.assertEqual(len(result), 2)
-        self.assertEqual(result[1].success, True)
-        self.assertEqual(result[1].log_response, "{\"key\": \"value\"}")
-        self.assertEqual(result[1].log_error, '')
+        # Previous step result is recorded for its own monitor too
+        self.assertEqual(APIMonitorResult.objects.filter(monitor=monitor_prev).count(), 2)
+        
+        result = APIMonitorResult.objects.filter(monitor=monitor)
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].success, True)
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
+        self.assertEqual(result[0].log_error, '')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
     @patch("requests.get", mocked_request_get)
@@ -713,7 +950,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 12)
         self.assertEqual(result[11].success, False)
-        self.assertEqual(result[11].log_response, "")
+        self.assertEqual(result[11].get_log_response(), "")
         self.assertIn('Depth limit of previous step API monitor reached (maximum: 10)', result[11].log_error)
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -773,7 +1010,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 2)
         self.assertEqual(result[1].success, False)
-        self.assertEqual(result[1].log_response, "")
+        self.assertEqual(result[1].get_log_response(), "")
         self.assertIn('Request aborted due to recursion of API monitor steps', result[1].log_error)
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -827,11 +1064,14 @@ class CronManagementCommand(TransactionTestCase):
             pass
         time.sleep(0.1)
 
-        result = APIMonitorResult.objects.all()
-        self.assertEqual(len(result), 2)
-        self.assertEqual(result[1].success, False)
-        self.assertEqual(result[1].log_response, "")
-        self.assertIn('Error while preparing API monitor params: \'Value not found while accessing with key "testing.testing"\'', result[1].log_error)
+        # Previous step result is recorded for its own monitor too
+        self.assertEqual(APIMonitorResult.objects.filter(monitor=monitor_prev).count(), 2)
+        
+        result = APIMonitorResult.objects.filter(monitor=monitor)
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].success, False)
+        self.assertEqual(result[0].get_log_response(), "")
+        self.assertIn('Error while preparing API monitor params: \'Value not found while accessing with key "testing.testing"\'', result[0].log_error)
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
     @patch("requests.get", mocked_request_get)
@@ -885,11 +1125,14 @@ class CronManagementCommand(TransactionTestCase):
             pass
         time.sleep(0.1)
 
-        result = APIMonitorResult.objects.all()
-        self.assertEqual(len(result), 2)
-        self.assertEqual(result[1].success, True)
-        self.assertEqual(result[1].log_response, "NonJSON response")
-        self.assertEqual(result[1].log_error, '')
+        # Previous step result is recorded for its own monitor too
+        self.assertEqual(APIMonitorResult.objects.filter(monitor=monitor_prev).count(), 2)
+        
+        result = APIMonitorResult.objects.filter(monitor=monitor)
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].success, True)
+        self.assertEqual(result[0].get_log_response(), "NonJSON response")
+        self.assertEqual(result[0].log_error, '')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
     @patch("requests.get", mocked_request_get)
@@ -916,7 +1159,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, False)
-        self.assertEqual(result[0].log_response, "NonJSON response")
+        self.assertEqual(result[0].get_log_response(), "NonJSON response")
         self.assertEqual(result[0].log_error, 'Assertion text failed.\nExpected: ""\nGot: "NonJSON response"')
 
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -944,7 +1187,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, "NonJSON response")
+        self.assertEqual(result[0].get_log_response(), "NonJSON response")
         self.assertEqual(result[0].log_error, '')
 
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -972,7 +1215,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, False)
-        self.assertEqual(result[0].log_response, "NonJSON response")
+        self.assertEqual(result[0].get_log_response(), "NonJSON response")
         self.assertEqual(result[0].log_error, 'Partial Assertion text failed.\nExpected: "Monapi"\nGot: "NonJSON response"')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -1000,7 +1243,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, False)
-        self.assertEqual(result[0].log_response, "NonJSON response")
+        self.assertEqual(result[0].get_log_response(), "NonJSON response")
         self.assertEqual(result[0].log_error, 'Failed to decode JSON api response')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -1028,7 +1271,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, False)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, 'Failed to decode JSON monitor assertions value')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -1056,7 +1299,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, False)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, 'Different value detected on root[\'key\'], expected "value2" but found "value"')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -1085,7 +1328,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, '')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -1118,7 +1361,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, '')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -1146,7 +1389,39 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, False)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
+        self.assertEqual(result[0].log_error, 'Different type detected on root[\'key\'], expected "1" (<class \'int\'>) but found "value" (<class \'str\'>)')
+        
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("requests.get", mocked_request_get)
+    def test_when_assertion_process_pool_then_same_error(self, *args):
+        team = Team.objects.create(name='test team')
+        
+        APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='60MIN',
+            body_type='RAW',
+            assertion_type='JSON',
+            assertion_value='{\"key\": 1}',
+        )
+        
+        os.environ['CRON_ASSERTION_PROCESS_POOL'] = 'True'
+        os.environ['CRON_ASSERTION_PROCESS_COUNT'] = '1'
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+        finally:
+            del os.environ['CRON_ASSERTION_PROCESS_POOL']
+            del os.environ['CRON_ASSERTION_PROCESS_COUNT']
+        time.sleep(0.1)
+
+        result = APIMonitorResult.objects.all()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].success, False)
         self.assertEqual(result[0].log_error, 'Different type detected on root[\'key\'], expected "1" (<class \'int\'>) but found "value" (<class \'str\'>)')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -1174,7 +1449,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, False)
-        self.assertEqual(result[0].log_response, "{\"key\": \"value\"}")
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
         self.assertEqual(result[0].log_error, 'New key detected with keys [root[\'key\']]\nMissing key detected with keys [root[\'key2\']]')
         
     @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
@@ -1202,7 +1477,7 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, False)
-        self.assertEqual(result[0].log_response, '{"key": [{"key":"value"}], "key2":[]}')
+        self.assertEqual(result[0].get_log_response(), '{"key": [{"key":"value"}], "key2":[]}')
         self.assertEqual(result[0].log_error, 'Found iterable item added with keys dict_keys(["root[\'key\'][0]"])\nFound iterable item removed with keys dict_keys(["root[\'key2\'][0]"])')
         
         
@@ -1241,7 +1516,1571 @@ class CronManagementCommand(TransactionTestCase):
         result = APIMonitorResult.objects.all()
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0].success, True)
-        self.assertEqual(result[0].log_response, '{"key": [{"key":"value"}], "key2":[]}')
+        self.assertEqual(result[0].get_log_response(), '{"key": [{"key":"value"}], "key2":[]}')
         self.assertEqual(result[0].log_error, '')
         
         
+
+        
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("requests.get", mocked_request_get)
+    def test_when_next_run_at_not_passed_then_not_run(self, *args):
+        team = Team.objects.create(name='test team')
+        APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+            next_run_at=self.mock_current_time + timedelta(seconds=1),
+        )
+        
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+        
+        self.assertEqual(APIMonitorResult.objects.count(), 0)
+        
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("requests.get", mocked_request_get)
+    def test_when_monitor_run_then_next_run_at_moved_by_schedule(self, *args):
+        team = Team.objects.create(name='test team')
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='5MIN',
+            body_type='EMPTY',
+            next_run_at=self.mock_current_time,
+        )
+        
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+        
+        monitor.refresh_from_db()
+        self.assertEqual(APIMonitorResult.objects.count(), 1)
+        self.assertEqual(monitor.next_run_at, monitor.get_next_run_at(self.mock_current_time))
+        self.assertGreaterEqual(monitor.next_run_at, self.mock_current_time + timedelta(seconds=150))
+        self.assertLess(monitor.next_run_at, self.mock_current_time + timedelta(seconds=450))
+        
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    def test_when_monitor_never_scheduled_then_next_run_at_filled_from_last_result(self, *args):
+        team = Team.objects.create(name='test team')
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='10MIN',
+            body_type='EMPTY',
+        )
+        
+        APIMonitorResult.objects.create(
+            monitor=monitor,
+            execution_time=self.mock_current_time - timedelta(minutes=1),
+            response_time=10,
+            success=True,
+            status_code=200,
+            log_response='resp',
+            log_error='',
+        )
+        
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+        
+        monitor.refresh_from_db()
+        self.assertEqual(APIMonitorResult.objects.count(), 1)
+        self.assertEqual(monitor.next_run_at, monitor.get_next_run_at(self.mock_current_time - timedelta(minutes=1)))
+        
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("requests.get", mocked_request_get)
+    def test_when_host_rate_limited_then_monitor_run_later(self, *args):
+        os.environ['CRON_HOST_RATE_PER_SECOND'] = '5'
+        team = Team.objects.create(name='test team')
+        for _ in range(2):
+            APIMonitor.objects.create(
+                team=team,
+                name='apimonitor',
+                method='GET',
+                url='https://monapi.xyz',
+                schedule='1MIN',
+                body_type='EMPTY',
+            )
+        
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+        finally:
+            del os.environ['CRON_HOST_RATE_PER_SECOND']
+        
+        self.assertEqual(APIMonitorResult.objects.count(), 2)
+        
+    def test_when_host_acquired_again_then_spec_reused_without_query(self):
+        team = Team.objects.create(name='test team')
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+        )
+        command = Command()
+        command.probe_specs = ProbeSpecCache()
+        command.host_limiter = HostLimiter(rate=1, burst=1)
+        self.assertEqual(command.acquire_host(monitor.id)[1], 0)
+
+        with self.assertNumQueries(0):
+            key, wait = command.acquire_host(monitor.id)
+        self.assertEqual(key, None)
+        self.assertGreater(wait, 0)
+        
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("requests.Session.request", mocked_session_request)
+    def test_when_monitor_reuse_connection_then_use_session_pool(self, *args):
+        team = Team.objects.create(name='test team')
+        APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='POST',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+            is_reuse_connection=True,
+        )
+        
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+        
+        result = APIMonitorResult.objects.all()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].success, True)
+        self.assertEqual(result[0].get_log_response(), '{"method": "POST", "url": "https://monapi.xyz"}')
+        
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("requests.get", mocked_request_get_with_elapsed)
+    def test_when_monitor_run_then_record_phase_timing(self, *args):
+        team = Team.objects.create(name='test team')
+        APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+            assertion_type='TEXT',
+            assertion_value='{"key": "value"}',
+        )
+        
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+        
+        result = APIMonitorResult.objects.get()
+        self.assertEqual(result.success, True)
+        self.assertGreaterEqual(result.download_time, 0)
+        self.assertGreaterEqual(result.prepare_time, 0)
+        self.assertGreaterEqual(result.assertion_time, 0)
+        
+        # Mocked requests open no connection, so connection phases are not measured
+        self.assertEqual(result.dns_time, None)
+        self.assertEqual(result.connect_time, None)
+        self.assertEqual(result.tls_time, None)
+        self.assertEqual(result.first_byte_time, None)
+        
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("requests.get", side_effect=mocked_request_get)
+    def test_when_monitors_share_previous_step_then_previous_step_run_once(self, mock_get, *args):
+        team = Team.objects.create(name='test team')
+        monitor_prev = APIMonitor.objects.create(
+            team=team,
+            name='login',
+            method='GET',
+            url='https://monapitestprev.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+        )
+        monitors = []
+        for _ in range(3):
+            monitors.append(APIMonitor.objects.create(
+                team=team,
+                name='apimonitor',
+                method='GET',
+                url='https://monapi.xyz',
+                schedule='1MIN',
+                body_type='EMPTY',
+                previous_step=monitor_prev,
+            ))
+        
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+        
+        prev_calls = [call for call in mock_get.call_args_list if call.args[0] == 'https://monapitestprev.xyz']
+        self.assertEqual(len(prev_calls), 1)
+        self.assertEqual(APIMonitorResult.objects.filter(monitor=monitor_prev).count(), 1)
+        for monitor in monitors:
+            result = APIMonitorResult.objects.get(monitor=monitor)
+            self.assertEqual(result.success, True)
+        
+    @patch("requests.get", side_effect=mocked_request_get)
+    def test_when_previous_step_result_cache_ttl_then_reuse_result(self, mock_get):
+        team = Team.objects.create(name='test team')
+        monitor_prev = APIMonitor.objects.create(
+            team=team,
+            name='login',
+            method='GET',
+            url='https://monapitestprev.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+            result_cache_ttl=300,
+        )
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+            previous_step=monitor_prev,
+        )
+        
+        command = Command()
+        command.probe_specs = ProbeSpecCache()
+        command.step_results = StepResultCache(0)
+        for _ in range(2):
+            result = command.run_api_monitor_request(monitor.id)
+            self.assertEqual(result.success, True)
+        
+        prev_calls = [call for call in mock_get.call_args_list if call.args[0] == 'https://monapitestprev.xyz']
+        self.assertEqual(len(prev_calls), 1)
+        self.assertEqual(APIMonitorResult.objects.filter(monitor=monitor_prev).count(), 1)
+        
+    @patch("requests.get", mocked_request_get)
+    def test_when_monitor_not_used_as_previous_step_then_result_not_cached(self):
+        team = Team.objects.create(name='test team')
+        monitor_prev = APIMonitor.objects.create(
+            team=team,
+            name='login',
+            method='GET',
+            url='https://monapitestprev.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+        )
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+            previous_step=monitor_prev,
+        )
+        
+        command = Command()
+        command.probe_specs = ProbeSpecCache()
+        command.step_results = StepResultCache(60)
+        for _ in range(2):
+            self.assertNotEqual(command.run_api_monitor_request(monitor.id), None)
+        
+        self.assertEqual(list(command.step_results.entries.keys()), [(monitor_prev.id, monitor_prev.config_version)])
+        
+    def test_when_cached_previous_step_unauthorized_then_run_previous_step_again(self):
+        team = Team.objects.create(name='test team')
+        monitor_prev = APIMonitor.objects.create(
+            team=team,
+            name='login',
+            method='GET',
+            url='https://monapitestprev.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+            result_cache_ttl=300,
+        )
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+            previous_step=monitor_prev,
+        )
+        
+        # Token expired on second run
+        status_codes = [200, 401, 200]
+        def mocked_request_get_unauthorized(*args, **kwargs):
+            if args[0] == 'https://monapitestprev.xyz':
+                return MockResponse('{"token": "token"}', 200)
+            return MockResponse('{"key": "value"}', status_codes.pop(0))
+        
+        command = Command()
+        command.probe_specs = ProbeSpecCache()
+        command.step_results = StepResultCache(0)
+        with patch("requests.get", side_effect=mocked_request_get_unauthorized) as mock_get:
+            for _ in range(2):
+                result = command.run_api_monitor_request(monitor.id)
+                self.assertEqual(result.success, True)
+        
+        prev_calls = [call for call in mock_get.call_args_list if call.args[0] == 'https://monapitestprev.xyz']
+        self.assertEqual(len(prev_calls), 2)
+        self.assertEqual(status_codes, [])
+        
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("requests.get", mocked_request_get)
+    def test_when_response_larger_than_max_body_size_then_store_beginning_of_body(self, *args):
+        team = Team.objects.create(name='test team')
+        APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+            max_body_size=5,
+        )
+        
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+        
+        result = APIMonitorResult.objects.get()
+        self.assertEqual(result.success, True)
+        self.assertEqual(result.get_log_response(), '{"key')
+        self.assertEqual(result.response_size, 16)
+        self.assertEqual(result.response_hash, hashlib.sha256(b'{"key": "value"}').hexdigest())
+        self.assertEqual(result.is_response_partial, True)
+        
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("requests.get", mocked_request_get)
+    def test_when_assertion_enabled_and_body_capped_then_assert_whole_body(self, *args):
+        os.environ['CRON_MAX_BODY_SIZE'] = '5'
+        team = Team.objects.create(name='test team')
+        APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+            assertion_type='TEXT',
+            assertion_value='{"key": "value"}',
+        )
+        
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+        finally:
+            del os.environ['CRON_MAX_BODY_SIZE']
+        
+        result = APIMonitorResult.objects.get()
+        self.assertEqual(result.success, True)
+        self.assertEqual(result.get_log_response(), '{"key')
+        self.assertEqual(result.response_size, 16)
+        self.assertEqual(result.is_response_partial, False)
+        
+    def test_when_trace_events_recorded_then_return_phase_timing(self):
+        events = {
+            'connect_start': 1.0,
+            'dns_start': 1.0,
+            'dns_end': 1.01,
+            'connect_end': 1.05,
+            'headers_sent': 1.06,
+            'headers_received': 1.16,
+        }
+        timing = Command().get_trace_timing(events, 1.2)
+        self.assertAlmostEqual(timing['dns_time'], 10)
+        self.assertAlmostEqual(timing['connect_time'], 40)
+        self.assertAlmostEqual(timing['first_byte_time'], 100)
+        self.assertAlmostEqual(timing['download_time'], 40)
+        
+        # Reused connection only have request events
+        timing = Command().get_trace_timing({'headers_sent': 1.0, 'headers_received': 1.1}, 1.1)
+        self.assertEqual(set(timing.keys()), {'first_byte_time', 'download_time'})
+        
+        # TLS handshake is part of connection events
+        timing = Command().get_trace_timing({**events, 'tls_time': 15}, 1.2)
+        self.assertAlmostEqual(timing['connect_time'], 25)
+        self.assertEqual(timing['tls_time'], 15)
+        
+    def test_when_get_next_run_at_then_run_on_monitor_phase(self):
+        team = Team.objects.create(name='test team')
+        phase_epoch = datetime(1970, 1, 1, tzinfo=pytz.utc)
+        for schedule in ['10SEC', '30SEC', '1MIN', '60MIN']:
+            period = APIMonitor.schedule_in_seconds[schedule]
+            monitor = APIMonitor.objects.create(
+                team=team,
+                name='apimonitor',
+                method='GET',
+                url='https://monapi.xyz',
+                schedule=schedule,
+                body_type='EMPTY',
+            )
+            
+            next_run_at = monitor.get_next_run_at(self.mock_current_time)
+            self.assertEqual((next_run_at - phase_epoch).total_seconds() % period, mmh3.hash(str(monitor.id), signed=False) % period)
+            self.assertGreaterEqual(next_run_at, self.mock_current_time + timedelta(seconds=period / 2))
+            self.assertLess(next_run_at, self.mock_current_time + timedelta(seconds=period * 1.5))
+            
+            # Monitor keep the same phase on following runs
+            self.assertEqual(monitor.get_next_run_at(next_run_at), next_run_at + timedelta(seconds=period))
+            
+    def test_when_many_monitors_same_schedule_then_spread_over_period(self):
+        team = Team.objects.create(name='test team')
+        next_run_times = set()
+        for _ in range(20):
+            monitor = APIMonitor.objects.create(
+                team=team,
+                name='apimonitor',
+                method='GET',
+                url='https://monapi.xyz',
+                schedule='60MIN',
+                body_type='EMPTY',
+            )
+            next_run_times.add(monitor.get_next_run_at(self.mock_current_time))
+        
+        self.assertGreater(len(next_run_times), 15)
+
+
+class CronDispatchQueue(TestCase):
+    local_timezone = pytz.timezone(settings.TIME_ZONE)
+    mock_current_time = local_timezone.localize(datetime(2022,9,20,10))
+
+    def test_when_get_then_most_overdue_monitor_first(self):
+        q = DispatchQueue()
+        q.put(1, self.mock_current_time)
+        q.put(2, self.mock_current_time - timedelta(minutes=5))
+        q.put(3, self.mock_current_time - timedelta(minutes=1))
+
+        self.assertEqual([q.get(), q.get(), q.get()], [2, 3, 1])
+
+    def test_when_monitor_already_queued_then_not_queued_twice(self):
+        q = DispatchQueue()
+        self.assertEqual(q.put(1, self.mock_current_time), True)
+        self.assertEqual(q.put(1, self.mock_current_time), False)
+        self.assertEqual(q.qsize(), 1)
+        self.assertEqual(q.unfinished_tasks, 1)
+
+        # Monitor taken by worker can be queued again
+        q.get()
+        self.assertEqual(q.put(1, self.mock_current_time), True)
+
+    def test_when_queue_closed_then_waiting_worker_get_none(self):
+        q = DispatchQueue()
+        results = []
+        worker = threading.Thread(target=lambda: results.append(q.get()))
+        worker.start()
+
+        q.close()
+        worker.join(1)
+        self.assertEqual(worker.is_alive(), False)
+        self.assertEqual(results, [None])
+
+    def test_when_task_not_done_then_join_timeout(self):
+        q = DispatchQueue()
+        q.put(1)
+        q.get()
+        self.assertEqual(q.join(0.01), False)
+
+        q.task_done()
+        self.assertEqual(q.join(0.01), True)
+
+    def test_when_drain_then_return_pending_monitor_in_order(self):
+        q = DispatchQueue()
+        q.put(1, self.mock_current_time)
+        q.put(2, self.mock_current_time - timedelta(minutes=1))
+
+        self.assertEqual(q.pending(), [2, 1])
+        self.assertEqual(q.drain(), [2, 1])
+        self.assertEqual(q.qsize(), 0)
+        self.assertEqual(q.join(0), True)
+
+    def test_when_monitor_deferred_then_available_after_delay(self):
+        q = DispatchQueue()
+        q.put(1)
+        q.put(2)
+        q.defer(q.get(), 0.2)
+
+        start = time.monotonic()
+        self.assertEqual(q.get(), 2)
+        q.task_done()
+        self.assertEqual(q.join(0), False)
+
+        self.assertEqual(q.get(), 1)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        q.task_done()
+        self.assertEqual(q.join(0), True)
+
+    def test_when_deferred_monitor_already_queued_then_coalesced(self):
+        q = DispatchQueue()
+        q.put(1)
+        q.get()
+        q.put(1)
+
+        self.assertEqual(q.defer(1, 1), False)
+        self.assertEqual(q.unfinished_tasks, 1)
+
+
+class CronHostLimiter(TestCase):
+    def test_when_token_bucket_empty_then_return_wait_until_refill(self):
+        bucket = TokenBucket(2, 1)
+        now = bucket.updated_at
+        self.assertEqual(bucket.try_acquire(now), 0)
+        self.assertAlmostEqual(bucket.try_acquire(now), 0.5)
+        self.assertEqual(bucket.try_acquire(now + 0.5), 0)
+
+    def test_when_host_concurrency_full_then_other_host_not_limited(self):
+        limiter = HostLimiter(max_concurrency=1)
+        key, wait = limiter.try_acquire('https://monapi.xyz/a', 1)
+        self.assertEqual(wait, 0)
+
+        self.assertEqual(limiter.try_acquire('https://MONAPI.xyz/b', 2)[0], None)
+        self.assertEqual(limiter.try_acquire('https://other.xyz/a', 1)[1], 0)
+
+        limiter.release(key)
+        self.assertEqual(limiter.try_acquire('https://monapi.xyz/b', 2)[1], 0)
+
+    def test_when_host_rate_limited_then_return_wait(self):
+        limiter = HostLimiter(rate=1, burst=2)
+        self.assertEqual(limiter.try_acquire('https://monapi.xyz', 1)[1], 0)
+        self.assertEqual(limiter.try_acquire('https://monapi.xyz', 1)[1], 0)
+
+        key, wait = limiter.try_acquire('https://monapi.xyz', 1)
+        self.assertEqual(key, None)
+        self.assertGreater(wait, 0)
+
+    def test_when_team_only_configure_retention_then_limiter_stay_disabled(self):
+        team = Team.objects.create(name='test team')
+        CronConfiguration.objects.create(team=team, success_retention_days=7)
+        unlimited_team = Team.objects.create(name='unlimited team')
+        CronConfiguration.objects.create(team=unlimited_team, host_burst=5)
+
+        limiter = HostLimiter()
+        limiter.set_team_limits(load_team_limits(limiter.default_limits))
+        self.assertEqual(limiter.team_limits, {unlimited_team.id: (0, 0, 5)})
+        self.assertFalse(limiter.is_enabled())
+
+        limiter.set_team_limits({unlimited_team.id: (1, 0, 1)})
+        self.assertTrue(limiter.is_enabled())
+
+    def test_when_team_configured_then_use_team_limit_and_own_budget(self):
+        team = Team.objects.create(name='test team')
+        CronConfiguration.objects.create(team=team, host_max_concurrency=2)
+
+        limiter = HostLimiter(max_concurrency=1, rate=0, burst=1)
+        limiter.set_team_limits(load_team_limits(limiter.default_limits))
+        self.assertEqual(limiter.team_limits, {team.id: (2, 0, 1)})
+
+        self.assertEqual(limiter.try_acquire('https://monapi.xyz', None)[1], 0)
+        self.assertEqual(limiter.try_acquire('https://monapi.xyz', team.id)[1], 0)
+        self.assertEqual(limiter.try_acquire('https://monapi.xyz', team.id)[1], 0)
+        self.assertEqual(limiter.try_acquire('https://monapi.xyz', team.id)[0], None)
+
+
+class CronSessionPool(TestCase):
+    def test_when_same_host_then_reuse_session(self):
+        pool = SessionPool(10, 60)
+        session = pool.acquire('https://monapi.xyz')
+        pool.release('https://monapi.xyz')
+
+        self.assertIs(pool.acquire('https://monapi.xyz'), session)
+        self.assertIsNot(pool.acquire('https://other.xyz'), session)
+
+    def test_when_session_idle_then_evicted(self):
+        pool = SessionPool(10, 0)
+        session = pool.acquire('https://monapi.xyz')
+        pool.release('https://monapi.xyz')
+        time.sleep(0.01)
+
+        pool.acquire('https://other.xyz')
+        self.assertEqual(list(pool.sessions.keys()), ['https://other.xyz'])
+        self.assertIsNot(pool.acquire('https://monapi.xyz'), session)
+
+    def test_when_session_in_use_then_not_evicted(self):
+        pool = SessionPool(10, 0)
+        session = pool.acquire('https://monapi.xyz')
+        pool.acquire('https://other.xyz')
+        self.assertIs(pool.sessions['https://monapi.xyz'], session)
+
+    @patch("requests.Session.request", mocked_session_request)
+    def test_when_request_then_session_released(self):
+        pool = SessionPool(10, 60)
+        response = pool.request('GET', 'https://monapi.xyz/path')
+        self.assertEqual(response.content, b'{"method": "GET", "url": "https://monapi.xyz/path"}')
+        self.assertEqual(pool.in_use['https://monapi.xyz'], 0)
+
+
+class CronProbeSpecCache(TestCase):
+    def setUp(self):
+        self.team = Team.objects.create(name='test team')
+        self.previous_monitor = APIMonitor.objects.create(
+            team=self.team,
+            name='previous monitor',
+            method='GET',
+            url='https://monapitestprev.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+        )
+        self.monitor = APIMonitor.objects.create(
+            team=self.team,
+            name='apimonitor',
+            method='POST',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='RAW',
+            previous_step=self.previous_monitor,
+            assertion_type='JSON',
+            assertion_value='{"key": "value"}',
+        )
+        APIMonitorHeader.objects.create(monitor=self.monitor, key='header key', value='header value')
+        APIMonitorRawBody.objects.create(monitor=self.monitor, body='raw body')
+        AssertionExcludeKey.objects.create(monitor=self.monitor, exclude_key='a.b[0].c')
+
+    def test_when_get_then_build_steps_from_monitor(self):
+        steps, error = ProbeSpecCache().get(self.monitor.id)
+        self.assertEqual(error, None)
+        self.assertEqual([step.id for step in steps], [self.monitor.id, self.previous_monitor.id])
+        self.assertEqual([(key.text, value.text) for key, value in steps[0].headers], [('header key', 'header value')])
+        self.assertEqual(steps[0].raw_body.text, 'raw body')
+        self.assertEqual(steps[0].assertion_json, {"key": "value"})
+        self.assertEqual(steps[0].exclude_paths, ("root['a']['b'][0]['c']",))
+        self.assertEqual(steps[1].raw_body, None)
+        self.assertEqual(steps[0].is_previous_step, False)
+        self.assertEqual(steps[1].is_previous_step, True)
+
+    def test_when_steps_cached_then_no_query(self):
+        cache = ProbeSpecCache()
+        steps = cache.get(self.monitor.id)
+        with self.assertNumQueries(0):
+            self.assertIs(cache.get(self.monitor.id), steps)
+
+    def test_when_config_version_changed_then_rebuild_steps(self):
+        cache = ProbeSpecCache()
+        steps = cache.get(self.monitor.id)
+
+        cache.invalidate_stale({self.monitor.id: 0})
+        self.assertIs(cache.get(self.monitor.id), steps)
+
+        APIMonitorHeader.objects.filter(monitor=self.monitor).update(value='new value')
+        self.previous_monitor.bump_config_version()
+        cache.invalidate_stale({self.monitor.id: 1})
+        new_steps, _ = cache.get(self.monitor.id)
+        self.assertEqual(new_steps[0].headers[0][1].text, 'new value')
+        self.assertEqual(new_steps[0].config_version, 1)
+
+    def test_when_exclude_key_without_array_then_translate_to_dict_path(self):
+        self.assertEqual(get_exclude_path('a.b'), "root['a']['b']")
+
+
+class CronResponseBody(TestCase):
+    def test_when_keep_size_given_then_keep_beginning_and_hash_whole_body(self):
+        body = ResponseBody(4)
+        for chunk in [b'abc', b'def', b'ghi']:
+            body.feed(chunk)
+        self.assertEqual(body.get_content(), b'abcd')
+        self.assertEqual(body.size, 9)
+        self.assertEqual(body.get_hash(), hashlib.sha256(b'abcdefghi').hexdigest())
+
+    def test_when_body_larger_than_keep_size_then_stop_reading(self):
+        response = MockResponse('abcdefghij', 200)
+        read_chunks = []
+        chunks = response.iter_content(2)
+        response.iter_content = lambda chunk_size: (read_chunks.append(chunk) or chunk for chunk in chunks)
+
+        body = read_response_body(response, 3)
+        self.assertEqual(body.get_content(), b'abc')
+        self.assertEqual(read_chunks, [b'ab', b'cd'])
+        self.assertEqual(body.size, 4)
+        self.assertEqual(body.get_hash(), hashlib.sha256(b'abcd').hexdigest())
+        self.assertEqual(body.is_partial, True)
+
+        body = read_response_body(MockResponse('abc', 200), 3)
+        self.assertEqual(body.is_partial, False)
+
+    def test_when_no_keep_size_then_keep_whole_body(self):
+        body = ResponseBody()
+        for chunk in [b'abc', b'def']:
+            body.feed(chunk)
+        self.assertEqual(body.get_content(), b'abcdef')
+        self.assertEqual(body.kept_size, 6)
+
+
+class CronResultWriter(TransactionTestCase):
+    local_timezone = pytz.timezone(settings.TIME_ZONE)
+    mock_current_time = local_timezone.localize(datetime(2022,9,20,10))
+
+    def setUp(self):
+        team = Team.objects.create(name='test team')
+        self.monitor = APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+        )
+
+    def create_result(self):
+        return APIMonitorResult(monitor=self.monitor, execution_time=self.mock_current_time, response_time=10,
+                                success=True, status_code=200, log_response='{"key": "value"}', log_error='')
+
+    def test_when_batch_full_then_write_batch(self):
+        writer = ResultWriter(batch_size=2, flush_interval=60)
+        writer.write = MagicMock(side_effect=writer.write)
+        writer.start()
+        for _ in range(3):
+            writer.put(self.create_result())
+        writer.close()
+
+        self.assertEqual([len(call.args[0]) for call in writer.write.call_args_list], [2, 1])
+        self.assertEqual(APIMonitorResult.objects.count(), 3)
+        self.assertEqual(APIMonitorResponseBlob.objects.count(), 1)
+
+    def test_when_batch_written_then_rollups_updated(self):
+        writer = ResultWriter(batch_size=2, flush_interval=60)
+        writer.start()
+        for _ in range(3):
+            writer.put(self.create_result())
+        writer.close()
+
+        rollups = APIMonitorResultRollup.objects.filter(monitor=self.monitor)
+        self.assertEqual(sorted(rollups.values_list('period', flat=True)), ['DAY', 'HOUR', 'MINUTE'])
+        for rollup in rollups:
+            self.assertEqual((rollup.success_count, rollup.failure_count, rollup.response_time_sum), (3, 0, 30))
+
+    def test_when_batch_has_result_of_deleted_monitor_then_only_that_result_dropped(self):
+        deleted_monitor = APIMonitor.objects.create(
+            team=self.monitor.team,
+            name='deleted apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+        )
+        deleted_result = self.create_result()
+        deleted_result.monitor_id = deleted_monitor.id
+        deleted_monitor.delete()
+
+        writer = ResultWriter()
+        writer.write([self.create_result(), deleted_result, self.create_result()])
+
+        results = APIMonitorResult.objects.all()
+        self.assertEqual([result.monitor_id for result in results], [self.monitor.id, self.monitor.id])
+        self.assertEqual([result.get_log_response() for result in results], ['{"key": "value"}'] * 2)
+        minute_rollup = APIMonitorResultRollup.objects.get(monitor=self.monitor, period='MINUTE')
+        self.assertEqual(minute_rollup.success_count, 2)
+        self.assertEqual(APIMonitorResultNotification.objects.filter(monitor=self.monitor).count(), 2)
+
+    def test_when_batch_written_then_alerts_notified(self):
+        writer = ResultWriter(batch_size=2, flush_interval=60)
+        writer.start()
+        for _ in range(3):
+            writer.put(self.create_result())
+        writer.close()
+
+        # One notification of each written batch
+        notifications = APIMonitorResultNotification.objects.filter(monitor=self.monitor)
+        self.assertEqual(sorted(notifications.values_list('success_count', flat=True)), [1, 2])
+        self.assertEqual(set(notifications.values_list('bucket', flat=True)), {self.mock_current_time})
+
+    def test_when_flush_interval_passed_then_write_partial_batch(self):
+        writer = ResultWriter(batch_size=100, flush_interval=0.05)
+        writer.start()
+        writer.put(self.create_result())
+        time.sleep(0.5)
+        self.assertEqual(APIMonitorResult.objects.count(), 1)
+        writer.close()
+
+    def test_when_queue_full_then_put_wait_for_writer(self):
+        writer = ResultWriter(batch_size=100, flush_interval=0.05, max_queue_size=1)
+        writer.put(self.create_result())
+        producer = threading.Thread(target=writer.put, args=[self.create_result()])
+        producer.start()
+        time.sleep(0.1)
+        self.assertTrue(producer.is_alive())
+
+        writer.start()
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+        writer.close()
+        self.assertEqual(APIMonitorResult.objects.count(), 2)
+
+
+class CronPipelineStage(TestCase):
+    def test_when_closed_then_every_item_processed(self):
+        processed = []
+        stage = PipelineStage('test', processed.append, 3)
+        stage.start()
+        for idx in range(10):
+            stage.put(idx)
+        stage.close()
+
+        self.assertEqual(sorted(processed), list(range(10)))
+        self.assertEqual(stage.get_metrics()[:2], (0, 10))
+
+    def test_when_handler_failed_then_continue_next_item(self):
+        processed = []
+        def handler(item):
+            if item == 0:
+                raise ValueError('failed')
+            processed.append(item)
+        stage = PipelineStage('test', handler)
+        stage.start()
+        stage.put(0)
+        stage.put(1)
+        stage.close()
+
+        self.assertEqual(processed, [1])
+        self.assertEqual(stage.get_metrics()[1], 2)
+
+    def test_when_queue_full_then_put_wait_for_stage(self):
+        stage = PipelineStage('test', lambda item: None, 1, 1)
+        stage.put(0)
+        producer = threading.Thread(target=stage.put, args=[1])
+        producer.start()
+        time.sleep(0.1)
+        self.assertTrue(producer.is_alive())
+
+        stage.start()
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+        stage.close()
+
+    def test_when_assertion_stage_enabled_then_assertion_run_before_save(self):
+        command = Command()
+        command.assertion_stage = PipelineStage('assertion', command.assert_result)
+        command.write_result = MagicMock()
+        monitor = MagicMock(id=1, config_version=0, assertion_type='TEXT', assertion_value='expected')
+
+        result = command.create_api_monitor_result(monitor, 200, b'got', '', True, 'hash')
+        self.assertEqual((result.success, result.pending_assertion), (True, (monitor, 'got', 'hash')))
+
+        command.assertion_stage.start()
+        command.save_result(result)
+        command.assertion_stage.close()
+
+        command.write_result.assert_called_once_with(result)
+        self.assertEqual(result.success, False)
+        self.assertEqual(result.log_error, 'Assertion text failed.\nExpected: "expected"\nGot: "got"')
+        self.assertEqual(result.pending_assertion, None)
+
+    def test_when_assertion_crash_then_result_still_written_as_failed(self):
+        command = Command()
+        command.assertion_stage = PipelineStage('assertion', command.assert_result)
+        command.write_result = MagicMock()
+        command.check_api_monitor_assertions = MagicMock(side_effect=ValueError('invalid assertion value'))
+        monitor = MagicMock(id=1, config_version=0, assertion_type='TEXT', assertion_value='expected')
+
+        result = command.create_api_monitor_result(monitor, 200, b'got', '', True, 'hash')
+        command.assertion_stage.start()
+        command.save_result(result)
+        command.assertion_stage.close()
+
+        command.write_result.assert_called_once_with(result)
+        self.assertEqual(result.success, False)
+        self.assertEqual(result.log_error, 'invalid assertion value')
+
+
+class CronPurgeResults(TransactionTestCase):
+    def setUp(self):
+        self.team = Team.objects.create(name='test team')
+        self.monitor = APIMonitor.objects.create(
+            team=self.team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+        )
+
+    def create_result(self, monitor, days_ago, success):
+        return APIMonitorResult.objects.create(
+            monitor=monitor,
+            execution_time=timezone.now() - timedelta(days=days_ago),
+            response_time=10,
+            success=success,
+            status_code=200,
+            log_response='resp',
+            log_error='',
+        )
+
+    def test_when_result_older_than_retention_then_purged(self):
+        recent_success = self.create_result(self.monitor, 1, True)
+        self.create_result(self.monitor, 40, True)
+        self.create_result(self.monitor, 41, True)
+        old_failure = self.create_result(self.monitor, 40, False)
+        self.create_result(self.monitor, 100, False)
+
+        call_command('purge_results', chunk_size=1, stdout=StringIO())
+
+        remaining_ids = set(APIMonitorResult.objects.values_list('id', flat=True))
+        self.assertEqual(remaining_ids, {recent_success.id, old_failure.id})
+
+    def test_when_result_purged_then_count_reclaimed_bytes(self):
+        result = self.create_result(self.monitor, 40, False)
+        result.log_error = 'gagal terhubung é'
+        result.save()
+
+        deleted_count, deleted_bytes = purge_monitor_results(self.monitor.id, False, timezone.now(), 1000, 0)
+        self.assertEqual(deleted_count, 1)
+        self.assertEqual(deleted_bytes, len('resp'.encode('utf-8')) + len('gagal terhubung é'.encode('utf-8')))
+
+    def test_when_team_retention_configured_then_use_team_retention(self):
+        CronConfiguration.objects.create(team=self.team, success_retention_days=0, failure_retention_days=10)
+        old_success = self.create_result(self.monitor, 400, True)
+        self.create_result(self.monitor, 20, False)
+
+        call_command('purge_results', stdout=StringIO())
+
+        self.assertEqual(list(APIMonitorResult.objects.values_list('id', flat=True)), [old_success.id])
+
+    def test_when_rollup_older_than_rollup_retention_then_purged(self):
+        self.create_result(self.monitor, 400, True)
+        self.create_result(self.monitor, 1, True)
+
+        call_command('purge_results', chunk_size=1, stdout=StringIO())
+
+        self.assertEqual(APIMonitorResultRollup.objects.count(), 3)
+        self.assertEqual(APIMonitorResultRollup.objects.filter(bucket__lt=timezone.now() - timedelta(days=2)).count(), 0)
+
+    def test_when_blob_not_used_then_purged(self):
+        result = self.create_result(self.monitor, 40, True)
+        result.store_log_response()
+        result.save()
+        kept_result = self.create_result(self.monitor, 1, True)
+        kept_result.log_response = 'other'
+        kept_result.store_log_response()
+        kept_result.save()
+
+        call_command('purge_results', stdout=StringIO())
+
+        self.assertEqual(list(APIMonitorResponseBlob.objects.values_list('hash', flat=True)), [kept_result.response_blob_id])
+
+    def test_when_notification_older_than_alert_window_then_purged(self):
+        self.create_result(self.monitor, 2, True)
+        fresh_result = self.create_result(self.monitor, 0, False)
+        self.assertEqual(APIMonitorResultNotification.objects.count(), 2)
+
+        call_command('purge_results', stdout=StringIO())
+
+        notifications = list(APIMonitorResultNotification.objects.values_list('bucket', 'failure_count'))
+        self.assertEqual(notifications, [(fresh_result.execution_time.replace(second=0, microsecond=0), 1)])
+
+    def test_longest_retention_none_when_any_retention_kept_forever(self):
+        self.assertEqual(get_longest_retention_days((30, 90, 365), {self.team.id: (30, 120, 365)}), 120)
+        self.assertEqual(get_longest_retention_days((30, 90, 365), {self.team.id: (0, 7, 365)}), None)
+
+    def test_when_load_team_retention_then_fallback_to_default(self):
+        CronConfiguration.objects.create(team=self.team, failure_retention_days=7)
+        self.assertEqual(load_team_retention((30, 90, 365)), {self.team.id: (30, 7, 365)})
+
+
+class CronStepResultCache(TestCase):
+    def test_when_result_fresh_then_not_run_again(self):
+        cache = StepResultCache(60)
+        run = MagicMock(return_value='result')
+        self.assertEqual(cache.get_or_run('key', run), ('result', True))
+        self.assertEqual(cache.get_or_run('key', run), ('result', False))
+        self.assertEqual(run.call_count, 1)
+
+    def test_when_result_expired_then_run_again(self):
+        cache = StepResultCache(0)
+        run = MagicMock(return_value='result')
+        cache.get_or_run('key', run)
+        time.sleep(0.01)
+        self.assertEqual(cache.get_or_run('key', run), ('result', True))
+        self.assertEqual(run.call_count, 2)
+
+        cache.evict_expired()
+        self.assertEqual(cache.entries, {})
+
+    def test_when_exclusive_then_shared_result_taken_once(self):
+        cache = StepResultCache(60)
+        run = MagicMock(return_value='result')
+        cache.get_or_run('key', run)
+        self.assertEqual(cache.get_or_run('key', run, True), ('result', False))
+        self.assertEqual(cache.get_or_run('key', run, True), ('result', True))
+        self.assertEqual(cache.get_or_run('key', run), ('result', False))
+        self.assertEqual(run.call_count, 2)
+
+    def test_when_ttl_given_then_override_default_ttl(self):
+        cache = StepResultCache(0)
+        run = MagicMock(return_value='result')
+        cache.get_or_run('key', run, ttl=60)
+        time.sleep(0.01)
+        self.assertEqual(cache.get_or_run('key', run), ('result', False))
+
+        cache.invalidate('key')
+        self.assertEqual(cache.get_or_run('key', run), ('result', True))
+        self.assertEqual(run.call_count, 2)
+
+    def test_when_run_concurrently_then_other_caller_wait_result(self):
+        cache = StepResultCache(60)
+        run_count = []
+        def run():
+            run_count.append(1)
+            time.sleep(0.1)
+            return 'result'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_run('key', run))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(run_count), 1)
+        self.assertEqual(sorted(is_new for _, is_new in results), [False, False, True])
+
+    def test_when_run_failed_then_waiting_caller_run_again(self):
+        cache = StepResultCache(60)
+        with self.assertRaises(ValueError):
+            cache.get_or_run('key', MagicMock(side_effect=ValueError))
+        self.assertEqual(cache.get_or_run('key', lambda: 'result'), ('result', True))
+
+    def test_when_async_run_concurrently_then_run_once(self):
+        cache = StepResultCache(60)
+        run_count = []
+        async def run():
+            run_count.append(1)
+            await asyncio.sleep(0.1)
+            return 'result'
+
+        async def run_all():
+            return await asyncio.gather(*[cache.async_get_or_run('key', run) for _ in range(3)])
+
+        results = asyncio.run(run_all())
+        self.assertEqual(len(run_count), 1)
+        self.assertEqual(sorted(is_new for _, is_new in results), [False, False, True])
+
+
+class CronWorkQueue(TransactionTestCase):
+    local_timezone = pytz.timezone(settings.TIME_ZONE)
+    mock_current_time = local_timezone.localize(datetime(2022,9,20,10))
+
+    def setUp(self):
+        timezone.now = lambda: self.mock_current_time
+        timezone.localtime = lambda: self.mock_current_time
+        os.environ['CRON_INTERVAL_IN_SECONDS'] = '2'
+
+        self.team = Team.objects.create(name='test team')
+        self.monitor = APIMonitor.objects.create(
+            team=self.team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+        )
+
+    def call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command("run_cron", *args, stdout=out, stderr=StringIO(), **kwargs)
+        return out.getvalue()
+
+    def test_when_enqueue_due_monitors_then_create_work_item_once(self):
+        monitor_ids = enqueue_due_monitors(self.mock_current_time)
+        self.assertEqual(monitor_ids, [self.monitor.id])
+        self.assertEqual(CronWorkItem.objects.filter(monitor=self.monitor).count(), 1)
+
+        self.monitor.refresh_from_db()
+        self.assertEqual(self.monitor.next_run_at, self.monitor.get_next_run_at(self.mock_current_time))
+
+        monitor_ids = enqueue_due_monitors(self.mock_current_time)
+        self.assertEqual(monitor_ids, [])
+        self.assertEqual(CronWorkItem.objects.count(), 1)
+
+    def test_when_monitor_still_queued_then_not_queued_twice(self):
+        enqueue_due_monitors(self.mock_current_time)
+        enqueue_due_monitors(self.mock_current_time + timedelta(minutes=1))
+        self.assertEqual(CronWorkItem.objects.count(), 1)
+
+    def test_when_item_leased_then_other_worker_cannot_claim_until_lease_expired(self):
+        enqueue_due_monitors(self.mock_current_time)
+
+        self.assertEqual(claim_work_items('worker-a', 10, 60), [self.monitor.id])
+        self.assertEqual(claim_work_items('worker-b', 10, 60), [])
+
+        lease_expired_time = self.mock_current_time + timedelta(seconds=61)
+        timezone.now = lambda: lease_expired_time
+        self.assertEqual(claim_work_items('worker-b', 10, 60), [self.monitor.id])
+
+        # Worker with expired lease must not remove item of the new owner
+        complete_work_item('worker-a', self.monitor.id)
+        self.assertEqual(CronWorkItem.objects.count(), 1)
+        complete_work_item('worker-b', self.monitor.id)
+        self.assertEqual(CronWorkItem.objects.count(), 0)
+
+    def test_when_release_work_items_then_claimable_again(self):
+        enqueue_due_monitors(self.mock_current_time)
+        claim_work_items('worker-a', 10, 60)
+        release_work_items('worker-a')
+        self.assertEqual(claim_work_items('worker-b', 10, 60), [self.monitor.id])
+
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt")
+    @patch("requests.get", mocked_request_get)
+    def test_when_database_queue_backend_then_run_from_work_item(self, mock_cron, *args):
+        mock_cron.side_effect = [None, InterruptedError]
+        os.environ['CRON_QUEUE_BACKEND'] = 'DATABASE'
+        os.environ['CRON_QUEUE_POLL_IN_SECONDS'] = '0.1'
+
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+        finally:
+            del os.environ['CRON_QUEUE_BACKEND']
+            del os.environ['CRON_QUEUE_POLL_IN_SECONDS']
+
+        result = APIMonitorResult.objects.all()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].success, True)
+        self.assertEqual(CronWorkItem.objects.count(), 0)
+
+class CronCheckpointTest(TransactionTestCase):
+    local_timezone = pytz.timezone(settings.TIME_ZONE)
+    mock_current_time = local_timezone.localize(datetime(2022,9,20,10))
+
+    def setUp(self):
+        timezone.now = lambda: self.mock_current_time
+        timezone.localtime = lambda: self.mock_current_time
+        os.environ['CRON_INTERVAL_IN_SECONDS'] = '2'
+
+        self.team = Team.objects.create(name='test team')
+        self.monitor = APIMonitor.objects.create(
+            team=self.team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='1MIN',
+            body_type='EMPTY',
+        )
+
+    def call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command("run_cron", *args, stdout=out, stderr=StringIO(), **kwargs)
+        return out.getvalue()
+
+    def test_when_checkpoint_not_exists_then_load_return_none(self):
+        self.assertEqual(load_checkpoint(), None)
+
+    def test_when_checkpoint_saved_then_load_same_state(self):
+        next_run = self.mock_current_time + timedelta(minutes=1)
+        save_checkpoint({self.monitor.id: (self.mock_current_time, next_run)}, [self.monitor.id])
+
+        schedule_state, pending_monitor_ids = load_checkpoint()
+        self.assertEqual(schedule_state, {self.monitor.id: (self.mock_current_time, next_run)})
+        self.assertEqual(pending_monitor_ids, [self.monitor.id])
+        self.assertEqual(CronCheckpoint.objects.count(), 1)
+
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("requests.get", mocked_request_get)
+    def test_when_cron_stopped_then_save_checkpoint(self, *args):
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+
+        schedule_state, pending_monitor_ids = load_checkpoint()
+        self.assertEqual(schedule_state, {
+            self.monitor.id: (self.mock_current_time, self.monitor.get_next_run_at(self.mock_current_time)),
+        })
+        self.assertEqual(pending_monitor_ids, [])
+
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("requests.get", mocked_request_get)
+    def test_when_checkpoint_exists_then_restore_next_run_at(self, *args):
+        next_run = self.mock_current_time + timedelta(seconds=30)
+        save_checkpoint({self.monitor.id: (self.mock_current_time - timedelta(seconds=30), next_run)}, [])
+
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+
+        self.monitor.refresh_from_db()
+        self.assertEqual(self.monitor.next_run_at, next_run)
+        self.assertEqual(APIMonitorResult.objects.count(), 0)
+
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("requests.get", mocked_request_get)
+    def test_when_checkpoint_have_pending_monitor_then_run_on_start(self, *args):
+        next_run = self.mock_current_time + timedelta(seconds=30)
+        self.monitor.next_run_at = next_run
+        self.monitor.save()
+        save_checkpoint({}, [self.monitor.id])
+
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+
+        self.assertEqual(APIMonitorResult.objects.count(), 1)
+        self.assertEqual(load_checkpoint()[1], [])
+
+    def test_when_shutdown_timeout_reached_then_return_queued_monitor(self):
+        command = Command()
+        command.q.put(self.monitor.id)
+
+        self.assertEqual(command.drain_queue(0), [self.monitor.id])
+        self.assertEqual(command.q.unfinished_tasks, 0)
+
+
+class CronAsyncManagementCommand(TransactionTestCase):
+    local_timezone = pytz.timezone(settings.TIME_ZONE)
+    mock_current_time = local_timezone.localize(datetime(2022,9,20,10))
+
+    def setUp(self):
+        timezone.now = lambda: self.mock_current_time
+        timezone.localtime = lambda: self.mock_current_time
+        os.environ['CRON_INTERVAL_IN_SECONDS'] = '2'
+        os.environ['CRON_ASYNC_MODE'] = 'True'
+
+    def tearDown(self):
+        del os.environ['CRON_ASYNC_MODE']
+
+    def call_command(self, *args, **kwargs):
+        out = StringIO()
+        call_command("run_cron", *args, stdout=out, stderr=StringIO(), **kwargs)
+        return out.getvalue()
+
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("aiohttp.ClientSession.request", mocked_async_request)
+    def test_when_async_mode_then_run_test(self, *args):
+        team = Team.objects.create(name='test team')
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='POST',
+            url='https://monapi.xyz',
+            schedule='60MIN',
+            body_type='FORM',
+        )
+
+        APIMonitorBodyForm.objects.create(
+            monitor=monitor,
+            key='form key',
+            value='form value',
+        )
+
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+
+        result = APIMonitorResult.objects.all()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].success, True)
+        self.assertEqual(result[0].status_code, 200)
+        self.assertEqual(result[0].get_log_response(), "{\"key\": \"value\"}")
+        self.assertEqual(result[0].log_error, '')
+
+    @override_settings(HTTP_POOL_MAXSIZE=4)
+    def test_when_async_worker_then_reused_connections_limited_per_host(self):
+        command = Command()
+        command.q = DispatchQueue()
+        command.q.close()
+        connectors = []
+        create_async_session = command.create_async_session
+        def record_connector(connector, trace_configs):
+            connectors.append(connector)
+            return create_async_session(connector, trace_configs)
+        command.create_async_session = record_connector
+
+        command.run_async_worker(10)
+
+        cold_connector, reuse_connector = connectors
+        self.assertEqual(cold_connector.limit_per_host, 0)
+        self.assertEqual(reuse_connector.limit_per_host, 4)
+        self.assertEqual(reuse_connector.limit, 10)
+
+    def test_when_probe_set_cookie_then_next_probe_not_send_it(self):
+        async def set_cookie(request):
+            response = web.Response(text='ok')
+            response.set_cookie('session', 'teamA-secret')
+            return response
+
+        async def echo_cookie(request):
+            return web.Response(text=request.headers.get('Cookie', ''))
+
+        async def run():
+            app = web.Application()
+            app.router.add_get('/set', set_cookie)
+            app.router.add_get('/echo', echo_cookie)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, 'localhost', 0).start()
+            port = runner.addresses[0][1]
+            try:
+                async with Command().create_async_session(aiohttp.TCPConnector(), []) as session:
+                    async with session.get(f'http://localhost:{port}/set') as resp:
+                        await resp.read()
+                    async with session.get(f'http://localhost:{port}/echo') as resp:
+                        return await resp.text()
+            finally:
+                await runner.cleanup()
+
+        self.assertEqual(asyncio.run(run()), '')
+
+    def test_when_request_sent_then_same_body_headers_as_thread_mode(self):
+        received_headers = []
+
+        async def record_headers(request):
+            await request.read()
+            received_headers.append({key: request.headers.get(key) for key in ['Content-Type', 'Content-Length']})
+            return web.Response(text='ok')
+
+        async def run(monitor, request):
+            app = web.Application()
+            app.router.add_post('/', record_headers)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, 'localhost', 0).start()
+            monitor.url = f'http://localhost:{runner.addresses[0][1]}/'
+            command = Command()
+            try:
+                response = await asyncio.get_running_loop().run_in_executor(None, command.send_api_monitor_request, monitor, request)
+                response.close()
+                async with command.create_async_session(aiohttp.TCPConnector(), []) as session:
+                    await command.async_send_api_monitor_request({'cold': session}, monitor, request, None)
+            finally:
+                await runner.cleanup()
+
+        monitor = MagicMock(method='POST', is_reuse_connection=False)
+        for request in [
+            {'headers': {}, 'body': '{"key": "value"}', 'params': {}},
+            {'headers': {'content-type': 'application/json'}, 'body': '{"key": "value"}', 'params': {}},
+            {'headers': {}, 'body': {'key': 'value'}, 'params': {}},
+            {'headers': {}, 'body': {}, 'params': {}},
+            {'headers': {}, 'body': None, 'params': {}},
+        ]:
+            received_headers.clear()
+            asyncio.run(run(monitor, request))
+            self.assertEqual(received_headers[0], received_headers[1], request)
+
+    @skipUnless(shutil.which('openssl'), 'openssl is required to create test certificate')
+    def test_when_https_connection_created_then_measure_tls_handshake(self):
+        async def hello(request):
+            return web.Response(text='ok')
+
+        with tempfile.TemporaryDirectory() as cert_dir:
+            cert_file, key_file = os.path.join(cert_dir, 'cert.pem'), os.path.join(cert_dir, 'key.pem')
+            subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-subj', '/CN=localhost',
+                            '-keyout', key_file, '-out', cert_file, '-days', '1'], check=True, capture_output=True)
+            server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            server_context.load_cert_chain(cert_file, key_file)
+            client_context = ssl.create_default_context(cafile=cert_file)
+
+            async def run():
+                app = web.Application()
+                app.router.add_get('/', hello)
+                runner = web.AppRunner(app)
+                await runner.setup()
+                await web.TCPSite(runner, '127.0.0.1', 0, ssl_context=server_context).start()
+                port = runner.addresses[0][1]
+                timings = []
+                connector = TimingTCPConnector(ssl=client_context)
+                try:
+                    async with Command().create_async_session(connector, [Command().create_trace_config()]) as session:
+                        for _ in range(2):
+                            events = {}
+                            async with session.get(f'https://localhost:{port}/', trace_request_ctx=events) as resp:
+                                await resp.read()
+                            timings.append(Command().get_trace_timing(events, time.perf_counter()))
+                finally:
+                    await runner.cleanup()
+                return timings
+
+            new_timing, reused_timing = asyncio.run(run())
+
+        self.assertGreater(new_timing['tls_time'], 0)
+        self.assertGreaterEqual(new_timing['connect_time'], 0)
+        self.assertNotIn('tls_time', reused_timing)
+        self.assertNotIn('connect_time', reused_timing)
+
+    @skipUnless(shutil.which('openssl'), 'openssl is required to create test certificate')
+    def test_when_thread_mode_request_sent_then_measure_connection_phases(self):
+        class HelloHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+            def log_message(self, *args):
+                pass
+
+        with tempfile.TemporaryDirectory() as cert_dir:
+            cert_file, key_file = os.path.join(cert_dir, 'cert.pem'), os.path.join(cert_dir, 'key.pem')
+            subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-subj', '/CN=localhost',
+                            '-keyout', key_file, '-out', cert_file, '-days', '1'], check=True, capture_output=True)
+            server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            server_context.load_cert_chain(cert_file, key_file)
+
+            servers = {'http': ThreadingHTTPServer(('127.0.0.1', 0), HelloHandler), 'https': ThreadingHTTPServer(('127.0.0.1', 0), HelloHandler)}
+            servers['https'].socket = server_context.wrap_socket(servers['https'].socket, server_side=True)
+            for server in servers.values():
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+
+            timings = {}
+            try:
+                with patch.dict(urllib3.poolmanager.pool_classes_by_scheme), requests.Session() as session:
+                    install_timing_connections()
+                    for scheme, server in servers.items():
+                        for name in ['new', 'reused']:
+                            events = start_request_timing()
+                            session.get(f'{scheme}://localhost:{server.server_address[1]}/', verify=cert_file).close()
+                            stop_request_timing()
+                            timings[(scheme, name)] = events
+                    events = start_request_timing()
+                    stop_request_timing()
+                    requests.get(f'http://localhost:{servers["http"].server_address[1]}/')
+            finally:
+                for server in servers.values():
+                    server.shutdown()
+                    server.server_close()
+
+        self.assertEqual(set(timings[('http', 'new')].keys()), {'dns_time', 'connect_time', 'first_byte_time'})
+        self.assertEqual(set(timings[('https', 'new')].keys()), {'dns_time', 'connect_time', 'tls_time', 'first_byte_time'})
+        self.assertGreater(timings[('https', 'new')]['tls_time'], 0)
+        self.assertEqual(set(timings[('http', 'reused')].keys()), {'first_byte_time'})
+        self.assertEqual(set(timings[('https', 'reused')].keys()), {'first_byte_time'})
+        # Thread not measuring its request record nothing
+        self.assertEqual(events, {})
+
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("aiohttp.ClientSession.request", mocked_async_request)
+    def test_when_async_mode_with_previous_step_then_use_previous_result(self, *args):
+        team = Team.objects.create(name='test team')
+        monitor_prev = APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapitestprev.xyz',
+            schedule='60MIN',
+            body_type='EMPTY',
+        )
+
+        APIMonitorResult.objects.create(
+            monitor=monitor_prev,
+            execution_time=self.mock_current_time,
+            response_time=10,
+            success=True,
+            status_code=200,
+            log_response='resp',
+            log_error='',
+        )
+
+        monitor = APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='60MIN',
+            body_type='EMPTY',
+            previous_step=monitor_prev,
+        )
+
+        APIMonitorQueryParam.objects.create(
+            monitor=monitor,
+            key='query key',
+            value='{{testing}}',
+        )
+
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+
+        result = APIMonitorResult.objects.filter(monitor=monitor)
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].success, True)
+        self.assertEqual(result[0].status_code, 201)
+        self.assertEqual(result[0].get_log_response(), '{"chain": "ok"}')
+
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("aiohttp.ClientSession.request", mocked_async_request)
+    def test_when_async_mode_assertion_failed_then_error(self, *args):
+        team = Team.objects.create(name='test team')
+        APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='60MIN',
+            body_type='EMPTY',
+            assertion_type='JSON',
+            assertion_value='{"key": "other value"}',
+        )
+
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+
+        result = APIMonitorResult.objects.all()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].success, False)
+        self.assertEqual(result[0].log_error, 'Different value detected on root[\'key\'], expected "other value" but found "value"')
+
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("aiohttp.ClientSession.request", mocked_async_request_exception)
+    def test_when_async_mode_request_timeout_then_log_exception(self, *args):
+        team = Team.objects.create(name='test team')
+        APIMonitor.objects.create(
+            team=team,
+            name='apimonitor',
+            method='GET',
+            url='https://monapi.xyz',
+            schedule='60MIN',
+            body_type='EMPTY',
+        )
+
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+
+        result = APIMonitorResult.objects.all()
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].success, False)
+        self.assertEqual(result[0].status_code, -1)
+        self.assertEqual(result[0].log_error, 'Request timed out.')
+
+    @patch("cron.management.commands.run_cron.mock_cron_interrupt", side_effect=InterruptedError)
+    @patch("aiohttp.ClientSession.request", mocked_async_request)
+    def test_when_async_mode_host_concurrency_limited_then_monitor_run_later(self, *args):
+        os.environ['CRON_HOST_MAX_CONCURRENCY'] = '1'
+        team = Team.objects.create(name='test team')
+        for _ in range(3):
+            APIMonitor.objects.create(
+                team=team,
+                name='apimonitor',
+                method='GET',
+                url='https://monapi.xyz',
+                schedule='60MIN',
+                body_type='EMPTY',
+            )
+
+        try:
+            self.call_command()
+        except InterruptedError:
+            pass
+        finally:
+            del os.environ['CRON_HOST_MAX_CONCURRENCY']
+
+        self.assertEqual(APIMonitorResult.objects.count(), 3)
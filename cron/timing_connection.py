@@ -0,0 +1,96 @@
+import socket
+import threading
+import time
+
+from urllib3 import poolmanager
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+# Phase timing of request sent by current thread in miliseconds, None when thread is not measuring.
+# requests only tell when response headers received, so phases are recorded by urllib3 connection.
+request_timing = threading.local()
+
+
+def start_request_timing():
+    request_timing.events = {}
+    return request_timing.events
+
+
+def stop_request_timing():
+    request_timing.events = None
+
+
+def record_request_timing(name, value):
+    events = getattr(request_timing, 'events', None)
+    if events != None:
+        events[name] = value
+
+
+# DNS is resolved before opening connection to measure resolution and TCP connection on their own,
+# each resolved address is tried like urllib3 does
+class TimingConnectionMixin:
+    def _new_conn(self):
+        start = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(self._dns_host.strip('[]'), self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except (socket.error, UnicodeError):
+            # urllib3 raise its own error for host which cannot be resolved
+            return super()._new_conn()
+        if len(addresses) == 0:
+            return super()._new_conn()
+
+        resolved = time.perf_counter()
+        dns_host = self._dns_host
+        try:
+            for idx, address in enumerate(addresses):
+                self._dns_host = address[4][0]
+                try:
+                    conn = super()._new_conn()
+                    break
+                except (NewConnectionError, ConnectTimeoutError):
+                    if idx == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = dns_host
+
+        self.connected_at = time.perf_counter()
+        record_request_timing('dns_time', (resolved - start) * 1000)
+        record_request_timing('connect_time', (self.connected_at - resolved) * 1000)
+        return conn
+
+    # Response headers are read after whole request sent
+    def getresponse(self, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().getresponse(*args, **kwargs)
+        record_request_timing('first_byte_time', (time.perf_counter() - start) * 1000)
+        return response
+
+
+class TimingHTTPConnection(TimingConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimingHTTPSConnection(TimingConnectionMixin, HTTPSConnection):
+    # Handshake is the rest of connect after TCP connection opened
+    def connect(self):
+        self.connected_at = None
+        super().connect()
+        if self.connected_at != None:
+            record_request_timing('tls_time', (time.perf_counter() - self.connected_at) * 1000)
+
+
+class TimingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimingHTTPConnection
+
+
+class TimingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimingHTTPSConnection
+
+
+# Every urllib3 pool manager, including ones created by requests, share pool classes of the module.
+# Connections only record timing on thread measuring its request, so other requests are unaffected.
+def install_timing_connections():
+    poolmanager.pool_classes_by_scheme['http'] = TimingHTTPConnectionPool
+    poolmanager.pool_classes_by_scheme['https'] = TimingHTTPSConnectionPool
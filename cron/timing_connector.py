@@ -0,0 +1,50 @@
+import asyncio
+import contextvars
+import socket
+import time
+
+import aiohttp
+
+
+# Handshake time of connection created by current task, connection is created on the task sending request
+# between connection create start and end trace events
+tls_time_var = contextvars.ContextVar('tls_time', default=None)
+
+
+# aiohttp trace only tell when whole connection created, so TCP connection of HTTPS request is opened
+# before TLS handshake to measure the handshake on its own
+class TimingTCPConnector(aiohttp.TCPConnector):
+    async def _wrap_create_connection(self, *args, req, timeout, client_error=aiohttp.ClientConnectorError, **kwargs):
+        sslcontext = kwargs.get('ssl')
+        if not sslcontext:
+            return await super()._wrap_create_connection(*args, req=req, timeout=timeout, client_error=client_error, **kwargs)
+
+        protocol_factory, host, port = args
+        sock = socket.socket(kwargs['family'], socket.SOCK_STREAM, kwargs['proto'])
+        try:
+            sock.setblocking(False)
+            if kwargs.get('local_addr') != None:
+                sock.bind(kwargs['local_addr'])
+            try:
+                await asyncio.wait_for(asyncio.get_running_loop().sock_connect(sock, (host, port)), timeout.sock_connect)
+            except OSError as exc:
+                if exc.errno == None and isinstance(exc, asyncio.TimeoutError):
+                    raise
+                raise client_error(req.connection_key, exc) from exc
+
+            start = time.perf_counter()
+            transport, protocol = await super()._wrap_create_connection(
+                protocol_factory,
+                req=req,
+                timeout=timeout,
+                client_error=client_error,
+                sock=sock,
+                ssl=sslcontext,
+                server_hostname=kwargs['server_hostname'],
+            )
+        except BaseException:
+            sock.close()
+            raise
+        tls_time_var.set((time.perf_counter() - start) * 1000)
+        return transport, protocol
+
@@ -0,0 +1,140 @@
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from apimonitor.models import APIMonitor, APIMonitorResult
+from cron.models import CronWorkItem
+
+BATCH_SIZE = 500
+
+
+def get_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+# Postgres support SELECT ... FOR UPDATE SKIP LOCKED, other database (SQLite) fallback to compare and swap update
+def is_skip_locked_supported():
+    return connection.features.has_select_for_update_skip_locked
+
+
+def get_due_monitors(last_run):
+    return APIMonitor.objects.filter(Q(next_run_at=None) | Q(next_run_at__lte=last_run))
+
+
+# Earliest next run time of all monitors, used by scheduler to wake up on the next monitor phase
+def get_next_due_at():
+    return APIMonitor.objects.aggregate(next_due_at=Min('next_run_at'))['next_due_at']
+
+
+# Move next run time of monitors to their next phase slot, return updated monitors
+def update_next_run_at(monitor_schedules, last_run):
+    monitors = []
+    for monitor_id, schedule in monitor_schedules:
+        monitor = APIMonitor(id=monitor_id, schedule=schedule)
+        monitor.next_run_at = monitor.get_next_run_at(last_run)
+        monitors.append(monitor)
+
+    APIMonitor.objects.bulk_update(monitors, ['next_run_at'], batch_size=BATCH_SIZE)
+    return monitors
+
+
+# Monitors never scheduled by cron continue from their last result using single grouped query
+def fill_next_run_at_from_last_result():
+    last_results = APIMonitorResult.objects \
+        .filter(monitor__next_run_at=None) \
+        .values('monitor_id', 'monitor__schedule') \
+        .annotate(last_execution_time=Max('execution_time'))
+
+    monitors = []
+    for last_result in last_results:
+        monitor = APIMonitor(id=last_result['monitor_id'], schedule=last_result['monitor__schedule'])
+        monitor.next_run_at = monitor.get_next_run_at(last_result['last_execution_time'])
+        monitors.append(monitor)
+
+    APIMonitor.objects.bulk_update(monitors, ['next_run_at'], batch_size=BATCH_SIZE)
+
+
+# Pick monitors with next run time already passed and move their next run time forward,
+# return list of (monitor id, due time, next run time, config version)
+def schedule_due_monitors(last_run):
+    monitor_schedules = []
+    due_monitors = {}
+    for monitor_id, schedule, due_at, config_version in get_due_monitors(last_run).values_list('id', 'schedule', 'next_run_at', 'config_version'):
+        monitor_schedules.append((monitor_id, schedule))
+        due_monitors[monitor_id] = (due_at if due_at != None else last_run, config_version)
+
+    monitors = update_next_run_at(monitor_schedules, last_run)
+    return [(monitor.id, due_monitors[monitor.id][0], monitor.next_run_at, due_monitors[monitor.id][1]) for monitor in monitors]
+
+
+def get_config_versions(monitor_ids):
+    return dict(APIMonitor.objects.filter(id__in=monitor_ids).values_list('id', 'config_version'))
+
+
+# Same as schedule_due_monitors but safe to run from multiple cron process at once,
+# due monitors are stored as work item on database instead of returned to caller
+def enqueue_due_monitors(last_run):
+    monitor_ids = []
+    with transaction.atomic():
+        if is_skip_locked_supported():
+            # Rows locked by other scheduler are skipped, they will be already moved forward when lock released
+            due_monitors = list(get_due_monitors(last_run).select_for_update(skip_locked=True).values_list('id', 'schedule'))
+            monitor_ids = [monitor_id for monitor_id, _ in due_monitors]
+            update_next_run_at(due_monitors, last_run)
+        else:
+            for monitor_id, schedule, next_run_at in get_due_monitors(last_run).values_list('id', 'schedule', 'next_run_at'):
+                # Nothing updated means other scheduler already moved next run time of this monitor
+                monitor = APIMonitor(id=monitor_id, schedule=schedule)
+                updated = APIMonitor.objects \
+                    .filter(id=monitor_id, next_run_at=next_run_at) \
+                    .update(next_run_at=monitor.get_next_run_at(last_run))
+                if updated == 1:
+                    monitor_ids.append(monitor_id)
+
+        # Monitor which still have pending work item is not queued twice
+        CronWorkItem.objects.bulk_create([
+            CronWorkItem(monitor_id=monitor_id, scheduled_at=last_run) for monitor_id in monitor_ids
+        ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return monitor_ids
+
+
+# Lease up to limit work items which are not leased yet or have expired lease (crashed worker)
+def claim_work_items(worker_id, limit, lease_in_seconds):
+    now = timezone.now()
+    lease_expires_at = now + timedelta(seconds=lease_in_seconds)
+    claimable_items = CronWorkItem.objects \
+        .filter(Q(lease_expires_at=None) | Q(lease_expires_at__lt=now)) \
+        .order_by('scheduled_at')
+
+    if is_skip_locked_supported():
+        with transaction.atomic():
+            items = list(claimable_items.select_for_update(skip_locked=True).values_list('id', 'monitor_id')[:limit])
+            CronWorkItem.objects \
+                .filter(id__in=[item_id for item_id, _ in items]) \
+                .update(leased_by=worker_id, lease_expires_at=lease_expires_at)
+        return [monitor_id for _, monitor_id in items]
+
+    monitor_ids = []
+    for item_id, monitor_id, old_lease_expires_at in claimable_items.values_list('id', 'monitor_id', 'lease_expires_at')[:limit]:
+        # Nothing updated means other worker leased this item first
+        updated = CronWorkItem.objects \
+            .filter(id=item_id, lease_expires_at=old_lease_expires_at) \
+            .update(leased_by=worker_id, lease_expires_at=lease_expires_at)
+        if updated == 1:
+            monitor_ids.append(monitor_id)
+    return monitor_ids
+
+
+# Lease might be expired and taken by other worker, in that case the item belong to that worker
+def complete_work_item(worker_id, monitor_id):
+    CronWorkItem.objects.filter(monitor_id=monitor_id, leased_by=worker_id).delete()
+
+
+# Return leased but unprocessed work items so other worker can pick them immediately
+def release_work_items(worker_id):
+    CronWorkItem.objects.filter(leased_by=worker_id).update(leased_by="", lease_expires_at=None)
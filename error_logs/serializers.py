@@ -5,6 +5,7 @@ from apimonitor.serializers import APIMonitorSerializer
 
 class ErrorLogsSerializer(serializers.ModelSerializer):
   monitor = APIMonitorSerializer()
+  log_response = serializers.CharField(source='get_log_response', read_only=True)
   
   class Meta:
       model = APIMonitorResult
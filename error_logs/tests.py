@@ -102,6 +102,9 @@ class ListErrorLogs(APITestCase):
             "assertion_type": "DISABLED",
             "assertion_value": "",
             "is_assert_json_schema_only": False,
+            "is_reuse_connection": False,
+            "result_cache_ttl": 0,
+            "max_body_size": 0,
             "exclude_keys": [],
             "status_page_category_id": None,
         },
@@ -129,6 +132,9 @@ class ListErrorLogs(APITestCase):
               "assertion_type": "DISABLED",
               "assertion_value": "",
               "is_assert_json_schema_only": False,
+              "is_reuse_connection": False,
+              "result_cache_ttl": 0,
+              "max_body_size": 0,
               "exclude_keys": [],
               "status_page_category_id": None,
           },
@@ -202,6 +208,9 @@ class ListErrorLogs(APITestCase):
             "assertion_type": "DISABLED",
             "assertion_value": "",
             "is_assert_json_schema_only": False,
+            "is_reuse_connection": False,
+            "result_cache_ttl": 0,
+            "max_body_size": 0,
             "exclude_keys": [],
             "status_page_category_id": None,
         },
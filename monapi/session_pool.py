@@ -0,0 +1,71 @@
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from monapi.utils import get_origin
+
+
+# Keep alive requests session for each target host shared by every thread,
+# session not used longer than idle timeout is closed together with its connections
+class SessionPool:
+    def __init__(self, pool_maxsize, idle_timeout):
+        self.pool_maxsize = pool_maxsize
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.last_used = {}
+        self.in_use = {}
+        self.mutex = threading.Lock()
+
+    def create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        # Cookie from one monitor must not be sent by other monitor on the same host
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    def evict_idle_locked(self, now):
+        for origin in list(self.sessions.keys()):
+            if self.in_use[origin] == 0 and now - self.last_used[origin] > self.idle_timeout:
+                self.sessions.pop(origin).close()
+                del self.last_used[origin]
+                del self.in_use[origin]
+
+    def acquire(self, origin):
+        with self.mutex:
+            self.evict_idle_locked(time.monotonic())
+            if origin not in self.sessions:
+                self.sessions[origin] = self.create_session()
+                self.in_use[origin] = 0
+            self.in_use[origin] += 1
+            return self.sessions[origin]
+
+    def release(self, origin):
+        with self.mutex:
+            self.in_use[origin] -= 1
+            self.last_used[origin] = time.monotonic()
+
+    def request(self, method, url, **kwargs):
+        origin = get_origin(url)
+        session = self.acquire(origin)
+        try:
+            return session.request(method, url, **kwargs)
+        finally:
+            self.release(origin)
+
+    def close(self):
+        with self.mutex:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+            self.last_used = {}
+            self.in_use = {}
+
+
+session_pool = SessionPool(settings.HTTP_POOL_MAXSIZE, settings.HTTP_POOL_IDLE_TIMEOUT_IN_SECONDS)
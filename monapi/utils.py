@@ -1,5 +1,13 @@
+from urllib.parse import urlparse
+
+
 def try_parse_int(string):
     try:
         return int(string)
     except ValueError:
-        return False
\ No newline at end of file
+        return False
+
+
+def get_origin(url):
+    parsed_url = urlparse(url)
+    return f"{parsed_url.scheme}://{parsed_url.netloc}".lower()
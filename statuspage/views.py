@@ -1,11 +1,10 @@
 from datetime import timedelta
-from django.db.models import Count, Q
 from django.utils import timezone
 from rest_framework import views, status, viewsets, mixins
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from apimonitor.models import APIMonitorResult
+from apimonitor.models import APIMonitorResultRollup, get_rollup_summary
 from statuspage.models import StatusPageConfiguration, StatusPageCategory
 from statuspage.serializers import StatusPageConfgurationSerializers, StatusPageCategorySerializers, StatusPageDashboardSerializers
 
@@ -69,10 +68,9 @@ class StatusPageDashboardViewSet(mixins.ListModelMixin, viewsets.GenericViewSet)
 
         for category in queryset:
             success_rate_category = []
-            api_monitor_result_count = APIMonitorResult.objects \
-                .filter(monitor__status_page_category=category).count()
+            category_rollups = APIMonitorResultRollup.objects.filter(monitor__status_page_category=category)
 
-            if api_monitor_result_count == 0:
+            if not category_rollups.exists():
                 category.success_rate_category = success_rate_category
                 continue
             
@@ -83,21 +81,13 @@ class StatusPageDashboardViewSet(mixins.ListModelMixin, viewsets.GenericViewSet)
                 end_time = last_24_hour + timedelta(hours=1)
                 
                 # Average success rate
-                success_count = APIMonitorResult.objects.filter(
-                    monitor__status_page_category=category, 
-                    execution_time__gte=start_time, 
-                    execution_time__lte=end_time
-                ).aggregate(
-                    s=Count('success', filter=Q(success=True)), 
-                    f=Count('success', filter=Q(success=False)),
-                    total=Count('pk'),
-                )
+                summary = get_rollup_summary(category_rollups, start_time, end_time)
 
                 success_rate_category.append({
                     "start_time": start_time,
                     "end_time" : end_time,
-                    "success": success_count['s'],
-                    "failed" : success_count['f']
+                    "success": summary['success'],
+                    "failed" : summary['failed']
                 })
 
                 last_24_hour += timedelta(hours=1)